@@ -0,0 +1,24 @@
+#!/bin/bash
+# Runs the trainer and 3 evaluators in a single job, so they are all on the same node.
+# They pass the checkpoints through the evaluation queue (an SQLite file in the experiment dir), which needs working file locks.
+# These are not reliable on the network filesystem, so the processes must not be spread over several nodes.
+
+#SBATCH -c 10
+#SBATCH --mem 27GB
+#SBATCH --gres=gpu:1
+
+export OPENBLAS_NUM_THREADS=1 OMP_NUM_THREADS=1
+RUN="singularity exec --nv _cluster_runner/sng-alphasheep.img python3 -u"
+
+eval_pids=()
+for i in 1 2 3; do
+    $RUN eval_rl_agent.py --config="$1" --loop &
+    eval_pids+=($!)
+done
+
+$RUN train_rl_agent.py --config="$1"
+
+# Training is done, stop the evaluators. Checkpoints that are left in the queue can be evaluated later with
+# eval_rl_agent.py (without --loop), once their leases have expired.
+kill "${eval_pids[@]}"
+wait
@@ -0,0 +1,188 @@
+"""
+Training with an actor-learner split, so that training can use multiple cores.
+
+- Multiple actor processes simulate games (each with a BatchGameEnv), using a DQNAgent with actor_only=True.
+  Their experiences go directly into a replay buffer in shared memory.
+- The learner (the main process) samples minibatches from that buffer and trains the network. From time to time,
+  it publishes the new weights via shared memory, and the actors pick them up before their next batch of games.
+
+The actors don't need TensorFlow, they play with a NumPy copy of the network.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+from queue import Empty
+from time import sleep
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from agents.reinforcment_learning.dqn_agent import DQNAgent
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from agents.reinforcment_learning.replay_buffer import ReplayBuffer
+from agents.reinforcment_learning.shared_weights import SharedWeights
+from simulator.controller.batch_game_env import BatchGameEnv
+from simulator.controller.dealing_behavior import DealWinnableHand
+from simulator.game_mode import GameMode
+from simulator.player_agent import PlayerAgent
+from utils.log_util import get_class_logger
+
+
+def run_batch_episodes(env: BatchGameEnv, learner: DQNAgent) -> List[bool]:
+    """
+    Plays one game at every table of the env, letting the learner decide for all tables at once.
+    :return: for every table, whether the learner won.
+    """
+
+    # The states are encoded into two preallocated buffers, which swap roles after every step.
+    # This is fine because the learner copies the states into its experience buffer.
+    observation = env.reset()
+    states = learner.encode_states(observation)
+    next_states = np.empty_like(states)
+    while True:
+        available_actions = observation["legal_actions"]
+        action_ids = learner.select_actions(states, available_actions)
+        observation, rewards, done, info = env.step(action_ids)
+        learner.encode_states(observation, out=next_states)
+        learner.receive_experiences(states, action_ids, rewards, next_states, done, available_actions)
+        if np.all(done):
+            return info["player_win"][:, env.learner_id].tolist()
+        states, next_states = next_states, states
+
+
+class ActorLearner:
+    """
+    Runs the actor processes, and trains the learner with their experiences (see module docstring).
+    """
+
+    def __init__(self, config: Dict, learner: DQNAgent, opponents: List[Optional[PlayerAgent]], game_mode: GameMode,
+                 n_actors: int, n_tables: int = 1):
+        """
+        Starts the actor processes. Call close() when done.
+        :param config: the experiment config (with an agent_config node for the DQNAgent).
+        :param learner: the DQNAgent that is trained (training=True). Its experience buffer is replaced by the shared one.
+        :param opponents: list(4) of agents, indexed by player id. The entry of the learner is ignored (see BatchGameEnv).
+        :param game_mode: the game mode that is played. The cards are dealt by DealWinnableHand.
+        :param n_actors: the number of actor processes.
+        :param n_tables: the number of parallel tables per actor.
+        """
+        self.logger = get_class_logger(self)
+        self._learner = learner
+        self._retrain_every_n = config["agent_config"]["dqn_agent"]["retrain_every"]
+        self._batch_size = config["agent_config"]["dqn_agent"]["batch_size"]
+        self._n_train_steps = 0
+
+        # Replay buffer in shared memory. All actors write to it, the learner samples from it (all with the same lock).
+        rb = learner.experience_buffer
+        self._replay_buffer_shm = shared_memory.SharedMemory(create=True, size=ReplayBuffer.n_bytes(rb.capacity, rb.state_size,
+                                                                                                   rb.action_size))
+        ctx = multiprocessing.get_context("spawn")
+        self._replay_buffer_lock = ctx.Lock()
+        learner.experience_buffer = ReplayBuffer(rb.capacity, rb.state_size, rb.action_size, buffer=self._replay_buffer_shm.buf,
+                                                 lock=self._replay_buffer_lock)
+
+        # Weights in shared memory, written by the learner and read by the actors.
+        network = NumpyMLP.from_keras(learner.q_network)
+        self._shared_weights = SharedWeights.create([kernel.shape for kernel, _ in network.layers])
+        self._shared_weights.publish(network)
+
+        # Rate limit: the actors wait while the learner is too far behind (see _run_actor()).
+        # Otherwise, most experiences would be overwritten before they are ever sampled.
+        self._n_train_steps_shared = ctx.Value("q", 0, lock=False)
+
+        # The actors report the results of their games through a queue.
+        self._results = ctx.Queue()
+        self._stop = ctx.Event()
+        self._actors = [ctx.Process(target=_run_actor, daemon=True,
+                                    args=(config, learner.player_id, opponents, game_mode, n_tables, self._replay_buffer_shm.name,
+                                          self._replay_buffer_lock, self._shared_weights.name, self._n_train_steps_shared,
+                                          self._results, self._stop))
+                        for _ in range(n_actors)]
+        self.logger.info(f"Starting {n_actors} actors with {n_tables} tables each.")
+        for actor in self._actors:
+            actor.start()
+
+    def run_episodes(self) -> List[bool]:
+        """
+        Trains the learner until the actors report finished games, then publishes the new weights.
+        The learner trains once per retrain_every experiences (same as the DQNAgent would do on its own).
+        :return: for every game that was finished, whether the learner won.
+        """
+
+        while True:
+            n_allowed_steps = (self._learner.experience_buffer.n_appended - self._batch_size) // self._retrain_every_n
+            trained = False
+            if self._n_train_steps < n_allowed_steps:
+                self._learner.train_step()
+                self._n_train_steps += 1
+                self._n_train_steps_shared.value = self._n_train_steps
+                trained = True
+
+            try:
+                # Nothing to train right now: wait a little for results.
+                won = self._results.get_nowait() if trained else self._results.get(timeout=0.01)
+            except Empty:
+                if not any(actor.is_alive() for actor in self._actors):
+                    raise RuntimeError("All actors have died.")
+                continue
+
+            # Episodes are over: sync the target network (as the DQNAgent does after every game) and send the weights to the actors.
+            self._learner.align_target_model()
+            self._shared_weights.publish(NumpyMLP.from_keras(self._learner.q_network))
+            while True:
+                try:
+                    won += self._results.get_nowait()
+                except Empty:
+                    return won
+
+    def close(self):
+        """ Stops the actors and frees the shared memory. """
+        # Actors can only exit when everything they have put into the queue was consumed, so keep draining it.
+        self._stop.set()
+        while any(actor.is_alive() for actor in self._actors):
+            try:
+                self._results.get(timeout=0.1)
+            except Empty:
+                pass
+        for actor in self._actors:
+            actor.join()
+
+        # The learner's experience buffer lives in the shared memory - give it a private copy.
+        rb = self._learner.experience_buffer
+        self._learner.experience_buffer = ReplayBuffer(rb.capacity, rb.state_size, rb.action_size,
+                                                       buffer=bytearray(self._replay_buffer_shm.buf))
+        del rb
+        self._replay_buffer_shm.close()
+        self._replay_buffer_shm.unlink()
+        self._shared_weights.close()
+        self._shared_weights.unlink()
+
+
+def _run_actor(config: Dict, player_id: int, opponents: List[Optional[PlayerAgent]], game_mode: GameMode, n_tables: int,
+               replay_buffer_name: str, replay_buffer_lock, shared_weights_name: str, n_train_steps, results, stop):
+    # Entry point of the actor processes: play games until told to stop.
+
+    agent = DQNAgent(player_id, config=config, training=True, actor_only=True)
+    rb = agent.experience_buffer
+    replay_buffer_shm = shared_memory.SharedMemory(name=replay_buffer_name)
+    agent.experience_buffer = ReplayBuffer(rb.capacity, rb.state_size, rb.action_size, buffer=replay_buffer_shm.buf,
+                                           lock=replay_buffer_lock)
+    shared_weights = SharedWeights.attach(shared_weights_name)
+    env = BatchGameEnv(n_tables, game_mode, opponents=opponents, learner_id=player_id, dealing_behavior=DealWinnableHand(game_mode))
+
+    # Don't play while more than half of the buffer has not been trained on yet (the learner trains once every retrain_every experiences).
+    dqn_config = config["agent_config"]["dqn_agent"]
+    max_untrained = rb.capacity // 2
+
+    version = 0
+    while not stop.is_set():
+        n_trained = dqn_config["batch_size"] + n_train_steps.value * dqn_config["retrain_every"]
+        if agent.experience_buffer.n_appended - n_trained > max_untrained:
+            sleep(0.001)
+            continue
+        # Pick up new weights, if available.
+        network, version = shared_weights.read(dtype=dqn_config.get("inference_dtype", "float32"), newer_than=version)
+        if network is not None:
+            agent.set_inference_network(network)
+
+        results.put(run_batch_episodes(env, agent))
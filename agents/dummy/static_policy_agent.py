@@ -14,6 +14,8 @@ class StaticPolicyAgent(PlayerAgent):
     This policy is extracted from one of those agents (more precisely: I copypasted the Q-vector from the log output).
     """
 
+    cacheable = True
+
     def __init__(self, player_id: int):
         super().__init__(player_id)
 
@@ -56,8 +58,9 @@ class StaticPolicyAgent(PlayerAgent):
     def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode):
         # Plays the first card from the static policy that is allowed.
 
+        valid_cards = game_mode.legal_moves(cards_in_hand, cards_in_trick)
         for card in self.static_policy:
-            if card in cards_in_hand and game_mode.is_play_allowed(card, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick):
+            if card in valid_cards:
                 return card
 
         raise ValueError("None of the Player's cards seem to be allowed! This should never happen! Player has cards: {}".format(
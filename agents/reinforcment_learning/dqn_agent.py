@@ -1,12 +1,14 @@
+import logging
+import os
+
 import numpy as np
-from collections import deque
 from typing import Iterable, List, Dict, Optional
 
 from overrides import overrides
-from tensorflow.keras import Sequential, Input
-from tensorflow.keras.layers import Dense
-from tensorflow.keras.optimizers import Adam
 
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from agents.reinforcment_learning.replay_buffer import ReplayBuffer
+from agents.reinforcment_learning.state_encoder import StateEncoder
 from simulator.player_agent import PlayerAgent
 from simulator.card_defs import Card, new_deck
 from simulator.game_mode import GameMode
@@ -18,13 +20,16 @@ class DQNAgent(PlayerAgent):
     A cookie-cutter DQN implementation without any sort of advanced techniques.
     """
 
-    def __init__(self, player_id: int, config: Dict, training: bool):
+    def __init__(self, player_id: int, config: Dict, training: bool, actor_only: bool = False):
         """
         Creates a new DQNAgent.
         :param player_id: The unique id of the player (0-3).
         :param config: config dict containing an agent_config node.
         :param training: If True, will train during play. This usually means worse performance (because of exploration).
                          If False, then the agent will always pick the highest-ranking valid action.
+        :param actor_only: Only with training=True. The agent explores and stores experiences, but doesn't train the network itself.
+                           Instead, a learner (in another process) trains and provides new weights via set_inference_network().
+                           See actor_learner.py. Like when not training, TensorFlow is not needed.
         """
         super().__init__(player_id)
         self.logger = get_class_logger(self)
@@ -32,19 +37,18 @@ class DQNAgent(PlayerAgent):
         config = config["agent_config"]["dqn_agent"]
         self.config = config
         self.training = training
+        self._actor_only = actor_only
+        if actor_only and not training:
+            raise ValueError("actor_only requires training=True.")
 
         # We encode cards as one-hot vectors of size 32.
         # Providing indices to perform quick lookups.
         self._id2card = new_deck()
         self._card2id = {card: i for i, card in enumerate(self._id2card)}
 
-        # Determine length of state vector.
-        state_lens = {
-            "cards_in_hand": 32,
-            "cards_in_trick": 3*32,
-            "cards_already_played": 32
-        }
-        self._state_size = sum(state_lens[x] for x in config["state_contents"])
+        # The state encoder keeps the state of the current game and updates it with every card that is played.
+        self._state_encoder = StateEncoder(config["state_contents"])
+        self._state_size = self._state_encoder.state_size
 
         # Action space: One action for every card.
         # Naturally, most actions will be invalid because the agent doesn't have the card or is not allowed to play it.
@@ -66,8 +70,12 @@ class DQNAgent(PlayerAgent):
         self._gamma = config["gamma"]
         self._epsilon = config["epsilon"]
 
+        # If True, use Double DQN targets: the Q network selects the best next action, and the target network evaluates it.
+        # This reduces the overestimation of Q values that comes from taking the max over noisy estimates.
+        self._double_dqn = config.get("double_dqn", False)
+
         # Experience replay buffer for minibatch learning
-        self.experience_buffer = deque(maxlen=config["experience_buffer_len"])
+        self.experience_buffer = ReplayBuffer(config["experience_buffer_len"], self._state_size, self._action_size)
 
         # Remember the state and action (card) played in the previous trick, so we can can judge it once we receive feedback.
         # Also remember which actions were valid at that time.
@@ -77,11 +85,21 @@ class DQNAgent(PlayerAgent):
         self._in_terminal_state = False
 
         # Create Q network (current state) and Target network (successor state). The networks are synced after every episode (game).
-        self.q_network = self._build_model()
-        self.target_network = self._build_model()
-        self._align_target_model()
+        # When not training, the Keras networks are only created if needed (see below), so TensorFlow is not even imported.
+        self.q_network = None
+        self.target_network = None
+        if self.training and not self._actor_only:
+            self.q_network = self._build_model()
+            self.target_network = self._build_model()
+            self.align_target_model()
         self._batch_size = config["batch_size"]
 
+        # When not training, the weights never change, so decisions are made with a NumPy copy of the Q network.
+        # For single states, this is many times faster than calling Keras. The copy is created whenever weights are loaded.
+        # Actors also play with a NumPy copy, which is replaced whenever the learner provides new weights.
+        self._inference_dtype = config.get("inference_dtype", "float32")
+        self._inference_network = None
+
         # Don't retrain after every single experience.
         # Retraining every time is expensive and doesn't add much information (rewards are received only at the end of the game).
         # If we wait for more experiences to accumulate before retraining, we get more fresh data before doing expensive training.
@@ -89,15 +107,21 @@ class DQNAgent(PlayerAgent):
         self._retrain_every_n = config["retrain_every"]
         self._experiences_since_last_retrain = 0
 
-        # Memory: here are some things the agent remembers between moves. This is basically feature engineering,
-        # it would be more interesting to have the agent learn these with an RNN or so!
-        self._mem_cards_already_played = set()
+        # If True, then every training step (target computation and gradient update) runs as a single compiled TensorFlow function,
+        # instead of separate predict_on_batch() and train_on_batch() calls. Same results, but much less overhead per step.
+        self._compiled_train_step = None
+        if self.training and not self._actor_only and config.get("compiled_train_step", False):
+            self._compiled_train_step = self._build_compiled_train_step()
 
         # For display in the GUI
         self._current_q_vals = None
 
     def _build_model(self):
         # Build the Q-network.
+        # TensorFlow is imported here (and not at the top), so agents that only play with exported weights don't need it.
+        from tensorflow.keras import Sequential, Input
+        from tensorflow.keras.layers import Dense
+        from tensorflow.keras.optimizers import Adam
 
         # Since our model is very small and only uses single batches, it's faster to disable eager execution.
         # See https://github.com/tensorflow/tensorflow/issues/33340
@@ -112,63 +136,71 @@ class DQNAgent(PlayerAgent):
         model.compile(loss='mse', optimizer=Adam(lr=self.config["lr"]))
         return model
 
-    def _align_target_model(self):
-        self.target_network.set_weights(self.q_network.get_weights())
+    def _build_compiled_train_step(self):
+        # Builds a tf.function that does the same as the training step in _receive_experience().
+        import tensorflow as tf
+
+        q_network = self.q_network
+        target_network = self.target_network
+        gamma = self._gamma
+        action_size = self._action_size
+        double_dqn = self._double_dqn
+        zero_q_for_invalid_actions = self._zero_q_for_invalid_actions
+
+        @tf.function
+        def train_step(state_batch, action_id_batch, reward_batch, next_state_batch, terminated_batch, available_actions_batch):
+            state_batch = tf.cast(state_batch, tf.float32)
+            next_state_batch = tf.cast(next_state_batch, tf.float32)
+
+            # Expected cumulative future reward (see _receive_experience()).
+            q_next = target_network(next_state_batch, training=False)
+            if double_dqn:
+                next_action_ids = tf.argmax(q_network(next_state_batch, training=False), axis=1)
+                v_next = tf.gather(q_next, next_action_ids, batch_dims=1)
+            else:
+                v_next = tf.reduce_max(q_next, axis=1)
+            cumul_reward = reward_batch + gamma * v_next * (1. - tf.cast(terminated_batch, tf.float32))
 
-    def _encode_state(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> np.ndarray:
-        # A state contains:
-        # - Cards that the player has in hand (unordered, directly observed)
-        # - Cards that are in the current trick (ordered, directly observed)
-        # - All cards that have been played so far (unordered, engineered feature)
-        #
-        # Future possibilities for features:
-        # - Number of the current trick: not necessary, can be implied from len of cards_in_hand
-        # - Mapping player IDs to cards to GameMode (knowing who is declaring, and then knowing THEY played a specific card)
-        #   - Partially contained in the order of cards_in_trick, but needs initial info about player IDs
-        # - LSTM based memory of played cards, perhaps together with player IDs
-        # - Player scores, or actually a memory of all cards in all previous tricks, mapped to player IDs
-
-        assert len(self._mem_cards_already_played) == 4 * (8-len(list(cards_in_hand)))
-
-        state = np.zeros(shape=self._state_size, dtype=np.int32)
-        offset = 0
-
-        for comp in self.config["state_contents"]:
-            if comp == "cards_in_hand":
-                # 32 bools: cards in own hand (order does not matter)
-                for card in cards_in_hand:
-                    state[offset + self._card2id[card]] = 1
-                offset += 32
-
-            elif comp == "cards_in_trick":
-                # 3x32 bools: cards in current trick before the one to be played by the agent (order is important)
-                for i, card in enumerate(cards_in_trick):
-                    state[offset + i * 32 + self._card2id[card]] = 1
-                offset += 3*32
-
-            elif comp == "cards_already_played":
-                # 1x32 bools: cards that have already been played.
-                # This is an engineered feature which could also be learned by the agent if it had some memory.
-                for card in self._mem_cards_already_played:
-                    state[offset + self._card2id[card]] = 1
-                offset += 32
+            with tf.GradientTape() as tape:
+                q_curr = q_network(state_batch, training=True)
 
-            else:
-                raise ValueError(r'Unknown state component name: "{x}"')
+                # Update the Q-value for the actions that were experienced. Leave the rest the same (no gradient).
+                q_target = tf.stop_gradient(q_curr)
+                if zero_q_for_invalid_actions:
+                    q_target *= tf.cast(available_actions_batch, tf.float32)
+                q_target = tf.where(tf.one_hot(action_id_batch, action_size, on_value=True, off_value=False),
+                                    cumul_reward[:, tf.newaxis], q_target)
+                loss = tf.reduce_mean(tf.square(q_target - q_curr))
 
-        assert offset == self._state_size
-        return state
+            gradients = tape.gradient(loss, q_network.trainable_variables)
+            q_network.optimizer.apply_gradients(zip(gradients, q_network.trainable_variables))
+            return loss
 
-    def _encode_action(self, card: Card):
-        action = np.zeros(self._action_size, dtype=np.int32)
-        action[self._card2id[card]] = 1
-        return action
+        return train_step
 
-    def _receive_experience(self, state, action, reward, next_state, terminated, available_actions):
+    def align_target_model(self):
+        self.target_network.set_weights(self.q_network.get_weights())
+
+    def _update_inference_network(self):
+        self._inference_network = NumpyMLP.from_keras(self.q_network, dtype=self._inference_dtype)
+
+    def _predict_q_values(self, states: np.ndarray) -> np.ndarray:
+        # Q values of the current network for a batch of states.
+        if self.training and not self._actor_only:
+            return np.array(self.q_network.predict_on_batch(states))
+        if self._inference_network is None:
+            # No weights were loaded - play with a randomly initialized network.
+            self.q_network = self._build_model()
+            self._update_inference_network()
+        return self._inference_network.predict(states)
+
+    def _receive_experience(self, state, action_id, reward, next_state, terminated, available_actions):
         # Store the experience into the buffer and retrain the network.
 
         assert self.training is True
-        self.experience_buffer.append((state, action, reward, next_state, terminated, available_actions))
+        self.experience_buffer.append(state, action_id, reward, next_state, terminated, available_actions)
+        if self._actor_only:
+            return
 
         # Only train every n experiences (speed up training)
         self._experiences_since_last_retrain += 1
@@ -176,24 +208,22 @@ class DQNAgent(PlayerAgent):
             return
 
         self._experiences_since_last_retrain = 0
+        self.train_step()
+
+    def train_step(self):
+        """
+        Trains the Q network on one minibatch from the experience buffer.
+        Usually called automatically when experiences are received, but a separate learner calls it directly.
+        """
 
         # Extract one minibatch from the experience replay buffer.
-        indices = np.random.choice(len(self.experience_buffer), size=self._batch_size)
-
-        state_batch = np.empty(shape=(self._batch_size, self._state_size), dtype=np.int32)
-        action_id_batch = np.empty(shape=self._batch_size, dtype=np.int32)
-        reward_batch = np.empty(shape=self._batch_size, dtype=np.float32)
-        next_state_batch = np.empty(shape=(self._batch_size, self._state_size), dtype=np.int32)
-        terminated_batch = np.empty(shape=self._batch_size, dtype=np.bool)
-        available_actions_batch = np.empty(shape=(self._batch_size, self._action_size), dtype=np.bool)
-        for i, index in enumerate(indices):
-            state, action, reward, next_state, terminated, available_actions = self.experience_buffer[index]
-            state_batch[i, :] = state
-            action_id_batch[i] = np.argmax(action)
-            reward_batch[i] = reward
-            next_state_batch[i, :] = next_state
-            terminated_batch[i] = terminated
-            available_actions_batch[i, :] = available_actions
+        state_batch, action_id_batch, reward_batch, next_state_batch, terminated_batch, available_actions_batch = \
+            self.experience_buffer.sample(self._batch_size)
+
+        if self._compiled_train_step is not None:
+            self._compiled_train_step(state_batch, action_id_batch, reward_batch, next_state_batch, terminated_batch,
+                                      available_actions_batch)
+            return
 
         q_curr = np.array(self.q_network.predict_on_batch(state_batch))
         q_next = np.array(self.target_network.predict_on_batch(next_state_batch))
@@ -202,9 +232,15 @@ class DQNAgent(PlayerAgent):
         # Nonterminal state: The expected cumulative future reward is the observation
         #                     + expected reward from the next state under the policy.
         #                    The amax() means that we expect the policy to pick the best action in the future.
+        #                    With Double DQN, the best action is selected by the Q network instead of the target network.
+        if self._double_dqn:
+            next_action_ids = np.argmax(np.array(self.q_network.predict_on_batch(next_state_batch)), axis=1)
+            v_next = q_next[np.arange(self._batch_size), next_action_ids]
+        else:
+            v_next = np.amax(q_next, axis=1)
         nonterminal_filter = (terminated_batch == 0)
         cumul_reward = reward_batch.copy()
-        cumul_reward[nonterminal_filter] += self._gamma * np.amax(q_next, axis=1)[nonterminal_filter]
+        cumul_reward[nonterminal_filter] += self._gamma * v_next[nonterminal_filter]
 
         # Update the Q-value for the actions that were experienced. Leave the rest the same.
         q_target = q_curr.copy()
@@ -219,19 +255,18 @@ class DQNAgent(PlayerAgent):
             raise ValueError("Agent is in terminal state. Did you start a new game? Need to call notify_new_game() first.")
 
         # Encode the current state.
-        state = self._encode_state(cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
+        state = self._state_encoder.encode(cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
 
         # Did a previous action lead to this state? Save experience for training.
         if self.training and self._prev_action is not None:
             # Reward=0: We reward only the terminal state.
-            self._receive_experience(state=self._prev_state, action=self._prev_action, reward=0, next_state=state,
+            self._receive_experience(state=self._prev_state, action_id=self._prev_action, reward=0, next_state=state,
                                      terminated=False, available_actions=self._prev_available_actions)
 
         # Create a mask of available actions.
         available_actions = np.zeros(self._action_size, dtype=np.bool)
-        for card in cards_in_hand:
-            if game_mode.is_play_allowed(card, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick):
-                available_actions[self._card2id[card]] = True
+        for card in game_mode.legal_moves(cards_in_hand, cards_in_trick):
+            available_actions[self._card2id[card]] = True
 
         # Pick an action (a card).
         selected_card = None
@@ -246,10 +281,11 @@ class DQNAgent(PlayerAgent):
                 selected_card = next(c for c in tmp_cards if available_actions[self._card2id[c]])
             else:
                 # Exploit: Predict q-values for the current state and select the best action.
-                q_values = np.array(self.q_network.predict_on_batch(state[np.newaxis, :]))[0]
+                q_values = self._predict_q_values(state[np.newaxis, :])[0]
                 self._current_q_vals = q_values
                 best_action_ids = np.argsort(q_values)[::-1]
-                self.logger.debug("Q values:\n" + "\n".join(f"{q_values[a]}: {self._id2card[a]}" for a in best_action_ids))
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Q values:\n" + "\n".join(f"{q_values[a]}: {self._id2card[a]}" for a in best_action_ids))
 
                 if self._allow_invalid_actions and self.training:
                     # If invalid is allowed (only during training): select the "best" action.
@@ -257,7 +293,7 @@ class DQNAgent(PlayerAgent):
                     if not available_actions[best_action_ids[0]]:
                         # Did we pick an invalid move? Time for punishment!
                         # Experience: we stay in the same state, but get a negative reward.
-                        self._receive_experience(state=state, action=self._encode_action(selected_card),
+                        self._receive_experience(state=state, action_id=self._card2id[selected_card],
                                                  reward=self._invalid_action_reward,
                                                  next_state=state,
                                                  terminated=False, available_actions=available_actions)
@@ -268,12 +304,10 @@ class DQNAgent(PlayerAgent):
 
         # Store the state and chosen action until the next call (in which we will receive feedback)
         self._prev_state = state
-        self._prev_action = self._encode_action(selected_card)
+        self._prev_action = self._card2id[selected_card]
         self._prev_available_actions = available_actions
 
-        # Memory: remember cards that were played.
-        self._mem_cards_already_played.update(cards_in_trick)
-        self._mem_cards_already_played.add(selected_card)
+        self._state_encoder.card_played(selected_card)
 
         return selected_card
 
@@ -282,7 +316,7 @@ class DQNAgent(PlayerAgent):
         # No aux reward for individual tricks right now.
         # But we do want to remember what players who came after us played!
         # In the future, we may also want to remember the scores of others and ourselves.
-        self._mem_cards_already_played.update(cards_in_trick)
+        self._state_encoder.trick_completed(cards_in_trick)
 
     @overrides
     def notify_game_result(self, won: bool, own_score: int, partner_score: int = None):
@@ -291,7 +325,7 @@ class DQNAgent(PlayerAgent):
         assert self._prev_action is not None and self._prev_state is not None
         if self.training:
             # In the terminal state, there are no cards
-            state = self._encode_state(cards_in_hand=[], cards_in_trick=[])
+            state = self._state_encoder.encode(cards_in_hand=[], cards_in_trick=[])
 
             # Reward is 1.0 for a game won and 0 otherwise.
             # TODO: we may want to increase reward based on total score in the future.
@@ -299,9 +333,10 @@ class DQNAgent(PlayerAgent):
             self._in_terminal_state = True
 
             # Add feedback, sync
-            self._receive_experience(state=self._prev_state, action=self._prev_action, reward=reward, next_state=state,
+            self._receive_experience(state=self._prev_state, action_id=self._prev_action, reward=reward, next_state=state,
                                      terminated=True, available_actions=self._prev_available_actions)
-            self._align_target_model()          # The episode is over, sync the models.
+            if not self._actor_only:
+                self.align_target_model()          # The episode is over, sync the models.
 
     @overrides
     def notify_new_game(self):
@@ -314,18 +349,136 @@ class DQNAgent(PlayerAgent):
         self._prev_available_actions = None
         self._in_terminal_state = False
 
-        self._mem_cards_already_played.clear()
+        self._state_encoder.new_game()
 
     @overrides
     def internal_card_values(self) -> Optional[Dict[Card, float]]:
         # Report q-value per card for display / debugging.
         return {c: self._current_q_vals[i] for i, c in enumerate(self._id2card)}
 
+    # ========
+    # Batched interface, for training with a BatchGameEnv instead of being called back by the GameController.
+    # One network call is made for all tables at once.
+    # ========
+
+    def encode_states(self, observation: Dict[str, np.ndarray], out: np.ndarray = None) -> np.ndarray:
+        """
+        Batched version of the state encoding in play_card(), for observations of a BatchGameEnv.
+        :param out: Optional - preallocated array of shape (N, state_size), int32. If provided, the states are written into it.
+        :return: array of shape (N, state_size).
+        """
+        return self._state_encoder.encode_batch(observation["cards_in_hand"], observation["cards_in_trick"],
+                                                observation["cards_already_played"], out=out)
+
+    def select_actions(self, states: np.ndarray, available_actions: np.ndarray) -> np.ndarray:
+        """
+        Batched version of the action selection in play_card().
+        If invalid actions are allowed and the agent selects one, it is punished (as in play_card()), but then the best valid
+        action is played right away - we don't ask the network again, so there is only a single forward pass per call.
+        :param states: array of shape (N, state_size).
+        :param available_actions: array of shape (N, 32) - the valid actions at every table.
+        :return: array of shape (N,) - the selected action (card id) for every table.
+        """
+
+        n_tables = len(states)
+
+        # Explore: Select a random valid action.
+        explore = np.zeros(n_tables, dtype=bool)
+        if self.training:
+            explore = np.random.rand(n_tables) <= self._epsilon
+        action_ids = np.argmax(np.where(available_actions, np.random.rand(n_tables, self._action_size), -1.), axis=1)
+
+        # Exploit: Predict q-values for the current states and select the best actions.
+        # Tables where the game is over (no valid actions) are skipped.
+        exploit = ~explore & np.any(available_actions, axis=1)
+        if np.any(exploit):
+            q_values = self._predict_q_values(states[exploit])
+            best_valid_ids = np.argmax(np.where(available_actions[exploit], q_values, -np.inf), axis=1)
+
+            if self._allow_invalid_actions and self.training:
+                # Did we pick an invalid move? Time for punishment!
+                # Experience: we stay in the same state, but get a negative reward.
+                best_ids = np.argmax(q_values, axis=1)
+                for i_table, action_id in zip(np.flatnonzero(exploit), best_ids):
+                    if not available_actions[i_table, action_id]:
+                        self._receive_experience(state=states[i_table], action_id=action_id,
+                                                 reward=self._invalid_action_reward, next_state=states[i_table],
+                                                 terminated=False, available_actions=available_actions[i_table])
+
+            action_ids[exploit] = best_valid_ids
+
+        return action_ids
+
+    def receive_experiences(self, states: np.ndarray, action_ids: np.ndarray, rewards: np.ndarray, next_states: np.ndarray,
+                            terminated: np.ndarray, available_actions: np.ndarray):
+        """
+        Batched version of the feedback in play_card() / notify_game_result(): stores one experience per table and retrains
+        the network as usual. When the episodes are over, the target network is synced.
+        """
+
+        for i_table in range(len(states)):
+            self._receive_experience(state=states[i_table], action_id=action_ids[i_table],
+                                     reward=rewards[i_table], next_state=next_states[i_table],
+                                     terminated=terminated[i_table], available_actions=available_actions[i_table])
+
+        if np.all(terminated) and not self._actor_only:
+            self.align_target_model()          # The episodes are over, sync the models.
+
+    def set_inference_network(self, network: NumpyMLP):
+        """
+        Replaces the network that is used for playing when not training, or when actor_only.
+        """
+        assert not self.training or self._actor_only
+        self._inference_network = network
+
     def save_weights(self, filepath, overwrite=True):
+        """
+        Saves the weights of the Q network. If the filepath ends with ".npz", the weights are exported in the format of NumpyMLP,
+        together with the agent config. Such a file can be loaded without TensorFlow, but only for playing (training=False).
+        Otherwise, the Keras format is used.
+        """
         self.logger.info(f'Saving weights to "{filepath}"...')
-        self.q_network.save_weights(filepath, overwrite=overwrite)
+        if filepath.endswith(".npz"):
+            if not overwrite and os.path.exists(filepath):
+                raise FileExistsError(filepath)
+            network = NumpyMLP.from_keras(self.q_network) if self.q_network is not None else self._inference_network
+            if network is None:
+                raise ValueError("No network to save - the agent has neither a Q network nor loaded weights.")
+            network.save(filepath, metadata={"agent_config": {"dqn_agent": self.config}})
+        else:
+            if self.q_network is None:
+                raise ValueError("No network to save - the Keras format needs the Q network (the agent is not training).")
+            self.q_network.save_weights(filepath, overwrite=overwrite)
+
+    @staticmethod
+    def load_exported_config(filepath) -> Dict:
+        """
+        Returns the config that was exported together with the weights (.npz, see save_weights()).
+        :return: config dict containing an agent_config node, which can be used to create the DQNAgent.
+        """
+        _, metadata = NumpyMLP.load(filepath)
+        return {"agent_config": metadata["agent_config"]}
 
     def load_weights(self, filepath):
+        """
+        Loads weights that were saved with save_weights(), either in Keras format or exported (.npz).
+        """
         self.logger.info(f'Loading weights from "{filepath}"...')
+        if filepath.endswith(".npz"):
+            if self.training:
+                raise ValueError("Exported weights (.npz) can only be used for playing, not for training.")
+            network, metadata = NumpyMLP.load(filepath, dtype=self._inference_dtype)
+            exported_config = metadata["agent_config"]["dqn_agent"]
+            for key in ["state_contents", "model_neurons"]:
+                if exported_config[key] != self.config[key]:
+                    raise ValueError(f'Exported weights have {key}={exported_config[key]}, but the agent has {self.config[key]}.')
+            self._inference_network = network
+            return
+
+        if self.q_network is None:
+            self.q_network = self._build_model()
         self.q_network.load_weights(filepath)
-        self._align_target_model()
+        if self.training:
+            self.align_target_model()
+        else:
+            self._update_inference_network()
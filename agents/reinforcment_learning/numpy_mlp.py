@@ -0,0 +1,95 @@
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class NumpyMLP:
+    """
+    Forward pass of a plain MLP (a stack of Dense layers with relu activations, linear output), in pure NumPy.
+
+    Our Q-network is tiny, and for single states, calling Keras costs much more than the actual matrix multiplications.
+    This class holds a copy of the weights and computes the same outputs directly. It is only meant for inference:
+    whenever the weights of the Keras model change, a new NumpyMLP must be created.
+
+    Does not depend on TensorFlow. Weights can be saved to / loaded from an .npz file (see save() and load()),
+    which takes only milliseconds and is how eval workers avoid importing TensorFlow at all.
+    """
+
+    # Increase this whenever the file layout changes.
+    FILE_FORMAT_VERSION = 1
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray]], dtype=np.float32):
+        """
+        Creates a NumpyMLP from existing weights.
+        :param layers: list of (kernel, bias) per layer, where kernel has shape (n_in, n_out) and bias has shape (n_out,).
+                       All but the last layer use relu activation.
+        :param dtype: the dtype for computing (float32 or float16). Outputs are always returned as float32.
+        """
+        assert len(layers) > 0
+        for (kernel, bias), (next_kernel, _) in zip(layers, layers[1:]):
+            assert kernel.shape[1] == bias.shape[0] == next_kernel.shape[0]
+
+        self.dtype = np.dtype(dtype)
+        self.layers = [(np.ascontiguousarray(kernel, dtype=self.dtype), np.ascontiguousarray(bias, dtype=self.dtype))
+                       for kernel, bias in layers]
+
+    @staticmethod
+    def from_keras(model, dtype=np.float32) -> 'NumpyMLP':
+        """
+        Copies the weights of a Keras Sequential model that consists only of Dense layers (relu, except for a linear output).
+        """
+        activations = [layer.get_config()["activation"] for layer in model.layers]
+        if activations[:-1] != ["relu"] * (len(activations) - 1) or activations[-1] != "linear":
+            raise ValueError(f"Unsupported activations: {activations}")
+
+        weights = model.get_weights()
+        return NumpyMLP(list(zip(weights[0::2], weights[1::2])), dtype=dtype)
+
+    @staticmethod
+    def load(filepath: str, dtype=np.float32) -> Tuple['NumpyMLP', Dict]:
+        """
+        Loads weights that were saved with save().
+        :return: a tuple of the NumpyMLP and the metadata dict.
+        """
+        with np.load(filepath, allow_pickle=False) as f:
+            if int(f["format_version"]) != NumpyMLP.FILE_FORMAT_VERSION:
+                raise ValueError(f'Unsupported file format version {int(f["format_version"])} in "{filepath}".')
+            n_layers = int(f["n_layers"])
+            layers = [(f[f"kernel_{i}"], f[f"bias_{i}"]) for i in range(n_layers)]
+            metadata = json.loads(str(f["metadata"]))
+        return NumpyMLP(layers, dtype=dtype), metadata
+
+    def save(self, filepath: str, metadata: Dict = None):
+        """
+        Saves the weights (as float32) to an uncompressed .npz file.
+        :param metadata: Optional - a JSON-serializable dict that is stored along with the weights.
+        """
+        arrays = {"format_version": np.array(NumpyMLP.FILE_FORMAT_VERSION),
+                  "n_layers": np.array(len(self.layers)),
+                  "metadata": np.array(json.dumps(metadata or {}))}
+        for i, (kernel, bias) in enumerate(self.layers):
+            arrays[f"kernel_{i}"] = kernel.astype(np.float32)
+            arrays[f"bias_{i}"] = bias.astype(np.float32)
+        with open(filepath, "wb") as f:
+            np.savez(f, **arrays)
+
+    @property
+    def input_size(self) -> int:
+        return self.layers[0][0].shape[0]
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """
+        Computes the outputs for a batch of inputs.
+        :param x: array of shape (N, input_size), any numeric dtype.
+        :return: array of shape (N, output_size), float32.
+        """
+        x = np.asarray(x, dtype=self.dtype)
+        for kernel, bias in self.layers[:-1]:
+            x = x @ kernel
+            x += bias
+            np.maximum(x, 0, out=x)
+        kernel, bias = self.layers[-1]
+        x = x @ kernel
+        x += bias
+        return x.astype(np.float32, copy=False)
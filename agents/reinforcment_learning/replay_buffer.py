@@ -0,0 +1,125 @@
+from contextlib import nullcontext
+from typing import List, Tuple
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Experience replay memory with a fixed capacity. When full, the oldest experiences are overwritten (like a deque with maxlen).
+
+    All experiences are stored in preallocated NumPy arrays, so sampling a minibatch is a single gather per field.
+    States and available actions are binary, so they are stored as packed bits (8 per byte), and action ids fit into an int8.
+
+    The arrays (including the counters) can also be placed in an existing memory block, e.g. shared memory. Then, multiple
+    processes can use the same buffer, if all of them pass a common lock (see actor_learner.py). Writers hold it while
+    appending, readers while copying the sampled experiences, so they never see an experience that is half overwritten.
+    """
+
+    def __init__(self, capacity: int, state_size: int, action_size: int, buffer=None, lock=None):
+        """
+        Creates an empty ReplayBuffer, or attaches to an existing one.
+        :param capacity: the max number of experiences.
+        :param state_size: length of the (binary) state vectors.
+        :param action_size: number of actions (at most 128).
+        :param buffer: Optional - a writable buffer (e.g. SharedMemory.buf) of at least n_bytes() bytes, where all data is stored.
+                       If the buffer contains zeros, the ReplayBuffer is empty. Default: allocate new memory.
+        :param lock: Optional - a lock that is held while appending experiences and while sampling.
+        """
+        assert action_size <= 128
+        self.capacity = capacity
+        self.state_size = state_size
+        self.action_size = action_size
+        self._lock = lock if lock is not None else nullcontext()
+
+        if buffer is None:
+            buffer = bytearray(ReplayBuffer.n_bytes(capacity, state_size, action_size))
+        arrays = []
+        offset = 0
+        for shape, dtype in ReplayBuffer._layout(capacity, state_size, action_size):
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+            offset += ReplayBuffer._aligned(arrays[-1].nbytes)
+        (self._counters, self._states, self._action_ids, self._rewards, self._next_states, self._terminated,
+         self._available_actions) = arrays
+
+    @staticmethod
+    def _layout(capacity: int, state_size: int, action_size: int) -> List[Tuple[Tuple[int, ...], type]]:
+        # Shape and dtype of all arrays.
+        n_state_bytes = (state_size + 7) // 8
+        n_action_bytes = (action_size + 7) // 8
+        return [
+            ((3,), np.int64),                       # Counters: index where the next experience is written, len, number of appends
+            ((capacity, n_state_bytes), np.uint8),  # States
+            ((capacity,), np.int8),                 # Action ids
+            ((capacity,), np.float32),              # Rewards
+            ((capacity, n_state_bytes), np.uint8),  # Next states
+            ((capacity,), bool),                    # Terminated
+            ((capacity, n_action_bytes), np.uint8), # Available actions
+        ]
+
+    @staticmethod
+    def _aligned(n_bytes: int) -> int:
+        return (n_bytes + 7) // 8 * 8
+
+    @staticmethod
+    def n_bytes(capacity: int, state_size: int, action_size: int) -> int:
+        """ The number of bytes that a ReplayBuffer with these parameters needs (see buffer). """
+        return sum(ReplayBuffer._aligned(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                   for shape, dtype in ReplayBuffer._layout(capacity, state_size, action_size))
+
+    def __len__(self) -> int:
+        return int(self._counters[1])
+
+    @property
+    def n_appended(self) -> int:
+        """ The number of experiences that were ever appended (including those that were overwritten). """
+        return int(self._counters[2])
+
+    def append(self, state: np.ndarray, action_id: int, reward: float, next_state: np.ndarray, terminated: bool,
+               available_actions: np.ndarray):
+        """
+        Stores a single experience.
+        :param state: array of shape (state_size,), containing only 0 and 1.
+        :param available_actions: bool array of shape (action_size,) - the actions that were valid in the state.
+        """
+        packed_state = np.packbits(state.astype(bool))
+        packed_next_state = np.packbits(next_state.astype(bool))
+        packed_available_actions = np.packbits(available_actions)
+
+        with self._lock:
+            i = int(self._counters[0])
+            self._states[i] = packed_state
+            self._action_ids[i] = action_id
+            self._rewards[i] = reward
+            self._next_states[i] = packed_next_state
+            self._terminated[i] = terminated
+            self._available_actions[i] = packed_available_actions
+
+            # Update the counters last (a reader holds the lock anyway, but this keeps len() consistent without it).
+            self._counters[0] = (i + 1) % self.capacity
+            self._counters[1] = min(self._counters[1] + 1, self.capacity)
+            self._counters[2] += 1
+
+    def sample(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Samples a minibatch uniformly (with replacement), using the global RNG.
+        :return: a tuple of arrays with batch_size rows: (states (int32), action_ids (int64), rewards (float32),
+                 next_states (int32), terminated (bool), available_actions (bool)).
+        """
+        # Copy the (packed) experiences while holding the lock, so writers can't overwrite them halfway.
+        # This only takes a few microseconds, unpacking happens afterwards.
+        with self._lock:
+            indices = np.random.choice(len(self), size=batch_size)
+            states = self._states[indices]
+            action_ids = self._action_ids[indices]
+            rewards = self._rewards[indices]
+            next_states = self._next_states[indices]
+            terminated = self._terminated[indices]
+            available_actions = self._available_actions[indices]
+
+        return (np.unpackbits(states, axis=1, count=self.state_size).astype(np.int32),
+                action_ids.astype(np.int64),
+                rewards,
+                np.unpackbits(next_states, axis=1, count=self.state_size).astype(np.int32),
+                terminated,
+                np.unpackbits(available_actions, axis=1, count=self.action_size).astype(bool))
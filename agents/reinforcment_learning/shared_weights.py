@@ -0,0 +1,166 @@
+import hashlib
+import os
+import secrets
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from time import sleep
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from utils.wakeup_util import wake_up
+
+
+class SharedWeights:
+    """
+    The weights of a NumpyMLP in a shared memory segment: one process publishes new weights, any number of other processes
+    (on the same machine) read them, without any file I/O or pickling.
+
+    The segment starts with a header (version, number of layers, segment id, layer shapes), so readers only need to know its name.
+    Writing is guarded by a sequence lock: the version is odd while the weights are being written. Readers copy the weights
+    and retry if the version was odd or has changed in the meantime. So there is never more than one writer per segment.
+
+    The segment belongs to the process that creates it (the writer): it is destroyed when that process calls unlink(), or
+    by the resource tracker when the process exits without doing so. Segments are either private to a process tree
+    (e.g. actor_learner.py), or they have a well-known name, so unrelated processes can attach to them (e.g. trainer -> evaluators,
+    see name_for_checkpoint()). Such readers must pass track=False, so their own resource tracker leaves the segment alone.
+
+    Every publish() wakes up the processes that wait on the channel of the segment (see wakeup_channel() and wakeup_util.py).
+    """
+
+    _max_layers = 16
+    _header_len = 3 + 2 * _max_layers
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        # Use create() or attach().
+        self._shm = shm
+        self._header = np.ndarray(SharedWeights._header_len, dtype=np.int64, buffer=shm.buf)
+        n_layers = int(self._header[1])
+        self._layer_shapes = [(int(self._header[3 + 2*i]), int(self._header[4 + 2*i])) for i in range(n_layers)]
+
+        self._layers = []
+        offset = self._header.nbytes
+        for n_in, n_out in self._layer_shapes:
+            kernel = np.ndarray((n_in, n_out), dtype=np.float32, buffer=shm.buf, offset=offset)
+            bias = np.ndarray(n_out, dtype=np.float32, buffer=shm.buf, offset=offset + kernel.nbytes)
+            self._layers.append((kernel, bias))
+            offset += kernel.nbytes + bias.nbytes
+
+    @staticmethod
+    def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+        # Attaching to a segment also registers it with the resource tracker of this process, which would destroy it when
+        # this process exits. Before Python 3.13, this can't be turned off, so it is undone instead. The tracker knows
+        # POSIX segments by their name with a leading slash.
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name=name, track=False)
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            resource_tracker.unregister("/" + shm.name, "shared_memory")
+        return shm
+
+    @staticmethod
+    def name_for_checkpoint(checkpoint_path: str) -> str:
+        """
+        A well-known segment name for the weights of a checkpoint, so unrelated processes on the same machine can find them.
+        """
+        return "alphasheep-" + hashlib.sha1(os.path.abspath(checkpoint_path).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def create(layer_shapes: List[Tuple[int, int]], name: str = None) -> 'SharedWeights':
+        """
+        Creates a new shared memory segment, owned by this process. Nothing is published yet (version 0).
+        :param layer_shapes: list of (n_in, n_out) per layer of the NumpyMLP.
+        :param name: Optional - the name of the segment. Default: choose a unique name.
+        """
+        assert len(layer_shapes) <= SharedWeights._max_layers
+        n_bytes = 8 * SharedWeights._header_len + sum(4 * (n_in + 1) * n_out for n_in, n_out in layer_shapes)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=n_bytes)
+
+        header = np.ndarray(SharedWeights._header_len, dtype=np.int64, buffer=shm.buf)
+        header[0] = 0
+        header[1] = len(layer_shapes)
+        header[2] = secrets.randbits(63)
+        header[3:3 + 2 * len(layer_shapes)] = np.array(layer_shapes, dtype=np.int64).ravel()
+        return SharedWeights(shm)
+
+    @staticmethod
+    def attach(name: str, track: bool = True) -> 'SharedWeights':
+        """
+        Attaches to an existing segment, which was created with create(). Raises FileNotFoundError if there is none.
+        :param track: Must be False if the segment was not created in the same process tree.
+        """
+        return SharedWeights(shared_memory.SharedMemory(name=name) if track else SharedWeights._attach_untracked(name))
+
+    @staticmethod
+    def create_or_take_over(layer_shapes: List[Tuple[int, int]], name: str) -> 'SharedWeights':
+        """
+        Creates a segment with a well-known name. If it already exists (because its owner was killed along with its resource tracker),
+        this process becomes the new owner, and the version keeps counting.
+        """
+        try:
+            return SharedWeights.create(layer_shapes, name=name)
+        except FileExistsError:
+            shared_weights = SharedWeights.attach(name)
+            if shared_weights._layer_shapes != [tuple(s) for s in layer_shapes]:
+                shared_weights.close()
+                raise ValueError(f'Shared memory "{name}" exists, but has layer shapes {shared_weights._layer_shapes}.')
+            return shared_weights
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def segment_id(self) -> int:
+        """ A random id, chosen by create(). Readers can use it to notice that the segment was replaced by a new one. """
+        return int(self._header[2])
+
+    @staticmethod
+    def wakeup_channel(name: str) -> str:
+        """ The channel that is woken up whenever weights are published to the segment with this name (see wakeup_util.py). """
+        return name + "-wakeup"
+
+    @property
+    def version(self) -> int:
+        """ How many times weights were published. 0 = none yet. """
+        return int(self._header[0]) // 2
+
+    def publish(self, network: NumpyMLP):
+        """ Writes new weights, which must have the same shapes as given to create(). """
+        assert [k.shape for k, _ in network.layers] == self._layer_shapes
+        version = self.version
+        self._header[0] = 2 * version + 1       # Also works if a previous writer has crashed while writing
+        for (kernel, bias), (shared_kernel, shared_bias) in zip(network.layers, self._layers):
+            shared_kernel[:] = kernel
+            shared_bias[:] = bias
+        self._header[0] = 2 * (version + 1)
+        wake_up(SharedWeights.wakeup_channel(self.name))
+
+    def read(self, dtype=np.float32, newer_than: int = 0) -> Tuple[Optional[NumpyMLP], int]:
+        """
+        Reads the latest weights.
+        :param dtype: the dtype of the returned NumpyMLP.
+        :param newer_than: Optional - only read the weights if their version is newer than this.
+        :return: a tuple of (the weights as NumpyMLP, version). If nothing new was published, the NumpyMLP is None.
+        """
+        while True:
+            seq = int(self._header[0])
+            if seq // 2 <= newer_than:
+                return None, seq // 2
+            if seq % 2 == 1:
+                sleep(0.001)            # Writer is busy
+                continue
+            layers = [(kernel.copy(), bias.copy()) for kernel, bias in self._layers]
+            if int(self._header[0]) == seq:
+                return NumpyMLP(layers, dtype=dtype), seq // 2
+
+    def close(self):
+        """ Detaches from the segment. """
+        self._header = None
+        self._layers = None
+        self._shm.close()
+
+    def unlink(self):
+        """ Destroys the segment. Should be called exactly once, by the owner. Readers that are still attached can keep reading. """
+        self._shm.unlink()
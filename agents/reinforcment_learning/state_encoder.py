@@ -0,0 +1,141 @@
+from typing import Iterable, List
+
+import numpy as np
+
+from simulator.card_defs import Card
+
+
+class StateEncoder:
+    """
+    Encodes the observations of a player into the state vector for the Q network.
+
+    A state contains (depending on state_contents, in that order):
+    - "cards_in_hand":          32 bools - cards that the player has in hand (unordered, directly observed)
+    - "cards_in_trick":         3x32 bools - cards in the current trick before the one to be played by the player (ordered, directly observed)
+    - "cards_already_played":   32 bools - cards in all completed tricks (unordered, engineered feature).
+                                This could also be learned by the agent if it had some memory.
+
+    Future possibilities for features:
+    - Number of the current trick: not necessary, can be implied from len of cards_in_hand
+    - Mapping player IDs to cards to GameMode (knowing who is declaring, and then knowing THEY played a specific card)
+      - Partially contained in the order of cards_in_trick, but needs initial info about player IDs
+    - LSTM based memory of played cards, perhaps together with player IDs
+    - Player scores, or actually a memory of all cards in all previous tricks, mapped to player IDs
+
+    For a single player, the state is kept in a buffer during the game and updated incrementally: the hand is set once, and after
+    that, only single bits are changed when cards are played (see new_game(), encode(), card_played(), trick_completed()).
+    For many tables at once, see encode_batch().
+    """
+
+    component_sizes = {
+        "cards_in_hand": 32,
+        "cards_in_trick": 3*32,
+        "cards_already_played": 32
+    }
+
+    def __init__(self, state_contents: List[str]):
+        """
+        Creates a StateEncoder.
+        :param state_contents: list of component names (see above).
+        """
+        for comp in state_contents:
+            if comp not in StateEncoder.component_sizes:
+                raise ValueError(f'Unknown state component name: "{comp}"')
+
+        # Offset of every component in the state vector (None if not contained).
+        self._offsets = dict.fromkeys(StateEncoder.component_sizes)
+        offset = 0
+        for comp in state_contents:
+            self._offsets[comp] = offset
+            offset += StateEncoder.component_sizes[comp]
+        self.state_size = offset
+
+        # Per-game buffer for the incremental encoding.
+        self._state = np.zeros(self.state_size, dtype=np.int32)
+        self._trick_indices = []            # Indices of the bits that are set for cards_in_trick
+        self._n_cards_in_hand = None        # None = hand was not yet observed in this game
+        self._n_cards_already_played = 0
+
+    def new_game(self):
+        """ Clears the state. Must be called before every game. """
+        self._state[:] = 0
+        self._trick_indices = []
+        self._n_cards_in_hand = None
+        self._n_cards_already_played = 0
+
+    def encode(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> np.ndarray:
+        """
+        Returns the state for the current observation. Only the first call of a game reads cards_in_hand, after that,
+        the hand is tracked by card_played().
+        :return: array of shape (state_size,), int32. This is a copy, the caller can keep it.
+        """
+
+        if self._n_cards_in_hand is None:
+            self._n_cards_in_hand = 0
+            for card in cards_in_hand:
+                self._set_bit("cards_in_hand", card.card_id)
+                self._n_cards_in_hand += 1
+        assert self._n_cards_already_played == 4 * (8 - self._n_cards_in_hand)
+
+        offset = self._offsets["cards_in_trick"]
+        if offset is not None:
+            self._state[self._trick_indices] = 0
+            self._trick_indices = [offset + i * 32 + card.card_id for i, card in enumerate(cards_in_trick)]
+            self._state[self._trick_indices] = 1
+
+        return self._state.copy()
+
+    def card_played(self, card: Card):
+        """ Updates the state after the player has played a card. """
+        offset = self._offsets["cards_in_hand"]
+        if offset is not None:
+            self._state[offset + card.card_id] = 0
+        self._n_cards_in_hand -= 1
+
+    def trick_completed(self, cards_in_trick: List[Card]):
+        """ Updates the state after a trick has been completed (cards_in_trick contains all 4 cards). """
+        offset = self._offsets["cards_in_trick"]
+        if offset is not None:
+            self._state[self._trick_indices] = 0
+            self._trick_indices = []
+        for card in cards_in_trick:
+            self._set_bit("cards_already_played", card.card_id)
+        self._n_cards_already_played += len(cards_in_trick)
+
+    def _set_bit(self, comp: str, card_id: int):
+        offset = self._offsets[comp]
+        if offset is not None:
+            self._state[offset + card_id] = 1
+
+    def encode_batch(self, cards_in_hand: np.ndarray, cards_in_trick: np.ndarray, cards_already_played: np.ndarray,
+                     out: np.ndarray = None) -> np.ndarray:
+        """
+        Encodes the states of many tables at once (stateless, does not use the per-game buffer).
+        :param cards_in_hand: array of shape (N,) - hand masks.
+        :param cards_in_trick: array of shape (N, 3) - ids of the cards in the current trick (in order of playing, -1 = empty).
+        :param cards_already_played: array of shape (N,) - masks of all cards in completed tricks.
+        :param out: Optional - array of shape (N, state_size), int32. If provided, the states are written into it.
+        :return: array of shape (N, state_size), int32 (out, if provided).
+        """
+
+        n_tables = len(cards_in_hand)
+        if out is None:
+            out = np.empty(shape=(n_tables, self.state_size), dtype=np.int32)
+        assert out.shape == (n_tables, self.state_size)
+
+        card_ids = np.arange(32, dtype=np.int64)
+        offset = self._offsets["cards_in_hand"]
+        if offset is not None:
+            out[:, offset:offset + 32] = (cards_in_hand[:, np.newaxis] >> card_ids) & 1
+
+        offset = self._offsets["cards_in_trick"]
+        if offset is not None:
+            out[:, offset:offset + 3*32] = 0
+            i_tables, i_cards = np.nonzero(cards_in_trick >= 0)
+            out[i_tables, offset + i_cards * 32 + cards_in_trick[i_tables, i_cards]] = 1
+
+        offset = self._offsets["cards_already_played"]
+        if offset is not None:
+            out[:, offset:offset + 32] = (cards_already_played[:, np.newaxis] >> card_ids) & 1
+
+        return out
@@ -1,8 +1,9 @@
-from typing import List, Iterable
+from typing import Callable, Dict, List, Iterable, Tuple, Union
 import numpy as np
 
 from simulator.player_agent import PlayerAgent
-from simulator.card_defs import Card, Suit, Pip, pip_scores
+from simulator.card_defs import Card, Pip, Suit, new_deck, pip_scores
+from simulator.card_set import card_from_id, cards_to_mask, mask_to_card_ids, masks_to_bools
 from simulator.game_mode import GameMode, GameContract
 from utils.log_util import get_class_logger
 
@@ -17,18 +18,23 @@ class RuleBasedAgent(PlayerAgent):
     CC is probably over 9000, sorry for creating an abomination. Maybe we should call it IfElseAgent :)
 
     The agent can play any Suit-Solo, both as declaring and non-declaring player.
+
+    Since three of these agents play against the learner in every game, the rules are evaluated on card masks
+    (see simulator.card_set), with orderings that are precomputed once per game mode (see _RuleTables).
+    For many tables at once (see BatchGameEnv), play_card_batch() evaluates the same rules with NumPy.
     """
 
+    # play_card_batch() falls back to play_card() for fewer tables than this.
+    min_batch_size = 48
+
+    # The only randomness is the choice between multiple saus when leading. A cache (see CachedAgent) repeats the first choice.
+    cacheable = True
+
     def __init__(self, player_id: int):
         super().__init__(player_id)
 
         self.logger = get_class_logger(self)
 
-        # "Power" values for quickly determining which card can beat which.
-        # Defining this here because we don't want to be dependent on the enum int values.
-        self._suit_power = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
-        self._pip_power = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
-
     def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
         # For now, this function is a dispatcher that invokes individual behaviors based on the game mode.
         # The (almost hardcoded) behavior in these functions is highly redundant, but keeping it this way
@@ -55,91 +61,92 @@ class RuleBasedAgent(PlayerAgent):
         # These action definitions could also be shared across behaviors, so this could remove some of the redundancy
         #  we get when duplicating behavior for different game modes.
 
-        valid_cards = [c for c in cards_in_hand if game_mode.is_play_allowed(c, cards_in_hand, cards_in_trick)]
-        own_trumps = self._trumps_by_power(in_cards=valid_cards, game_mode=game_mode)
+        # All sets of cards are masks, and all single cards are card ids.
+        t = _RuleTables.for_game_mode(game_mode)
+        hand = cards_to_mask(cards_in_hand)
+        valid = game_mode.legal_moves_mask(hand, cards_in_trick)
+        own_trumps = valid & t.trump_mask
 
         if len(cards_in_trick) == 0:
             # We are leading.
-            if any(own_trumps):
+            if own_trumps:
                 # As a general rule, we'd like to play our trumps high to low.
                 action = "play_highest_trump"
-                selected_card = own_trumps[-1]
+                selected = _highest(own_trumps, t.trump_power_runs)
             else:
                 # No trump, play color.
-                saus = [c for c in cards_in_hand if c.pip == Pip.sau]
-                if any(saus):
+                saus = mask_to_card_ids(hand & t.sau_mask)
+                if saus:
                     # Play a color sau.
                     action = "play_color_sau"
-                    selected_card = saus[np.random.randint(len(saus))]
+                    selected = saus[np.random.randint(len(saus))]
                 else:
                     # Play a Spatz (low value).
                     # Depending on what happend in the game, it might be very important which color is played.
                     # But this goes beyond this simple baseline :)
                     action = "play_spatz"
-                    selected_card = self._cards_by_value(valid_cards)[0]
+                    selected = _lowest(valid, t.value_runs)
 
         else:
             # Not leading.
             # Do we need to match? Get all valid options.
-            c_lead = cards_in_trick[0]
+            trick = [c.card_id for c in cards_in_trick]
+            lead = trick[0]
 
-            if any(c for c in valid_cards if game_mode.is_trump(c)):
+            if own_trumps:
                 # We can play trump (in fact, any trump we have).  Which one will we pick?
 
-                # Find out if we can beat the preceding cards.
-                if any(game_mode.is_trump(c) for c in cards_in_trick):
-                    beating_cards = [c for c in own_trumps
-                                     if self._trump_power(c) > max(self._trump_power(c2) for c2 in cards_in_trick
-                                                                   if game_mode.is_trump(c2))]
-                else:
-                    beating_cards = own_trumps
+                # Find out if we can beat the preceding cards. If there is no trump in the trick yet, any trump will do.
+                beating_cards = own_trumps & t.beating_masks[lead][t.winning_card(trick)]
 
-                if any(beating_cards):
+                if beating_cards:
                     # We can beat the preceding cards.
                     # a) pick lowest trump that will beat the prev players. Do this if 0-1 players come after us.
                     # b) pick a high trump to prevent following players to beat. Do this if 2 players come after us.
                     beat_low = len(cards_in_trick) > 1
-                    beating_cards_by_power = self._trumps_by_power(beating_cards, game_mode)
                     if beat_low:
                         action = "beat_trump_low"
-                        selected_card = beating_cards_by_power[0]
+                        selected = _lowest(beating_cards, t.trump_power_runs)
                     else:
                         action = "beat_trump_high"
-                        selected_card = beating_cards_by_power[-1]
+                        selected = _highest(beating_cards, t.trump_power_runs)
                 else:
                     # We actually cannot beat them. Play a spatz (low-value card).
                     action = "play_spatz"
-                    selected_card = self._cards_by_value(valid_cards)[0]
+                    selected = _lowest(valid, t.value_runs)
 
-            elif not game_mode.is_trump(c_lead):
+            elif not (t.trump_mask >> lead) & 1:
                 # We can't play trump, but the leading card also is not a trump.
                 # Therefore we might beat it with a higher card of the same suit.
-                beating_cards = [c for c in valid_cards
-                                 if c.suit == c_lead.suit
-                                 and self._pip_power[c.pip] > max(self._pip_power[c2.pip] for c2 in cards_in_trick
-                                                                  if c2.suit == c_lead.suit)]
-                if any(beating_cards):
+                # NOTE: This compares the plain pips of all cards of the suit, including ober and unter (which are trumps).
+                suit_mask = t.suit_masks[lead]
+                highest_pip = max(t.pips[c] for c in trick if (suit_mask >> c) & 1)
+                beating_cards = valid & suit_mask & t.higher_pip_masks[highest_pip]
+                if beating_cards:
                     # In the case of suit, always beat high (hopefully with a sau).
+                    # Within a suit, the card ids are ordered by pip.
                     action = "beat_suit_high"
-                    selected_card = sorted(beating_cards, key=lambda c: self._pip_power[c.pip], reverse=True)[0]
+                    selected = beating_cards.bit_length() - 1
                 else:
                     action = "play_spatz"
-                    selected_card = self._cards_by_value(valid_cards)[0]
+                    selected = _lowest(valid, t.value_runs)
 
             else:
                 # We cannot beat it with or without trump. Play a spatz (low-value card).
                 action = "play_spatz"
-                selected_card = self._cards_by_value(valid_cards)[0]
+                selected = _lowest(valid, t.value_runs)
 
-        self.logger.debug(f'Executing action "{action}".')
-        assert game_mode.is_play_allowed(selected_card, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
-        return selected_card
+        self.logger.debug('Executing action "%s".', action)
+        assert (valid >> selected) & 1, "Selected a card that is not allowed!"
+        return card_from_id(selected)
 
     def _play_card_solo_not_declaring(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
         # When a solo is being played and the declaring player is the enemy.
-        valid_cards = [c for c in cards_in_hand if game_mode.is_play_allowed(c, cards_in_hand, cards_in_trick)]
-        own_trumps = self._trumps_by_power(in_cards=valid_cards, game_mode=game_mode)
-        non_trumps = set(valid_cards).difference(own_trumps)
+        t = _RuleTables.for_game_mode(game_mode)
+        hand = cards_to_mask(cards_in_hand)
+        valid = game_mode.legal_moves_mask(hand, cards_in_trick)
+        own_trumps = valid & t.trump_mask
+        non_trumps = valid & ~t.trump_mask
 
         if len(cards_in_trick) == 0:
             # We are leading.
@@ -147,60 +154,53 @@ class RuleBasedAgent(PlayerAgent):
             # We hope that the enemy has a card of this suit and is forced to match.
             # TODO: create memory, and check if a) the suit has been played before, b) the enemy is known to have it
             # TODO: in this case, do NOT play it. There are exceptions, but well.
-            saus = [c for c in non_trumps if c.pip == Pip.sau]
-            if any(saus):
+            saus = mask_to_card_ids(non_trumps & t.sau_mask)
+            if saus:
                 action = "play_color_sau"
-                selected_card = saus[np.random.randint(len(saus))]
+                selected = saus[np.random.randint(len(saus))]
             else:
                 # No sau: don't play 10 etc., rather play a small card and hope our partners have the sau
                 action = "play_spatz"
-                selected_card = self._cards_by_value(non_trumps if any(non_trumps) else own_trumps)[0]
+                selected = _lowest(non_trumps, t.value_runs) if non_trumps else _lowest(own_trumps, t.trump_value_runs)
 
         else:
             # Not leading.
             # In this situation, we want to:
             # - minimize damage as the enemy will probably take the trick
             # - maximize score whenever it looks like we (or our partners) might take it.
+            trick = [c.card_id for c in cards_in_trick]
+            lead = trick[0]
+            winning_card = t.winning_card(trick)
+
+            # Has the enemy already played their card? They did if they are at most len(trick) seats before us.
+            enemy_offset = (self.player_id - game_mode.declaring_player_id) % 4
 
-            # Has the enemy already played their card?
-            # TODO: This is HORRIBLE and I'm tired. Make a nice helper function and abstract this modulo crap away for all eternity, PLEASE!
-            enemy_id = game_mode.declaring_player_id
-            enemy_card_id = None
-            i_p = self.player_id
-            for i in range(len(cards_in_trick)):
-                i_p = (i_p - 1) % 4
-                if i_p == enemy_id:
-                    enemy_card_id = len(cards_in_trick) - 1 - i
-                    break
-            enemy_card = cards_in_trick[enemy_card_id] if enemy_card_id is not None else None
-
-            if enemy_card_id is not None:
+            if enemy_offset <= len(trick):
                 # The enemy has already made their move.
-                if self._winning_card(cards_in_trick, game_mode) != enemy_card:
+                if winning_card != trick[len(trick) - enemy_offset]:
                     # A partner has already beaten the enemy.
                     # Give them as many points as possible.
-                    non_trump_by_value = self._cards_by_value(non_trumps)
-                    if any(non_trump_by_value):
+                    if non_trumps:
                         # Put the most expensive non-trump
                         action = "schmier_points"
-                        selected_card = non_trump_by_value[-1]
+                        selected = _highest(non_trumps, t.value_runs)
                     else:
                         # We are not allowed to schmier a non-trump. Put the most expensive trump.
                         # TODO: don't schmier an ober!
                         #       DQNAgent learns to exploit this!
                         action = "schmier_trump"
-                        selected_card = self._cards_by_value(own_trumps)[-1]
+                        selected = _highest(own_trumps, t.trump_value_runs)
 
                 else:
                     # The enemy has already played, but it's not clear who will take the trick.
                     # Can we beat it?
-                    beating_cards = [c for c in valid_cards if c == self._winning_card(cards_in_trick + [c], game_mode)]
-                    if any(beating_cards):
+                    beating_cards = valid & t.beating_masks[lead][winning_card]
+                    if beating_cards:
                         # We can actually beat the enemy. Use the most expensive option.
                         # TODO: don't schmier-stech with ober if not necessary!
                         #       DQNAgent learns to exploit this!
                         action = "beat_expensive"
-                        selected_card = self._cards_by_value(beating_cards)[-1]
+                        selected = _highest(beating_cards, t.value_runs)
                     else:
                         # Can't beat them. Can we expect a partner to beat them?
                         # TODO: create memory of cards that are still in the game. Recognize if the enemy played the currently highest trump.
@@ -208,87 +208,337 @@ class RuleBasedAgent(PlayerAgent):
                         # wager on our partners in some cases.
                         # Play a Spatz.
                         action = "play_spatz"
-                        selected_card = self._cards_by_value(valid_cards)[0]
+                        selected = _lowest(valid, t.value_runs)
             else:
                 # The enemy has not yet played.
-                if game_mode.is_trump(cards_in_trick[0]):
+                if (t.trump_mask >> lead) & 1:
                     # WTF, our partner played trump. Idiot! We expect the enemy will surely take it.
                     action = "play_spatz;insult_leader"
-                    selected_card = self._cards_by_value(valid_cards)[0]
+                    selected = _lowest(valid, t.value_runs)
                 else:
                     # It's a suit card. As a general rule, we hope that the enemy has to match and we might take it.
                     # This might not be the case depending on what suits were already played, but we are not that smart right now :)
-                    beating_cards = [c for c in valid_cards if c == self._winning_card(cards_in_trick + [c], game_mode)]
-                    if any(beating_cards):
+                    beating_cards = valid & t.beating_masks[lead][winning_card]
+                    if beating_cards:
                         # We can beat our partners.
-                        if game_mode.is_trump(beating_cards[0]):
+                        if (t.trump_mask & beating_cards & -beating_cards) != 0:
                             # We don't have that suit and can beat it with a trump.
                             # There is a lot of options here, but we will stick to the golden rule: "Mi'm Unter gehst net unter".
-                            beating_unter = [c for c in valid_cards if c.pip == Pip.unter]
-                            if any(beating_unter):
+                            beating_unter = valid & t.unter_mask
+                            if beating_unter:
                                 # Play the lowest unter, which makes the trick "safe" (the enemy can't beat with an expensive sau).
                                 action = "beat_with_unter"
-                                selected_card = self._trumps_by_power(beating_unter, game_mode)[0]
+                                selected = _lowest(beating_unter, t.trump_power_runs)
                             else:
                                 # It's also fine to be risky and beat with sau/zehn. We expect the enemy to take those away soon anyway.
                                 action = "beat_expensive"
-                                selected_card = self._cards_by_value(beating_cards)[-1]
+                                selected = _highest(beating_cards, t.value_runs)
                         else:
                             # We must match the suit and can beat our partner.
                             # Do it, since this probably means playing the sau, which is good.
                             action = "match_expensive"
-                            selected_card = self._cards_by_value(valid_cards)[-1]
+                            selected = _highest(valid, t.value_runs)
                     else:
                         # The partner lead is non-trump and we can't beat the partners.
                         # TODO: special situation: did the 2nd partner beat with a trump,
                         #  so high that the enemy won't be able to take it? then schmier.
-                        if any(c for c in cards_in_trick if c.suit == cards_in_trick[0] and c.pip == Pip.sau):
-                            # One of the partners played the suit-sau. We hope the enemy needs to match!
-                            # TODO: don't schmier if it's clear from memory that the enemy can beat it.
-                            action = "schmier_points"
-                            selected_card = self._cards_by_value(valid_cards)[-1]
-                        else:
-                            # It's non-trump, low, we need to match, looks bad man.
-                            action = "play_spatz"
-                            selected_card = self._cards_by_value(valid_cards)[0]
-
-        self.logger.debug(f'Executing action "{action}".')
-        assert game_mode.is_play_allowed(selected_card, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
-        return selected_card
+                        # TODO: If one of the partners played the suit-sau, we could hope that the enemy needs to match, and schmier.
+                        #       (The old check for this compared a suit to a card and never matched, so it's not done right now.
+                        #       Enabling it would change the baseline that all agents are evaluated against.)
+                        # It's non-trump, low, we need to match, looks bad man.
+                        action = "play_spatz"
+                        selected = _lowest(valid, t.value_runs)
 
-    # ========
-    # Helper functions for quick comparison of trumps and cards.
-    # TODO: Make these globally available (maybe move to GameMode).
-    # ========
-
-    def _trump_power(self, c: Card):
-        val = 0
-        if c.pip == Pip.ober or c.pip == Pip.unter:
-            if c.pip == Pip.ober:                       # Ober is always higher than unter
-                val += 100
-            val += 100 + self._suit_power[c.suit]       # Ober or unter are ranked by suit
-        else:
-            val = self._pip_power[c.pip]                # Plain trump color is ranked by pip
-        return val
+        self.logger.debug('Executing action "%s".', action)
+        assert (valid >> selected) & 1, "Selected a card that is not allowed!"
+        return card_from_id(selected)
 
-    def _trumps_by_power(self, in_cards: Iterable[Card], game_mode: GameMode) -> List[Card]:
-        # Filters in_cards by trumps and returns them, sorted py power.
-        return sorted([c for c in in_cards if game_mode.is_trump(c)], key=self._trump_power)
+    def play_card_batch(self, hand_masks: np.ndarray, trick_card_ids: np.ndarray, game_mode: GameMode) -> np.ndarray:
+        # Vectorized version of play_card(): every action is evaluated for all tables, and then each table takes the action of
+        # the first rule that applies (in the same order as the if-else cascade). See the scalar versions for the reasoning.
+        # The only difference is the random choice of the sau, which draws different random numbers.
 
-    def _cards_by_value(self, in_cards: Iterable[Card]) -> List[Card]:
-        # Sorts cards by value.
-        return sorted(in_cards, key=lambda c: pip_scores[c.pip])
+        if game_mode.contract != GameContract.suit_solo:
+            raise NotImplementedError("Sorry, can only play a Suit-solo right now.")
+        if len(hand_masks) < RuleBasedAgent.min_batch_size:
+            # NumPy has a fixed overhead per call, which only pays off for enough tables.
+            return super().play_card_batch(hand_masks, trick_card_ids, game_mode)
+
+        t = _RuleTables.for_game_mode(game_mode)
+        s = _BatchSituation(t, np.asarray(hand_masks, dtype=np.int64), np.asarray(trick_card_ids, dtype=np.int64), game_mode)
+        if game_mode.declaring_player_id == self.player_id:
+            selected, sau_tables, saus = self._play_card_batch_solo_declaring(t, s)
+        else:
+            selected, sau_tables, saus = self._play_card_batch_solo_not_declaring(t, s)
+
+        # Random numbers are only drawn for the tables that actually play a sau.
+        if sau_tables.any():
+            selected[sau_tables] = _random_card_batch(saus[sau_tables])
+
+        assert ((s.valid >> selected) & 1).all(), "Selected a card that is not allowed!"
+        return selected
+
+    def _play_card_batch_solo_declaring(self, t: '_RuleTables', s: '_BatchSituation') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Returns the selected cards, the tables that play a random sau instead, and the saus to choose from.
+        own_trumps = s.valid & t.trump_mask
+        saus = s.hands & t.sau_mask
+        beating_trumps = own_trumps & s.beating
+        has_trumps = own_trumps != 0
+
+        # Suit cards are compared by their plain pips (see _play_card_solo_declaring()).
+        suit_masks = t.suit_masks_arr[s.lead]
+        same_suit = s.in_trick & ((suit_masks[:, np.newaxis] >> s.trick_ids) & 1 == 1)
+        highest_pip = np.max(np.where(same_suit, t.pips_arr[s.trick_ids], 0), axis=1)
+        beating_suit = s.valid & suit_masks & t.higher_pip_masks_arr[highest_pip]
+
+        play_color_sau = s.leading & ~has_trumps & (saus != 0)
+        rules = [
+            # play_highest_trump
+            (s.leading & has_trumps, lambda: t.trump_power_order.highest(own_trumps)),
+            # play_color_sau (the card is drawn later)
+            (play_color_sau, lambda: 0),
+            # play_spatz
+            (s.leading, lambda: t.value_order.lowest(s.valid)),
+            # beat_trump_low
+            (has_trumps & (beating_trumps != 0) & (s.n_trick > 1),
+             lambda: t.trump_power_order.lowest(beating_trumps)),
+            # beat_trump_high
+            (has_trumps & (beating_trumps != 0), lambda: t.trump_power_order.highest(beating_trumps)),
+            # beat_suit_high
+            (~has_trumps & ~s.lead_is_trump & (beating_suit != 0), lambda: t.id_order.highest(beating_suit)),
+        ]
+        # Default: play_spatz
+        return _apply_rules(rules, default=lambda: t.value_order.lowest(s.valid)), play_color_sau, saus
+
+    def _play_card_batch_solo_not_declaring(self, t: '_RuleTables', s: '_BatchSituation') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Returns the selected cards, the tables that play a random sau instead, and the saus to choose from.
+        own_trumps = s.valid & t.trump_mask
+        non_trumps = s.valid & ~t.trump_mask
+        saus = non_trumps & t.sau_mask
+        has_non_trumps = non_trumps != 0
+        can_beat = s.beating != 0
+
+        # Has the enemy already played their card? They did if they are at most n_trick seats before us.
+        enemy_offset = (self.player_id - s.game_mode.declaring_player_id) % 4
+        enemy_played = ~s.leading & (enemy_offset <= s.n_trick)
+        enemy_card = s.trick_ids[np.arange(s.n), np.maximum(s.n_trick - enemy_offset, 0)]
+        partner_winning = enemy_played & (s.winning_card != enemy_card)
+
+        # If the lowest beating card (by id) is a trump, we can't match the suit.
+        beat_with_trump = can_beat & ((t.trump_mask >> t.id_order.lowest(s.beating)) & 1 == 1)
+        beating_unter = s.valid & t.unter_mask
+
+        play_color_sau = s.leading & (saus != 0)
+        rules = [
+            # play_color_sau (the card is drawn later)
+            (play_color_sau, lambda: 0),
+            # play_spatz
+            (s.leading & has_non_trumps, lambda: t.value_order.lowest(non_trumps)),
+            # play_spatz
+            (s.leading, lambda: t.trump_value_order.lowest(own_trumps)),
+            # schmier_points
+            (partner_winning & has_non_trumps, lambda: t.value_order.highest(non_trumps)),
+            # schmier_trump
+            (partner_winning, lambda: t.trump_value_order.highest(own_trumps)),
+            # beat_expensive
+            (enemy_played & can_beat, lambda: t.value_order.highest(s.beating)),
+            # play_spatz
+            (enemy_played, lambda: t.value_order.lowest(s.valid)),
+            # play_spatz;insult_leader
+            (s.lead_is_trump, lambda: t.value_order.lowest(s.valid)),
+            # beat_with_unter
+            (beat_with_trump & (beating_unter != 0), lambda: t.trump_power_order.lowest(beating_unter)),
+            # beat_expensive
+            (beat_with_trump, lambda: t.value_order.highest(s.beating)),
+            # match_expensive
+            (can_beat, lambda: t.value_order.highest(s.valid)),
+        ]
+        # Default: play_spatz
+        return _apply_rules(rules, default=lambda: t.value_order.lowest(s.valid)), play_color_sau, saus
+
+
+# ========
+# Helper functions for quick comparison of trumps and cards.
+# Orderings of cards (by value, by trump power) are precomputed as "runs": masks of cards whose order agrees with the order of
+# their card ids. This way, the lowest card in a mask is the lowest bit of the first run that contains any of the cards.
+# ========
+
+def _lowest(mask: int, runs: List[int]) -> int:
+    # Returns the id of the lowest card (in the order given by runs) in a non-empty mask.
+    for run in runs:
+        m = mask & run
+        if m:
+            return (m & -m).bit_length() - 1
+    raise ValueError("Empty mask!")
+
+
+def _highest(mask: int, runs: List[int]) -> int:
+    # Returns the id of the highest card (in the order given by runs) in a non-empty mask.
+    for run in reversed(runs):
+        m = mask & run
+        if m:
+            return m.bit_length() - 1
+    raise ValueError("Empty mask!")
+
+
+def _ordered_runs(card_ids: List[int]) -> List[int]:
+    # Splits a list of card ids (ordered by any criterion) into runs of ascending card ids, and returns them as masks.
+    runs = []
+    prev_id = None
+    for card_id in card_ids:
+        if prev_id is None or card_id < prev_id:
+            runs.append(0)
+        runs[-1] |= 1 << card_id
+        prev_id = card_id
+    return runs
+
+
+# Batched versions of the helpers, for play_card_batch().
+
+def _random_card_batch(masks: np.ndarray) -> np.ndarray:
+    # Returns the id of a random card from each of the (non-empty) masks.
+    in_mask = masks_to_bools(masks)
+    i_card = (np.random.random_sample(len(masks)) * in_mask.sum(axis=1)).astype(np.int64)
+    return np.argmax(np.cumsum(in_mask, axis=1) > i_card[:, np.newaxis], axis=1)
+
+
+def _apply_rules(rules: List[Tuple[np.ndarray, Callable[[], Union[np.ndarray, int]]]], default: Callable[[], np.ndarray]) -> np.ndarray:
+    # Selects a card for every table: from the first rule whose condition is True, otherwise from the default.
+    # The card of a rule is only computed if any table takes it.
+    selected = default()
+    undecided = np.ones(len(selected), dtype=bool)
+    for condition, select in rules:
+        tables = undecided & condition
+        if tables.any():
+            card_ids = select()
+            selected[tables] = card_ids if np.isscalar(card_ids) else card_ids[tables]
+            undecided &= ~tables
+    return selected
+
+
+class _BatchSituation:
+    # The situation at N tables (from the point of view of one player), with some quantities that most rules need.
+
+    def __init__(self, t: '_RuleTables', hands: np.ndarray, trick_card_ids: np.ndarray, game_mode: GameMode):
+        self.game_mode = game_mode
+        self.n = len(hands)
+        self.hands = hands
+        self.in_trick = trick_card_ids >= 0
+        self.trick_ids = np.maximum(trick_card_ids, 0)          # Empty slots are replaced by card 0, always use with in_trick.
+        self.n_trick = self.in_trick.sum(axis=1)
+        self.leading = self.n_trick == 0
+        self.lead = self.trick_ids[:, 0]
+        self.lead_is_trump = ~self.leading & ((t.trump_mask >> self.lead) & 1 == 1)
+        self.valid = game_mode.legal_moves_masks(hands, trick_card_ids[:, 0])
+
+        # The card that is currently winning each trick, and all valid cards that would beat it (meaningless when leading).
+        powers = np.where(self.in_trick, t.power_table[self.lead[:, np.newaxis], self.trick_ids], -1)
+        self.winning_card = self.trick_ids[np.arange(self.n), np.argmax(powers, axis=1)]
+        self.beating = self.valid & t.beating_masks_arr[self.lead, self.winning_card]
+
+
+class _BatchOrder:
+    """
+    An ordering of cards, for finding the lowest and highest card in many masks at once.
+    There are lookup tables for the lowest and highest card in each 16-bit half of a mask, so a query is a few array lookups
+    (instead of expanding all masks to 32 bools).
+    """
 
-    def _winning_card(self, cards_in_trick: List[Card], game_mode: GameMode) -> Card:
-        # Gets the winning card out of a trick. The trick can have less than 4 cards.
-        assert any(cards_in_trick)
+    _half_bits = 16
+
+    def __init__(self, cards: List[Card]):
+        # Card id -> position in the list. Index 32 stands for "no card", which loses every comparison.
+        n_deck = len(new_deck())
+        ranks = np.full(n_deck, len(cards), dtype=np.int64)
+        ranks[[c.card_id for c in cards]] = np.arange(len(cards))
+        self._ranks_low = np.append(ranks, n_deck + 1)
+        self._ranks_high = np.append(ranks, -1)
+
+        # For every possible half of a mask: the lowest and highest card (32 if empty).
+        halves = masks_to_bools(np.arange(1 << _BatchOrder._half_bits, dtype=np.int64))[:, :_BatchOrder._half_bits]
+        self._lowest, self._highest = [], []
+        for offset in [0, _BatchOrder._half_bits]:
+            half_ranks = ranks[offset:offset + _BatchOrder._half_bits]
+            lowest = np.argmin(np.where(halves, half_ranks, n_deck + 1), axis=1) + offset
+            highest = np.argmax(np.where(halves, half_ranks, -1), axis=1) + offset
+            self._lowest.append(np.where(np.any(halves, axis=1), lowest, n_deck).astype(np.int8))
+            self._highest.append(np.where(np.any(halves, axis=1), highest, n_deck).astype(np.int8))
+
+    def lowest(self, masks: np.ndarray) -> np.ndarray:
+        """ Returns the ids of the lowest cards in the masks (shape (N,)), or 32 for empty masks. """
+        low = self._lowest[0][masks & 0xFFFF]
+        high = self._lowest[1][masks >> _BatchOrder._half_bits]
+        return np.where(self._ranks_low[low] <= self._ranks_low[high], low, high).astype(np.int64)
+
+    def highest(self, masks: np.ndarray) -> np.ndarray:
+        """ Returns the ids of the highest cards in the masks (shape (N,)), or 32 for empty masks. """
+        low = self._highest[0][masks & 0xFFFF]
+        high = self._highest[1][masks >> _BatchOrder._half_bits]
+        return np.where(self._ranks_high[low] >= self._ranks_high[high], low, high).astype(np.int64)
+
+
+class _RuleTables:
+    """
+    Masks and card orderings for the rules of RuleBasedAgent. They only depend on the trumps of a game mode,
+    so they are created once per contract and trump suit (see for_game_mode()).
+    """
 
-        trumps = self._trumps_by_power(cards_in_trick, game_mode)
-        if any(trumps):
-            # The highest trump wins.
-            return trumps[-1]
-        else:
-            # The highest card of the suit of the first card wins.
-            suit = cards_in_trick[0].suit
-            suit_cards = sorted((c for c in cards_in_trick if c.suit == suit), key=lambda c: self._pip_power[c.pip])
-            return suit_cards[-1]
+    _cache: Dict[Tuple[GameContract, Suit], '_RuleTables'] = {}
+
+    @staticmethod
+    def for_game_mode(game_mode: GameMode) -> '_RuleTables':
+        key = (game_mode.contract, game_mode.trump_suit)
+        tables = _RuleTables._cache.get(key)
+        if tables is None:
+            tables = _RuleTables._cache[key] = _RuleTables(game_mode)
+        return tables
+
+    def __init__(self, game_mode: GameMode):
+        deck = new_deck()
+        self.trump_mask = game_mode.trump_mask
+        self.sau_mask = cards_to_mask(c for c in deck if c.pip == Pip.sau)
+        self.unter_mask = cards_to_mask(c for c in deck if c.pip == Pip.unter)
+
+        # Plain suits and pips (not suit classes like in GameMode, so ober and unter belong to their suit). By card id.
+        # higher_pip_masks[pip]: all cards with a higher pip.
+        self.suit_masks = [cards_to_mask(c2 for c2 in deck if c2.suit == c.suit) for c in deck]
+        self.pips = [c.pip.value for c in deck]
+        self.higher_pip_masks = {pip.value: cards_to_mask(c for c in deck if c.pip > pip) for pip in Pip}
+
+        # Power of each card in a trick, by lead card (see GameMode.power_table).
+        # beating_masks[lead][card]: all cards that would beat the card, in a trick with this lead.
+        self._power_rows = game_mode.power_table.tolist()
+        self.beating_masks = [[cards_to_mask(c2 for c2 in deck if row[c2.card_id] > row[c.card_id]) for c in deck]
+                              for row in self._power_rows]
+
+        # Orderings (see _lowest(), _highest()):
+        # - value_runs: all cards by value. Cards of the same value are ordered by id.
+        # - trump_power_runs: trumps by power (the power of trumps does not depend on the lead card).
+        # - trump_value_runs: trumps by value. Trumps of the same value are ordered by power.
+        trump_power = self._power_rows[0]
+        trumps = [c for c in deck if game_mode.is_trump(c)]
+        self.value_runs = _ordered_runs([c.card_id for c in sorted(deck, key=lambda c: pip_scores[c.pip])])
+        self.trump_power_runs = _ordered_runs([c.card_id for c in sorted(trumps, key=lambda c: trump_power[c.card_id])])
+        self.trump_value_runs = _ordered_runs([c.card_id for c in sorted(trumps, key=lambda c: (pip_scores[c.pip],
+                                                                                                trump_power[c.card_id]))])
+
+        # The same as arrays, for play_card_batch().
+        self.power_table = game_mode.power_table
+        self.beating_masks_arr = np.array(self.beating_masks, dtype=np.int64)
+        self.suit_masks_arr = np.array(self.suit_masks, dtype=np.int64)
+        self.pips_arr = np.array(self.pips, dtype=np.int64)
+        self.higher_pip_masks_arr = np.array([cards_to_mask(c for c in deck if c.pip.value > pip) for pip in range(len(Pip) + 1)],
+                                             dtype=np.int64)
+        self.id_order = _BatchOrder(deck)
+        self.value_order = _BatchOrder(sorted(deck, key=lambda c: pip_scores[c.pip]))
+        self.trump_power_order = _BatchOrder(sorted(trumps, key=lambda c: trump_power[c.card_id]))
+        self.trump_value_order = _BatchOrder(sorted(trumps, key=lambda c: (pip_scores[c.pip], trump_power[c.card_id])))
+
+    def winning_card(self, trick: List[int]) -> int:
+        # Gets the id of the winning card out of a trick (card ids). The trick can have less than 4 cards.
+        powers = self._power_rows[trick[0]]
+        winner = trick[0]
+        for card_id in trick[1:]:
+            if powers[card_id] > powers[winner]:
+                winner = card_id
+        return winner
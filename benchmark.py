@@ -0,0 +1,277 @@
+"""
+Reproducible performance benchmarks for the simulator and the agents.
+
+- Game benchmarks: full games with GameController.run_game(), for several agent combinations (Player 0 vs 3 RuleBasedAgents,
+  like in evaluation.py). All of them play the same games from a deal bank, and the global RNG is reseeded before every run.
+  The "_cached" variants wrap all agents in a CachedAgent (which starts empty in every run).
+- Micro benchmarks: single calls of the hot functions (rule checks, trick winners, dealing, state encoding),
+  on fixed inputs that are derived from the same deals.
+
+Every benchmark is run multiple times and the best time is reported (the others are mostly noise from the machine).
+The results are logged, and optionally appended as a single JSON line to a file (--output), together with the git commit,
+so regressions can be tracked across commits.
+
+The DQNAgent benchmarks need TensorFlow (the checkpoint is loaded from .h5). Use --only to select benchmarks by name.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from timeit import default_timer as timer
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agents.dummy.random_card_agent import RandomCardAgent
+from agents.dummy.static_policy_agent import StaticPolicyAgent
+from agents.reinforcment_learning.dqn_agent import DQNAgent
+from agents.reinforcment_learning.state_encoder import StateEncoder
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.card_defs import Suit
+from simulator.cached_agent import CachedAgent
+from simulator.card_set import cards_to_mask, mask_to_cards
+from simulator.controller.deal_bank import get_deal_bank
+from simulator.controller.dealing_behavior import DealWinnableHand
+from simulator.controller.game_controller import GameController
+from simulator.game_mode import GameContract, GameMode
+from simulator.game_state import Player
+from simulator.player_agent import PlayerAgent
+from utils.config_util import load_config
+from utils.log_util import init_logging, get_class_logger, get_named_logger
+
+_root_dir = os.path.dirname(os.path.realpath(__file__))
+_deal_bank_dir = os.path.join(_root_dir, "deal_banks")
+
+_default_agent_config = os.path.join(_root_dir, "experiments", "dqn_solo_decl_inv_g99_lr0001.yaml")
+_default_checkpoint = os.path.join(_root_dir, "experiments", "dqn_solo_decl_inv_g99_lr0001", "model-p0-0.5342000126838684.h5")
+
+# State contents for the encoder benchmarks (all components).
+_state_contents = ["cards_in_hand", "cards_in_trick", "cards_already_played"]
+
+
+def _bench_game_mode() -> GameMode:
+    # Player 0 always plays a Herz-Solo (same as in evaluation.py).
+    return GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
+
+
+def _time_best(run: Callable[[], None], n_repeats: int, seed: int) -> float:
+    # Runs a benchmark n_repeats times (with the same seed) and returns the best time in seconds.
+    best_s = float("inf")
+    for _ in range(n_repeats):
+        np.random.seed(seed)
+        time_start = timer()
+        run()
+        best_s = min(best_s, timer() - time_start)
+    return best_s
+
+
+def _play_games(agents: List[PlayerAgent], deals: np.ndarray, game_mode: GameMode):
+    # Plays one game per deal, in the same way as evaluation.py.
+    # Caches start empty in every run (otherwise, repeated runs would only measure cache hits).
+    for agent in agents:
+        if isinstance(agent, CachedAgent):
+            agent.clear()
+            agent.reset_stats()
+    players = [Player(f"{i}-{agent.__class__.__name__}", agent=agent) for i, agent in enumerate(agents)]
+    controller = GameController(players, forced_game_mode=game_mode, silent=True)
+    for i_game, deal in enumerate(deals):
+        controller.run_game(deal=deal, i_player_dealer=i_game % 4)
+
+
+def _game_benchmarks(args) -> Dict[str, Tuple[Callable[[], List[PlayerAgent]], int]]:
+    # Name -> (factory of the 4 agents (indexed by player id), number of games).
+    # Training is much slower than playing, so it plays fewer games (the first of the deal bank).
+    def vs_rule(agent_0: Callable[[], PlayerAgent]):
+        return lambda: [agent_0()] + [RuleBasedAgent(i) for i in range(1, 4)]
+
+    def cached(agents: Callable[[], List[PlayerAgent]]):
+        # All agents are cached, with a capacity that is large enough for all positions of the benchmark.
+        return lambda: [CachedAgent(agent, capacity=32 * args.games) for agent in agents()]
+
+    def dqn_agent(training: bool, compiled_train_step: bool = False) -> DQNAgent:
+        config = load_config(args.agent_config)
+        config["agent_config"]["dqn_agent"]["compiled_train_step"] = compiled_train_step
+        agent = DQNAgent(0, config=config, training=training)
+        agent.load_weights(args.checkpoint)
+        return agent
+
+    n_training_games = max(1, args.games // 10)
+    return {
+        "game.random_x4": (lambda: [RandomCardAgent(i) for i in range(4)], args.games),
+        "game.random_vs_rule": (vs_rule(lambda: RandomCardAgent(0)), args.games),
+        "game.static_vs_rule": (vs_rule(lambda: StaticPolicyAgent(0)), args.games),
+        "game.rule_vs_rule": (vs_rule(lambda: RuleBasedAgent(0)), args.games),
+        "game.static_vs_rule_cached": (cached(vs_rule(lambda: StaticPolicyAgent(0))), args.games),
+        "game.rule_vs_rule_cached": (cached(vs_rule(lambda: RuleBasedAgent(0))), args.games),
+        "game.dqn_inference_vs_rule": (vs_rule(lambda: dqn_agent(training=False)), args.games),
+        "game.dqn_training_vs_rule": (vs_rule(lambda: dqn_agent(training=True)), n_training_games),
+        "game.dqn_training_compiled_vs_rule": (vs_rule(lambda: dqn_agent(training=True, compiled_train_step=True)), n_training_games),
+    }
+
+
+def _micro_benchmarks(deals: np.ndarray, game_mode: GameMode, n_calls: int) -> Dict[str, Callable[[], Tuple[Callable[[], None], int]]]:
+    # Name -> function that prepares the inputs and returns (the benchmark, the number of calls it makes).
+    # The inputs are drawn from the deals: hands of all 4 players, with tricks that are made of the other players' cards.
+
+    def situations():
+        # Tuples of (hand, cards in trick, card to play), with all lengths of tricks.
+        np.random.seed(0)
+        result = []
+        for i in range(n_calls):
+            hands = [mask_to_cards(int(mask)) for mask in deals[i % len(deals)]]
+            n_in_trick = i % 4
+            cards_in_trick = [hands[j][np.random.randint(8)] for j in range(n_in_trick)]
+            hand = hands[n_in_trick]
+            result.append((hand, cards_in_trick, hand[np.random.randint(8)]))
+        return result
+
+    def is_play_allowed():
+        inputs = situations()
+
+        def run():
+            for hand, cards_in_trick, card in inputs:
+                game_mode.is_play_allowed(card, cards_in_hand=hand, cards_in_trick=cards_in_trick)
+        return run, len(inputs)
+
+    def get_trick_winner():
+        np.random.seed(0)
+        inputs = []
+        for i in range(n_calls):
+            hands = [mask_to_cards(int(mask)) for mask in deals[i % len(deals)]]
+            inputs.append([hands[j][np.random.randint(8)] for j in range(4)])
+
+        def run():
+            for cards_in_trick in inputs:
+                game_mode.get_trick_winner(cards_in_trick)
+        return run, len(inputs)
+
+    def deal_winnable_hand():
+        # Fewer calls: every deal takes a couple of shuffles.
+        dealer = DealWinnableHand(game_mode)
+        n = n_calls // 10
+
+        def run():
+            for _ in range(n):
+                dealer.deal_hands()
+        return run, n
+
+    def state_encoder_encode():
+        # Whole games from the view of Player 0: the same calls as the DQNAgent makes (see StateEncoder).
+        # Every player plays their cards in order (the encoder does not check the rules).
+        encoder = StateEncoder(_state_contents)
+        games = [[mask_to_cards(int(mask)) for mask in deals[i % len(deals)]] for i in range(n_calls // 8)]
+
+        def run():
+            for hands in games:
+                encoder.new_game()
+                for i_trick in range(8):
+                    i_player_0 = i_trick % 4
+                    cards_in_trick = [hands[j][i_trick] for j in range(4)]
+                    encoder.encode(hands[0][i_trick:], cards_in_trick[:i_player_0])
+                    encoder.card_played(hands[0][i_trick])
+                    encoder.trick_completed(cards_in_trick)
+        return run, 8 * len(games)
+
+    def state_encoder_encode_batch():
+        # The same situations as for is_play_allowed, in batches of 256 (as with BatchGameEnv).
+        encoder = StateEncoder(_state_contents)
+        n_batch = 256
+        inputs = situations()[:n_batch]
+        hand_masks = np.array([cards_to_mask(hand) for hand, _, _ in inputs], dtype=np.int64)
+        cards_in_trick = np.full((n_batch, 3), -1, dtype=np.int64)
+        for i, (_, trick, _) in enumerate(inputs):
+            cards_in_trick[i, :len(trick)] = [c.card_id for c in trick]
+        cards_already_played = np.asarray(deals[np.arange(n_batch) % len(deals), 3], dtype=np.int64)
+        out = np.empty((n_batch, encoder.state_size), dtype=np.int32)
+        n_batches = n_calls // n_batch
+
+        def run():
+            for _ in range(n_batches):
+                encoder.encode_batch(hand_masks, cards_in_trick, cards_already_played, out=out)
+        return run, n_batches * n_batch
+
+    return {
+        "micro.is_play_allowed": is_play_allowed,
+        "micro.get_trick_winner": get_trick_winner,
+        "micro.deal_winnable_hand": deal_winnable_hand,
+        "micro.state_encoder_encode": state_encoder_encode,
+        "micro.state_encoder_encode_batch": state_encoder_encode_batch,
+    }
+
+
+def _git_info() -> Dict[str, Optional[str]]:
+    # Commit and dirty flag of the working tree, if available.
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=_root_dir, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=_root_dir, capture_output=True,
+                                text=True, check=True).stdout
+        return {"commit": commit, "dirty": len(status.strip()) > 0}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", help="Number of games per game benchmark.", type=int, default=500)
+    parser.add_argument("--calls", help="Number of calls per micro benchmark.", type=int, default=20000)
+    parser.add_argument("--repeats", help="Number of runs per benchmark (the best one counts).", type=int, default=3)
+    parser.add_argument("--seed", help="Random seed for the deals and the agents.", type=int, default=0)
+    parser.add_argument("--only", help="Only run the benchmarks whose names contain any of these strings.", nargs="+")
+    parser.add_argument("--output", help="Optional: append the results as a JSON line to this file.")
+    parser.add_argument("--agent-config", help="Config for the DQNAgent benchmarks.", default=_default_agent_config)
+    parser.add_argument("--checkpoint", help="Checkpoint (.h5) for the DQNAgent benchmarks.", default=_default_checkpoint)
+    args = parser.parse_args()
+
+    # Init logging and adjust log levels for some classes.
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+    get_class_logger(GameController).setLevel(logging.INFO)     # Don't log specifics of a single game
+
+    def selected(name: str) -> bool:
+        return args.only is None or any(s in name for s in args.only)
+
+    game_mode = _bench_game_mode()
+    deals = np.asarray(get_deal_bank(_deal_bank_dir, game_mode, args.games, seed=args.seed))
+
+    results = []
+    for name, (create_agents, n_games) in _game_benchmarks(args).items():
+        if not selected(name):
+            continue
+        agents = create_agents()
+        best_s = _time_best(lambda: _play_games(agents, deals[:n_games], game_mode), args.repeats, args.seed)
+        results.append({"name": name, "n": n_games, "unit": "games/s", "best_s": best_s, "rate": n_games / best_s})
+        logger.info("{}: {:.1f} games/second.".format(name, n_games / best_s))
+        if any(isinstance(agent, CachedAgent) for agent in agents):
+            results[-1]["cache_hit_rates"] = [agent.hit_rate for agent in agents]
+            logger.info("{}: cache hit rates {}.".format(name, ", ".join("{:.1%}".format(agent.hit_rate) for agent in agents)))
+
+    for name, prepare in _micro_benchmarks(deals, game_mode, args.calls).items():
+        if not selected(name):
+            continue
+        run, n = prepare()
+        best_s = _time_best(run, args.repeats, args.seed)
+        results.append({"name": name, "n": n, "unit": "calls/s", "best_s": best_s, "rate": n / best_s})
+        logger.info("{}: {:.0f} calls/second.".format(name, n / best_s))
+
+    if args.output is not None:
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            **_git_info(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "argv": sys.argv[1:],
+            "results": results,
+        }
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        logger.info(f'Appended results to "{args.output}".')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ This script doesn't need an agent config because all the baseline agents are sel
 import argparse
 import logging
 import os
+from functools import partial
 
 from agents.dummy.random_card_agent import RandomCardAgent
 from agents.dummy.static_policy_agent import StaticPolicyAgent
@@ -19,6 +20,10 @@ from utils.log_util import init_logging, get_class_logger, get_named_logger
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--p0-agent", type=str, choices=['static', 'rule', 'random'], required=True)
+    parser.add_argument("--workers", help="Number of worker processes for the evaluation.", type=int, default=1)
+    parser.add_argument("--profile", help="If set, logs how much time is spent in each phase of the games.", action="store_true")
+    parser.add_argument("--cache-size", help="If > 0, caches the decisions of all cacheable players (this many positions per player).",
+                        type=int, default=0)
     args = parser.parse_args()
     agent_choice = args.p0_agent
 
@@ -27,16 +32,16 @@ def main():
     logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
     get_class_logger(GameController).setLevel(logging.INFO)     # Don't log specifics of a single game
 
-    # Create the agent for Player 0.
+    # Create the agent for Player 0 (every eval worker creates its own).
     if agent_choice == "rule":
-        agent = RuleBasedAgent(0)
+        agent_class = RuleBasedAgent
     elif agent_choice == "static":
-        agent = StaticPolicyAgent(0)
+        agent_class = StaticPolicyAgent
     else:
-        agent = RandomCardAgent(0)
+        agent_class = RandomCardAgent
 
-    logger.info(f'Evaluating agent "{agent.__class__.__name__}"')
-    perf = eval_agent(agent)
+    logger.info(f'Evaluating agent "{agent_class.__name__}"')
+    perf = eval_agent(partial(agent_class, 0), n_workers=args.workers, profile=args.profile, cache_size=args.cache_size)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,236 @@
+"""
+A persistent queue of checkpoints to evaluate, shared by the trainer and any number of eval_rl_agent.py instances.
+
+- The trainer writes a checkpoint to a new file and submits it. Older checkpoints of the same agent that are still pending are
+  superseded (the evaluators should always work on the latest one).
+- Evaluators lease a job, which gives them exclusive ownership of the checkpoint file. While evaluating, they renew the lease
+  with heartbeats (see keep_alive()). If an evaluator dies, its lease expires and another one takes over the job.
+- When done, the evaluator stores the result. All results are kept in a table, so the best checkpoint so far is a single
+  index lookup (best_result()), instead of parsing the file names of all checkpoints.
+
+Evaluators don't need to check the queue in a loop: submit() (and release()) wake up the evaluators that are waiting for a job
+(see wakeup_channel). Only the leases of dead evaluators expire without a wakeup, so waiting evaluators also check the queue
+once per lease period.
+
+Everything is stored in a single SQLite file in the experiment dir, and all changes are done in transactions, so there are no races
+between processes. This relies on file locks, which don't work reliably on network filesystems (NFS), so all processes of an
+experiment must run on the same machine. On the cluster, they are started as a single job (see _cluster_experiment.sh).
+"""
+
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from utils.wakeup_util import wake_up
+
+
+class EvalJob(NamedTuple):
+    job_id: int
+    agent_id: int
+    checkpoint: str
+
+
+class LeaseLostException(Exception):
+    # Raised when a job was taken over by another evaluator (because this one did not renew the lease in time).
+    pass
+
+
+class EvalQueue:
+    """
+    Job queue and results table for the evaluation of checkpoints (see module docstring).
+    """
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY,
+            agent_id INTEGER NOT NULL,
+            checkpoint TEXT NOT NULL,
+            status TEXT NOT NULL,               -- pending, running, done, superseded, failed
+            n_attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            time_submitted REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id);
+
+        CREATE TABLE IF NOT EXISTS results (
+            result_id INTEGER PRIMARY KEY,
+            agent_id INTEGER NOT NULL,
+            source TEXT NOT NULL,               -- What was evaluated (the submitted checkpoint, or another description)
+            checkpoint TEXT,                    -- Where the weights were kept (only for a new best), otherwise NULL
+            perf REAL NOT NULL,
+            time_finished REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS results_perf ON results (agent_id, perf);
+        CREATE INDEX IF NOT EXISTS results_checkpoint ON results (checkpoint);
+    """
+
+    def __init__(self, db_path: str, lease_s: float = 60., max_attempts: int = 3, worker_id: str = None):
+        """
+        Opens the queue, and creates it if it does not exist.
+        :param db_path: path of the SQLite file (e.g. in the experiment dir).
+        :param lease_s: a leased job is given to another evaluator if there was no heartbeat for this long.
+        :param max_attempts: a job is marked as failed after it was leased this many times without being completed.
+        :param worker_id: Optional - identifies this process as the owner of leases. Default: hostname and pid.
+        """
+        self.db_path = db_path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id if worker_id is not None else f"{socket.gethostname()}-pid{os.getpid()}"
+
+        self._conn = self._connect()
+        # The classic rollback journal. WAL would let readers run in parallel to the writer, but it also needs shared memory
+        # between the processes, and it converts the file for good (so this also switches back files that were created with WAL).
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._transaction() as c:
+            for statement in EvalQueue._schema.split(";"):
+                c.execute(statement)
+
+    @property
+    def wakeup_channel(self) -> str:
+        """ The channel that is woken up whenever a job becomes available (see wakeup_util.py). Same for all processes of the queue. """
+        return "alphasheep-queue-" + hashlib.sha1(os.path.abspath(self.db_path).encode()).hexdigest()[:16]
+
+    def _connect(self) -> sqlite3.Connection:
+        # Transactions are started explicitly (see _transaction()).
+        return sqlite3.connect(self.db_path, timeout=30., isolation_level=None)
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection = None):
+        # Takes the write lock immediately, so the reads within the transaction are consistent with the writes.
+        conn = conn if conn is not None else self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+    def submit(self, agent_id: int, checkpoint: str, supersede: bool = True) -> List[str]:
+        """
+        Adds a checkpoint to the queue. From now on, the checkpoint file belongs to the queue (don't overwrite it).
+        :param supersede: If True, pending jobs of the same agent are cancelled.
+        :return: the checkpoints of the jobs that were superseded. Their files are not needed anymore.
+        """
+        with self._transaction() as c:
+            superseded = []
+            if supersede:
+                superseded = [cp for cp, in c.execute("SELECT checkpoint FROM jobs WHERE status = 'pending' AND agent_id = ?",
+                                                      (agent_id,))]
+                c.execute("UPDATE jobs SET status = 'superseded' WHERE status = 'pending' AND agent_id = ?", (agent_id,))
+            c.execute("INSERT INTO jobs (agent_id, checkpoint, status, time_submitted) VALUES (?, ?, 'pending', ?)",
+                      (agent_id, checkpoint, time()))
+        wake_up(self.wakeup_channel)
+        return superseded
+
+    def lease(self) -> Optional[EvalJob]:
+        """
+        Takes the oldest pending job (or one whose lease has expired), and leases it to this worker.
+        :return: the job, or None if there is nothing to do.
+        """
+        now = time()
+        with self._transaction() as c:
+            # Jobs of dead evaluators go back into the queue - unless they have failed too often.
+            c.execute("UPDATE jobs SET status = CASE WHEN n_attempts >= ? THEN 'failed' ELSE 'pending' END, lease_owner = NULL "
+                      "WHERE status = 'running' AND lease_expires < ?", (self.max_attempts, now))
+
+            row = c.execute("SELECT job_id, agent_id, checkpoint FROM jobs WHERE status = 'pending' ORDER BY job_id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            c.execute("UPDATE jobs SET status = 'running', n_attempts = n_attempts + 1, lease_owner = ?, lease_expires = ? "
+                      "WHERE job_id = ?", (self.worker_id, now + self.lease_s, row[0]))
+        return EvalJob(*row)
+
+    def heartbeat(self, job: EvalJob, conn: sqlite3.Connection = None):
+        """
+        Renews the lease of a job. Raises LeaseLostException if the job is not leased to this worker anymore.
+        """
+        with self._transaction(conn) as c:
+            self._check_lease(c, job)
+            c.execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ?", (time() + self.lease_s, job.job_id))
+
+    def _check_lease(self, c: sqlite3.Connection, job: EvalJob):
+        row = c.execute("SELECT status, lease_owner FROM jobs WHERE job_id = ?", (job.job_id,)).fetchone()
+        if row is None or row[0] != "running" or row[1] != self.worker_id:
+            raise LeaseLostException(f'Job {job.job_id} ("{job.checkpoint}") is not leased to {self.worker_id} anymore.')
+
+    @contextmanager
+    def keep_alive(self, job: EvalJob):
+        """
+        Context manager that sends heartbeats for a job (from a background thread), as long as the context is active.
+        """
+        stop = threading.Event()
+
+        def run():
+            # SQLite connections can't be shared between threads.
+            conn = self._connect()
+            try:
+                while not stop.wait(self.lease_s / 4):
+                    self.heartbeat(job, conn)
+            except LeaseLostException:
+                pass                # Noticed by complete()
+            finally:
+                conn.close()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self, job: EvalJob):
+        """ Gives a leased job back to the queue, e.g. if the evaluation has failed. """
+        with self._transaction() as c:
+            c.execute("UPDATE jobs SET status = CASE WHEN n_attempts >= ? THEN 'failed' ELSE 'pending' END, lease_owner = NULL "
+                      "WHERE job_id = ? AND status = 'running' AND lease_owner = ?", (self.max_attempts, job.job_id, self.worker_id))
+        wake_up(self.wakeup_channel)
+
+    def complete(self, job: EvalJob, perf: float, best_checkpoint: str) -> bool:
+        """
+        Marks a leased job as done and stores its result. Raises LeaseLostException if the job is not leased to this worker anymore.
+        :param perf: the performance of the checkpoint.
+        :param best_checkpoint: where the caller will keep the checkpoint, if it is the new best.
+        :return: True if the checkpoint is the new best of its agent. Then, the caller must move it to best_checkpoint.
+                 Otherwise, the checkpoint file can be removed.
+        """
+        with self._transaction() as c:
+            self._check_lease(c, job)
+            c.execute("UPDATE jobs SET status = 'done', lease_owner = NULL WHERE job_id = ?", (job.job_id,))
+            return self._record_result(c, job.agent_id, job.checkpoint, perf, best_checkpoint)
+
+    def record_result(self, agent_id: int, source: str, perf: float, best_checkpoint: Optional[str]) -> bool:
+        """
+        Stores a result that does not belong to a job (e.g. weights that were received via shared memory, see complete()).
+        :param source: a description of what was evaluated.
+        """
+        with self._transaction() as c:
+            return self._record_result(c, agent_id, source, perf, best_checkpoint)
+
+    def _record_result(self, c: sqlite3.Connection, agent_id: int, source: str, perf: float, best_checkpoint: Optional[str]) -> bool:
+        best = self._best_result(c, agent_id)
+        is_best = best is None or perf > best[1]
+        c.execute("INSERT INTO results (agent_id, source, checkpoint, perf, time_finished) VALUES (?, ?, ?, ?, ?)",
+                  (agent_id, source, best_checkpoint if is_best else None, perf, time()))
+        return is_best
+
+    def best_result(self, agent_id: int) -> Optional[Tuple[str, float]]:
+        """
+        :return: a tuple of (checkpoint, perf) of the best result of an agent, or None if there are no results yet.
+        """
+        return self._best_result(self._conn, agent_id)
+
+    @staticmethod
+    def _best_result(c: sqlite3.Connection, agent_id: int) -> Optional[Tuple[str, float]]:
+        # Served by the index on (agent_id, perf).
+        return c.execute("SELECT checkpoint, perf FROM results WHERE agent_id = ? ORDER BY perf DESC LIMIT 1", (agent_id,)).fetchone()
@@ -1,25 +1,74 @@
 """
 Evaluates the winrate of RL agents that are specified in the training section of a config file.
 
-- This script runs in an endless loop, looking for new checkpoints in the experiment dir.
-- As the evaluation is not parallelized at all (sorry), it can take some time.
-- For this reason, you can run multiple instances in parallel, each evaluating on a single CPU core.
-    Or GPU, if you like, but the network is way too small :)
+- This script runs in an endless loop, taking new checkpoints from the evaluation queue of the experiment (see eval_queue.py)
+    as soon as the trainer submits them. The queue needs working file locks, so run it on the same machine as the trainer.
+- The evaluation of a single checkpoint can be spread over multiple worker processes (--workers).
+- You can also run multiple instances in parallel, each evaluating a different checkpoint.
+    Or use a GPU, if you like, but the network is way too small :)
+- If the trainer runs on the same machine, it can publish its weights via shared memory instead (--channel=shared_memory,
+    and eval_channel=shared_memory in the training config). Then, new weights are picked up immediately. In this mode,
+    every instance evaluates every version of the weights, so use one instance with many workers.
+- All results are stored in the queue, and the best checkpoint is kept as "[checkpoint name]-[winrate].h5" (or .npz).
 """
 
 import glob
 import re
+from functools import partial
 from time import sleep
+from typing import Callable, Dict
 
 import argparse
 import logging
 import os
 
 from agents.reinforcment_learning.dqn_agent import DQNAgent
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from agents.reinforcment_learning.shared_weights import SharedWeights
+from eval_queue import EvalQueue, LeaseLostException
 from simulator.controller.game_controller import GameController
 from evaluation import eval_agent
 from utils.log_util import init_logging, get_class_logger, get_named_logger
 from utils.config_util import load_config
+from utils.wakeup_util import WakeupListener
+
+
+def create_dqn_agent(config: Dict, checkpoint_path: str) -> DQNAgent:
+    # Module-level function, so it can be pickled and sent to eval workers.
+    agent = DQNAgent(0, config=config, training=False)
+    agent.load_weights(checkpoint_path)
+    return agent
+
+
+def create_dqn_agent_from_network(config: Dict, network: NumpyMLP) -> DQNAgent:
+    # Same as create_dqn_agent(), for weights that were received via shared memory.
+    agent = DQNAgent(0, config=config, training=False)
+    agent.set_inference_network(network)
+    return agent
+
+
+def import_previous_results(queue: EvalQueue, agent_id: int, cp_path: str):
+    # Experiments from before the evaluation queue only have their best checkpoints on disk, with the winrate in the file name.
+    # Add them to the results, so they are still taken into account.
+    base = os.path.splitext(cp_path)[0]
+    for cp in glob.glob("{}-*.h5".format(base)) + glob.glob("{}-*.npz".format(base)):
+        perf_str = re.findall(r"{}-(.*)\.(?:h5|npz)$".format(re.escape(os.path.basename(base))), cp)
+        if len(perf_str) > 0:
+            queue.record_result(agent_id, cp, float(perf_str[0]), best_checkpoint=cp)
+
+
+def eval_checkpoint(agent_factory: Callable[[], DQNAgent], queue: EvalQueue, agent_id: int, args, logger) -> float:
+    # Evaluates an agent, and returns its performance.
+
+    # With --early-stop, the evaluation is cut short if the new checkpoint is clearly worse than the best previous one.
+    best = queue.best_result(agent_id)
+    if best is not None:
+        logger.info("Previously best checkpoint has performance {}".format(best[1]))
+    else:
+        logger.info("Did not find any previous results.")
+    stop_if_below = best[1] if args.early_stop and best is not None else None
+
+    return eval_agent(agent_factory, n_workers=args.workers, stop_if_below=stop_if_below, profile=args.profile, cache_size=args.cache_size)
 
 
 def main():
@@ -27,6 +76,15 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", help="A yaml config file. Must always be specified.", required=True)
     parser.add_argument("--loop", help="If set, then runs in an endless loop.", required=False, action="store_true")
+    parser.add_argument("--workers", help="Number of worker processes for the evaluation.", type=int, default=1)
+    parser.add_argument("--early-stop", help="If set, stops evaluating a checkpoint as soon as it is clearly worse than the best one.",
+                        required=False, action="store_true")
+    parser.add_argument("--profile", help="If set, logs how much time is spent in each phase of the games.", action="store_true")
+    parser.add_argument("--cache-size", help="If > 0, caches the decisions of all cacheable players (this many positions per player).",
+                        type=int, default=0)
+    parser.add_argument("--channel", help="How to receive new weights from the trainer. Use shared_memory if the trainer runs on the "
+                                          "same machine with eval_channel=shared_memory.",
+                        choices=["file", "shared_memory"], default="file")
     args = parser.parse_args()
     do_loop = args.loop is True
 
@@ -44,69 +102,109 @@ def main():
         sleep(10)
 
     agent_checkpoint_paths = {i: os.path.join(experiment_dir, name) for i, name in config["training"]["agent_checkpoint_names"].items()}
-
-    while True:
-        # Wait until a ".for_eval" checkpoint exists (for any of possibly multiple agents). Then rename it to ".in_eval.[uniqueid]".
-        # In this way, multiple eval scripts can run in parallel.
-        # When the evaluation is done, we will rename it to ".{score}".
-
-        for i_agent, cp_path in agent_checkpoint_paths.items():
-            # If multiple agents are specified in the config, evaluate all of them.
-
-            checkpoint_path_in = f"{os.path.splitext(cp_path)[0]}.for_eval.h5"
-            checkpoint_path_tmp = f"{os.path.splitext(cp_path)[0]}.in_eval.pid{os.getpid()}.h5"
-            if os.path.exists(checkpoint_path_in):
-                # Load the latest checkpoint and evaluate it
-
-                try:
-                    os.rename(checkpoint_path_in, checkpoint_path_tmp)
-                    logger.info('Found a new checkpoint, evaluating...')
-
-                    # Create agent
-                    agent_type = config["training"]["player_agents"][i_agent]
-                    if agent_type == "DQNAgent":
-                        alphasheep_agent = DQNAgent(0, config=config, training=False)
-                    else:
-                        raise ValueError(f"Unknown agent type specified: {agent_type}")
-                    alphasheep_agent.load_weights(checkpoint_path_tmp)
-
-                    # Eval agent
-                    current_perf = eval_agent(alphasheep_agent)
-
-                    # Now we know the performance. Find best-performing previous checkpoint that exists on disk
-                    logger.info("Comparing performance to previous checkpoints...")
-                    splitext = os.path.splitext(cp_path)
-                    checkpoints = glob.glob("{}-*{}".format(splitext[0], splitext[1]))
-                    best_perf = 0.
-                    for cp in checkpoints:
-                        perf_str = re.findall(r"{}-(.*){}".format(os.path.basename(splitext[0]), splitext[1]), cp)
-                        if len(perf_str) > 0:
-                            p = float(perf_str[0])
-                            if p > best_perf:
-                                best_perf = p
-
-                    if best_perf > 0:
-                        logger.info("Previously best checkpoint has performance {}".format(best_perf))
-                    else:
-                        logger.info("Did not find any previous results.")
-
-                    if current_perf > best_perf:
-                        best_perf = current_perf
+    for i_agent in agent_checkpoint_paths:
+        agent_type = config["training"]["player_agents"][i_agent]
+        if agent_type != "DQNAgent":
+            raise ValueError(f"Unknown agent type specified: {agent_type}")
+
+    # The queue is shared with the trainer and all other eval instances. It also holds the results.
+    queue = EvalQueue(os.path.join(experiment_dir, "eval_queue.sqlite"))
+    for i_agent, cp_path in agent_checkpoint_paths.items():
+        if queue.best_result(i_agent) is None:
+            import_previous_results(queue, i_agent, cp_path)
+
+    # Weights can be received via files (default), or via shared memory from a trainer on the same machine (--channel=shared_memory).
+    # Either way, we sleep until the trainer wakes us up: because it has submitted a checkpoint, or published new weights.
+    # The listener is created before we check for the first time, so no wakeup is missed.
+    if args.channel == "shared_memory":
+        listener = WakeupListener(*[SharedWeights.wakeup_channel(SharedWeights.name_for_checkpoint(cp_path))
+                                    for cp_path in agent_checkpoint_paths.values()])
+    else:
+        listener = WakeupListener(queue.wakeup_channel)
+    shared_weights_seen = {i: (None, 0) for i in agent_checkpoint_paths}      # Segment id and version of the last evaluated weights
+
+    try:
+        while True:
+            if args.channel == "shared_memory":
+                for i_agent, cp_path in agent_checkpoint_paths.items():
+                    # If multiple agents are specified in the config, evaluate all of them.
+                    # Evaluate the latest weights, if the trainer has published new ones. Attach every time, because the segment
+                    # is replaced when the trainer is restarted (then, its versions start from scratch).
+                    try:
+                        shared_weights = SharedWeights.attach(SharedWeights.name_for_checkpoint(cp_path), track=False)
+                    except FileNotFoundError:
+                        continue
+                    try:
+                        seen_segment_id, seen_version = shared_weights_seen[i_agent]
+                        if shared_weights.segment_id != seen_segment_id:
+                            logger.info("Connected to the trainer.")
+                            seen_version = 0
+                        network, version = shared_weights.read(newer_than=seen_version)
+                        shared_weights_seen[i_agent] = (shared_weights.segment_id, version)
+                    finally:
+                        shared_weights.close()
+                    if network is None:
+                        continue
+                    logger.info(f'Received new weights (version {version}), evaluating...')
+
+                    # Every eval worker creates its own agent from the weights. If they perform best, save them (exported format).
+                    current_perf = eval_checkpoint(partial(create_dqn_agent_from_network, config, network), queue, i_agent, args, logger)
+                    cp_best = "{}-{}.npz".format(os.path.splitext(cp_path)[0], str(current_perf))
+                    if queue.record_result(i_agent, f"shared memory, version {version}", current_perf, best_checkpoint=cp_best):
                         logger.info("Found new best-performing checkpoint!")
-                        cp_best = "{}-{}{}".format(splitext[0], str(best_perf), splitext[1])
-
-                        os.rename(checkpoint_path_tmp, cp_best)
-
-                except OSError:
-                    # Probably a concurrent rename by another worker; continue and try again.
-                    logger.exception("Could not rename checkpoint!")
-
-        logger.info("Waiting...")
-        sleep(10)
-
-        if not do_loop:
-            # Run only once.
-            return
+                        create_dqn_agent_from_network(config, network).save_weights(cp_best)
+
+                if not do_loop:
+                    # Run only once.
+                    return
+
+                # Sleep until the trainer publishes new weights.
+                listener.wait()
+                continue
+
+            # Take the next checkpoint from the queue. While we hold the lease, no other eval instance will touch it.
+            job = queue.lease()
+            if job is None:
+                if not do_loop:
+                    # Run until the queue is empty.
+                    return
+
+                # Sleep until a checkpoint is submitted. Jobs of dead evaluators become available without a wakeup,
+                # when their lease expires - so check again after a lease period, at the latest.
+                listener.wait(timeout=queue.lease_s)
+                continue
+
+            logger.info(f'Evaluating "{job.checkpoint}"...')
+            try:
+                with queue.keep_alive(job):
+                    # Eval agent. Every eval worker creates its own agent and loads the checkpoint.
+                    # The checkpoint is exported first, so the workers can load it quickly and without TensorFlow.
+                    checkpoint_path_npz = f"{os.path.splitext(job.checkpoint)[0]}.pid{os.getpid()}.npz"
+                    create_dqn_agent(config, job.checkpoint).save_weights(checkpoint_path_npz)
+                    try:
+                        current_perf = eval_checkpoint(partial(create_dqn_agent, config, checkpoint_path_npz), queue, job.agent_id,
+                                                       args, logger)
+                    finally:
+                        os.remove(checkpoint_path_npz)
+
+                # Store the result. If it is the best checkpoint so far, keep it, otherwise it is not needed anymore.
+                splitext = os.path.splitext(agent_checkpoint_paths[job.agent_id])
+                cp_best = "{}-{}{}".format(splitext[0], str(current_perf), splitext[1])
+                if queue.complete(job, current_perf, best_checkpoint=cp_best):
+                    logger.info("Found new best-performing checkpoint!")
+                    os.rename(job.checkpoint, cp_best)
+                else:
+                    os.remove(job.checkpoint)
+
+            except LeaseLostException:
+                # We were too slow, and another eval instance has taken over.
+                logger.exception("Lost the lease for the checkpoint!")
+            except BaseException:
+                queue.release(job)
+                raise
+
+    finally:
+        listener.close()
 
 
 if __name__ == '__main__':
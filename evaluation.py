@@ -1,78 +1,210 @@
+import math
+import multiprocessing
 import numpy as np
 import os
+from functools import partial
 from timeit import default_timer as timer
+from typing import Callable, Optional, Tuple, Union
 
 from simulator.player_agent import PlayerAgent
 from agents.rule_based.rule_based_agent import RuleBasedAgent
-from simulator.controller.dealing_behavior import DealWinnableHand, DealExactly
+from simulator.cached_agent import CachedAgent
+from simulator.controller.deal_bank import get_deal_bank
 from simulator.controller.game_controller import GameController
+from simulator.controller.game_profiler import GameProfiler
 from simulator.card_defs import Suit
 from simulator.game_mode import GameMode, GameContract
 from simulator.game_state import Player
 from utils.log_util import get_named_logger
 
 
-def eval_agent(agent: PlayerAgent) -> float:
+# The games are split into shards of fixed size, each with its own random seed. The shards are independent from each other,
+# so the result is the same no matter how many worker processes are used.
+_n_games = 20000
+_n_games_per_shard = 500
+
+# All agents are evaluated on the same pre-dealt games, which are stored in a deal bank and created on first use.
+_deal_bank_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "deal_banks")
+
+# Each worker process creates its own agent (once) and keeps it here.
+# The same goes for the GameController and the players, which are reused for all games (see _worker_game_controller()).
+_worker_agent = None
+_worker_controller = None
+
+
+def eval_agent(agent: Union[PlayerAgent, Callable[[], PlayerAgent]], n_workers: int = 1, seed: int = 0,
+               stop_if_below: Optional[float] = None, confidence: float = 0.99, profile: bool = False, cache_size: int = 0) -> float:
     """
     Evaluates an agent by playing a large number of games against 3 RuleBasedAgents.
 
-    :param agent: The agent to evaluate.
-    :return: The mean win rate of the agent.
+    :param agent: The agent to evaluate (as Player 0), or a picklable factory that creates it (e.g. functools.partial).
+                  A factory is required for n_workers > 1, since every worker process needs its own agent.
+    :param n_workers: Number of worker processes. If 1, all games are played in this process.
+    :param seed: Random seed for dealing and agent decisions. For the same seed, the result does not depend on n_workers.
+    :param stop_if_below: Optional - a win rate to compare against (e.g. the best previous checkpoint). The evaluation stops early
+                          as soon as the agent's win rate is known to be lower, with the given confidence.
+                          Agents that might be better are always evaluated on all games.
+    :param confidence: Confidence for stop_if_below.
+    :param profile: If True, all games are profiled (see GameProfiler), and the report is logged at the end.
+    :param cache_size: If > 0, the decisions of all cacheable players are cached (see CachedAgent), with this many positions
+                       per player. The hit rates are logged at the end. To keep the result independent of n_workers,
+                       the caches are cleared for every shard.
+    :return: The mean win rate of the agent (over all games that were played).
     """
 
     logger = get_named_logger("{}.eval_agent".format(os.path.splitext(os.path.basename(__file__))[0]))
     # logger.setLevel(logging.DEBUG)
 
-    # Main set of players
-    players = [
-        Player("0-agent", agent=agent),
-        Player("1-Zenzi", agent=RuleBasedAgent(1)),
-        Player("2-Franz", agent=RuleBasedAgent(2)),
-        Player("3-Andal", agent=RuleBasedAgent(3))
-    ]
+    # Make sure the deal bank exists before the workers start (they would all try to create it).
+    get_deal_bank(_deal_bank_dir, _eval_game_mode(), _n_games, seed=seed)
+
+    n_shards = _n_games // _n_games_per_shard
+    perf_record = np.empty(_n_games, dtype=np.float32)
+
+    time_start = timer()
+
+    n_games_played = 0
+
+    profiler = GameProfiler() if profile else None
+    cache_stats = np.zeros((4, 2), dtype=np.int64)         # Hits and misses of the players' caches
+
+    def record_shard(i_shard, shard_result) -> bool:
+        # Stores the results of a shard, and returns True if we can stop early.
+        nonlocal n_games_played
+        shard_perf, shard_profiler, shard_cache_stats = shard_result
+        if profiler is not None:
+            profiler.merge(shard_profiler)
+        cache_stats[:] += shard_cache_stats
+        n_games_played = (i_shard + 1) * _n_games_per_shard
+        perf_record[i_shard * _n_games_per_shard:n_games_played] = shard_perf
+        s_elapsed = timer() - time_start
+        mean_perf = np.mean(perf_record[:n_games_played])
+        logger.info("Ran {} games. Mean agent winrate={:.3f}. "
+                    "Speed is {:.1f} games/second.".format(n_games_played, mean_perf, n_games_played/s_elapsed))
+
+        if stop_if_below is not None and n_games_played < _n_games:
+            # Hoeffding bound for the mean of n values in [0, 1]. We check after every shard, so the error probability
+            # is split among all checks (union bound). This way, the bound is valid no matter when we stop.
+            upper_bound = mean_perf + math.sqrt(math.log(n_shards / (1. - confidence)) / (2 * n_games_played))
+            if upper_bound < stop_if_below:
+                logger.info("Stopping early: agent winrate is below {:.3f} (upper bound={:.3f}).".format(stop_if_below, upper_bound))
+                return True
+        return False
+
+    if n_workers == 1:
+        global _worker_agent, _worker_controller
+        _worker_agent = agent if isinstance(agent, PlayerAgent) else agent()
+        try:
+            for i_shard in range(n_shards):
+                if record_shard(i_shard, _eval_shard(i_shard, seed=seed, profile=profile, cache_size=cache_size)):
+                    break
+        finally:
+            _worker_agent = None
+            _worker_controller = None
+    else:
+        if isinstance(agent, PlayerAgent):
+            raise ValueError("Need an agent factory to evaluate with multiple workers.")
+
+        # Using spawn instead of fork, because TensorFlow does not like to be forked.
+        logger.info(f"Evaluating with {n_workers} worker processes.")
+        with multiprocessing.get_context("spawn").Pool(n_workers, initializer=_init_worker, initargs=(agent,)) as pool:
+            eval_shard = partial(_eval_shard, seed=seed, profile=profile, cache_size=cache_size)
+            for i_shard, shard_result in enumerate(pool.imap(eval_shard, range(n_shards))):
+                if record_shard(i_shard, shard_result):
+                    break
+
+    s_elapsed = timer() - time_start
+    mean_perf = np.mean(perf_record[:n_games_played]).item()
+    logger.info("Finished evaluation. Took {:.0f} seconds.".format(s_elapsed))
+    logger.info("Mean agent winrate={:.3f}.".format(mean_perf))
+    if profiler is not None:
+        logger.info(profiler.report("Profile of all games (summed over all workers)"))
+    if cache_size > 0:
+        logger.info("Policy cache hit rates: {}.".format(", ".join(
+            "Player {}: {:.1%}".format(i, n_hits / (n_hits + n_misses)) for i, (n_hits, n_misses) in enumerate(cache_stats)
+            if n_hits + n_misses > 0)))
+
+    return mean_perf
+
 
-    # Rig the game so Player 0 has the cards to play a Herz-Solo.
-    game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
-    rng_dealer = DealWinnableHand(game_mode)
+def _eval_game_mode() -> GameMode:
+    # Player 0 always plays a Herz-Solo.
+    return GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
 
-    # Run 20k different games. Each game can be replicated (via DealExactly) and sampled multiple times.
+
+def _init_worker(agent_factory: Callable[[], PlayerAgent]):
+    global _worker_agent
+    _worker_agent = agent_factory()
+
+
+def _worker_game_controller(cache_size: int) -> GameController:
+    # Creates the GameController of this process on first use: the agent of this process vs 3 RuleBasedAgents.
+    # The RuleBasedAgents have no state of their own (they use the global RNG), so they can play all games.
+    # If cache_size > 0, all cacheable agents are wrapped in a CachedAgent.
+    global _worker_controller
+    if _worker_controller is None:
+        def cached(agent: PlayerAgent) -> PlayerAgent:
+            return CachedAgent(agent, capacity=cache_size) if cache_size > 0 and agent.cacheable else agent
+
+        players = [
+            Player("0-agent", agent=cached(_worker_agent)),
+            Player("1-Zenzi", agent=cached(RuleBasedAgent(1))),
+            Player("2-Franz", agent=cached(RuleBasedAgent(2))),
+            Player("3-Andal", agent=cached(RuleBasedAgent(3)))
+        ]
+        # Games are always dealt from the deal bank (see _eval_shard()).
+        _worker_controller = GameController(players, forced_game_mode=_eval_game_mode(), silent=True)
+    return _worker_controller
+
+
+def _eval_shard(i_shard: int, seed: int, profile: bool = False,
+                cache_size: int = 0) -> Tuple[np.ndarray, Optional[GameProfiler], np.ndarray]:
+    # Plays all games of a single shard with the agent of this process. Returns the agent's performance in every game,
+    # the profiler (if profiling), and the hits and misses of the players' caches (shape (4, 2), zero if not cached).
+
+    logger = get_named_logger("{}.eval_agent".format(os.path.splitext(os.path.basename(__file__))[0]))
+
+    # The RuleBasedAgents use the global RNG.
+    np.random.seed([seed, i_shard])
+
+    controller = _worker_game_controller(cache_size)
+    profiler = GameProfiler() if profile else None
+    controller.profiler = profiler
+
+    # Every shard starts with empty caches, otherwise a cached random choice (see RuleBasedAgent) would depend on previous shards.
+    for p in controller.game_state.players:
+        if isinstance(p.agent, CachedAgent):
+            p.agent.clear()
+            p.agent.reset_stats()
+
+    # The deal bank is rigged so Player 0 has the cards to play a Herz-Solo.
+    deal_bank = get_deal_bank(_deal_bank_dir, _eval_game_mode(), _n_games, seed=seed)
+
+    # Each game can be replicated (by passing the same deal again) and sampled multiple times.
     # Right now, our baseline (RuleBasedAgent) is almost deterministic, so it's ok to sample each game only once.
-    n_games = 20000
     n_agent_samples = 1
-    perf_record = np.empty(n_games, dtype=np.float32)
+    perf_record = np.empty(_n_games_per_shard, dtype=np.float32)
 
-    time_start = timer()
-    for i_game in range(n_games):
-        if i_game > 0 and i_game % 100 == 0:
-            s_elapsed = timer() - time_start
-            mean_perf = np.mean(perf_record[:i_game])
-            logger.info("Ran {} games. Mean agent winrate={:.3f}. "
-                        "Speed is {:.1f} games/second.".format(i_game, mean_perf, i_game/s_elapsed))
-
-        # Deal a single random hand and then create a dealer that will replicate this hand,
-        # so we can take multiple samples of this game.
-        player_hands = rng_dealer.deal_hands()
-        replicating_dealer = DealExactly(player_hands)
+    for i in range(_n_games_per_shard):
+        i_game = i_shard * _n_games_per_shard + i
+
+        # Take the hands from the deal bank (as masks, no need to convert them to cards).
+        deal = deal_bank[i_game]
         i_player_dealer = i_game % 4
 
-        def sample_games(sample_players, n_samples):
+        def sample_games(n_samples):
             n_samples_won = 0
             for i_sample in range(n_samples):
-                controller = GameController(sample_players, i_player_dealer=i_player_dealer,
-                                            dealing_behavior=replicating_dealer, forced_game_mode=game_mode)
-                winners = controller.run_game()
+                winners = controller.run_game(deal=deal, i_player_dealer=i_player_dealer)
                 if winners[0] is True:
                     n_samples_won += 1
             return n_samples_won / n_samples
 
-        agent_win_rate = sample_games(players, n_agent_samples)
+        agent_win_rate = sample_games(n_agent_samples)
         logger.debug("Agent win rate: {:.1%}.".format(agent_win_rate))
 
-        perf_record[i_game] = agent_win_rate
+        perf_record[i] = agent_win_rate
 
-    s_elapsed = timer() - time_start
-    mean_perf = np.mean(perf_record).item()
-    logger.info("Finished evaluation. Took {:.0f} seconds.".format(s_elapsed))
-    logger.info("Mean agent winrate={:.3f}.".format(mean_perf))
-
-    return mean_perf
+    cache_stats = np.array([[p.agent.n_hits, p.agent.n_misses] if isinstance(p.agent, CachedAgent) else [0, 0]
+                            for p in controller.game_state.players], dtype=np.int64)
+    return perf_record, profiler, cache_stats
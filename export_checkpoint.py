@@ -0,0 +1,38 @@
+"""
+Exports DQNAgent checkpoints (.h5) to a compact .npz file that can be loaded without TensorFlow.
+
+The exported file contains the weights of the Q network and the agent config, so it is all you need for playing:
+    python3 play_with_gui.py --p0-agent=alphasheep --alphasheep-checkpoint=model-p0-0.534.npz
+
+Exported checkpoints can't be used to continue training.
+"""
+
+import argparse
+import os
+
+from agents.reinforcment_learning.dqn_agent import DQNAgent
+from utils.log_util import init_logging, get_named_logger
+from utils.config_util import load_config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", help="The yaml config file that the checkpoints were trained with.", required=True)
+    parser.add_argument("checkpoints", help="One or more checkpoints (.h5). Each is exported to the same path, with extension .npz.",
+                        nargs="+")
+    args = parser.parse_args()
+
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+
+    logger.info(f'Loading config from "{args.config}"...')
+    config = load_config(args.config)
+
+    agent = DQNAgent(0, config=config, training=False)
+    for checkpoint_path in args.checkpoints:
+        agent.load_weights(checkpoint_path)
+        agent.save_weights(f"{os.path.splitext(checkpoint_path)[0]}.npz")
+
+
+if __name__ == '__main__':
+    main()
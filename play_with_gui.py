@@ -28,12 +28,13 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--p0-agent", type=str, choices=['static', 'rule', 'random', 'alphasheep', 'user'], required=True)
     parser.add_argument("--alphasheep-checkpoint", help="Checkpoint for AlphaSheep, if --p0-agent=alphasheep.", required=False)
-    parser.add_argument("--agent-config", help="YAML file, containing agent specifications for AlphaSheep.", required=False)
+    parser.add_argument("--agent-config", help="YAML file, containing agent specifications for AlphaSheep. "
+                                               "Not needed if the checkpoint was exported (.npz).", required=False)
     args = parser.parse_args()
     agent_choice = args.p0_agent
     as_checkpoint_path = args.alphasheep_checkpoint
     as_config_path = args.agent_config
-    if agent_choice == "alphasheep" and (not as_checkpoint_path or not as_config_path):
+    if agent_choice == "alphasheep" and (not as_checkpoint_path or (not as_config_path and not as_checkpoint_path.endswith(".npz"))):
         raise ValueError("Need to specify --alphasheep-checkpoint and --agent-config if --p0_agent=alphasheep.")
 
     # Init logging and adjust log levels for some classes.
@@ -47,8 +48,12 @@ def main():
     if agent_choice == "alphasheep":
 
         # Load config. We ignore the "training" and "experiment" sections, but we need "agent_config".
-        logger.info(f'Loading config from "{as_config_path}"...')
-        config = load_config(as_config_path)
+        # Exported checkpoints already contain the agent config.
+        if as_config_path:
+            logger.info(f'Loading config from "{as_config_path}"...')
+            config = load_config(as_config_path)
+        else:
+            config = DQNAgent.load_exported_config(as_checkpoint_path)
         get_class_logger(DQNAgent).setLevel(logging.DEBUG)          # Log Q-values.
         alphasheep_agent = DQNAgent(0, config=config, training=False)
         alphasheep_agent.load_weights(as_checkpoint_path)
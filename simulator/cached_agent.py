@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from simulator.card_defs import Card
+from simulator.card_set import cards_to_mask
+from simulator.game_mode import GameMode
+from simulator.player_agent import PlayerAgent
+
+
+class CachedAgent(PlayerAgent):
+    """
+    Opt-in LRU cache around the play_card() of another agent. Only for agents that declare themselves cacheable
+    (see PlayerAgent.cacheable), i.e. whose decisions only depend on the position:
+    - the cards in hand,
+    - the cards in the trick,
+    - the game mode (contract and suits),
+    - the seat of the declaring player, relative to the agent.
+
+    Positions are encoded into a single int, so a lookup costs about as much as building a tuple.
+    All other calls are passed on to the agent.
+    """
+
+    def __init__(self, agent: PlayerAgent, capacity: int = 100000):
+        """
+        :param agent: the agent whose decisions are cached. Must be cacheable.
+        :param capacity: maximum number of cached positions. The least recently used ones are dropped first.
+        """
+        if not agent.cacheable:
+            raise ValueError("Agent {} is not cacheable.".format(agent.__class__.__name__))
+        assert capacity > 0
+        super().__init__(agent.player_id)
+
+        self.agent = agent
+        self.capacity = capacity
+        self._cache = OrderedDict()         # Position key -> card
+
+        # Game modes are identified by contract and suits (the declaring player is part of the key on its own).
+        # The key part of the last game mode is kept, since it's usually the same object for many calls.
+        self._game_mode_ids: Dict[tuple, int] = {}
+        self._last_game_mode = None
+        self._last_game_mode_key = 0
+
+        self.n_hits = 0
+        self.n_misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        n_calls = self.n_hits + self.n_misses
+        return self.n_hits / n_calls if n_calls > 0 else 0.
+
+    def reset_stats(self):
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def clear(self):
+        """ Removes all cached positions (but keeps the stats). """
+        self._cache.clear()
+
+    def _game_mode_key(self, game_mode: GameMode) -> int:
+        # Bits 32 and up of the position key: relative seat of the declaring player (2 bits), then the game mode id.
+        if game_mode is not self._last_game_mode:
+            mode = (game_mode.contract, game_mode.trump_suit, game_mode.ruf_suit)
+            mode_id = self._game_mode_ids.setdefault(mode, len(self._game_mode_ids))
+            rel_declaring_player = (game_mode.declaring_player_id - self.player_id) % 4
+            self._last_game_mode = game_mode
+            self._last_game_mode_key = (rel_declaring_player | mode_id << 2) << 32
+        return self._last_game_mode_key
+
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        # Position key: hand mask in the lowest 32 bits, then the game mode (see _game_mode_key()),
+        # and above that, the cards in the trick (6 bits each, card id + 1).
+        key = cards_to_mask(cards_in_hand) | self._game_mode_key(game_mode)
+        shift = 48
+        for c in cards_in_trick:
+            key |= (c.card_id + 1) << shift
+            shift += 6
+
+        card = self._cache.get(key)
+        if card is not None:
+            self.n_hits += 1
+            self._cache.move_to_end(key)
+            return card
+
+        self.n_misses += 1
+        card = self.agent.play_card(cards_in_hand, cards_in_trick, game_mode)
+        self._cache[key] = card
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return card
+
+    def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
+        self.agent.notify_trick_result(cards_in_trick, rel_taker_id)
+
+    def notify_game_result(self, won: bool, own_score: int, partner_score: int = None):
+        self.agent.notify_game_result(won, own_score, partner_score)
+
+    def notify_new_game(self):
+        self.agent.notify_new_game()
+
+    def internal_card_values(self) -> Optional[Dict[Card, float]]:
+        return self.agent.internal_card_values()
@@ -43,6 +43,9 @@ class Card:
         # to just precalc a unique card ID instead of comparing suits and pips (Python 3.5).
         self._unique_hash = hash(Card) * 23 + self.suit.value * 23 + self.pip.value
 
+        # Position of this card in new_deck(). Used as bit index in CardSet, and as index into the agents' state/action vectors.
+        self.card_id = self.suit.value * len(Pip) + self.pip.value - Pip.sieben.value
+
     def __str__(self):
         return "({} {})".format(self.suit.name, self.pip.name)
 
@@ -0,0 +1,155 @@
+"""
+Compact representation of (unordered) sets of cards.
+
+Every card is assigned one bit, in the same order as new_deck() (see Card.card_id). A set of cards is then simply a 32-bit int,
+and union / intersection / counting are single integer operations instead of hashing lots of Card objects.
+
+The functions in this module work directly on these masks (for code in the simulator core that wants to be fast),
+while CardSet wraps a mask and behaves like a set of Card objects (for the agents, which don't need to know about bits).
+"""
+
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from simulator.card_defs import Card, new_deck
+
+# Lookup: card id -> Card
+_deck = new_deck()
+_card_id_range = np.arange(len(_deck), dtype=np.int64)
+
+FULL_DECK_MASK = (1 << len(_deck)) - 1
+
+
+def card_mask(card: Card) -> int:
+    """ Returns the mask that only contains a single card. """
+    return 1 << card.card_id
+
+
+def cards_to_mask(cards: Iterable[Card]) -> int:
+    """ Converts any iterable of cards (including a CardSet) to a mask. """
+    if isinstance(cards, CardSet):
+        return cards.mask
+    mask = 0
+    for c in cards:
+        mask |= 1 << c.card_id
+    return mask
+
+
+def mask_to_card_ids(mask: int) -> List[int]:
+    """ Returns the ids of all cards in the mask, in ascending order. """
+    card_ids = []
+    while mask:
+        low_bit = mask & -mask
+        card_ids.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return card_ids
+
+
+def mask_to_cards(mask: int) -> List[Card]:
+    """ Returns all cards in the mask, in new_deck() order. """
+    return [_deck[i] for i in mask_to_card_ids(mask)]
+
+
+def card_from_id(card_id: int) -> Card:
+    return _deck[card_id]
+
+
+def popcount(mask: int) -> int:
+    """ Number of cards in the mask. """
+    return bin(mask).count("1")
+
+
+def masks_to_bools(masks: np.ndarray) -> np.ndarray:
+    """
+    Converts an array of masks (any shape, int64) to bools.
+    :return: bool array with an additional last axis of size 32, indexed by card id.
+    """
+    return (masks[..., np.newaxis] >> _card_id_range) & 1 == 1
+
+
+def bools_to_masks(bools: np.ndarray) -> np.ndarray:
+    """ Inverse of masks_to_bools(). """
+    return np.sum(bools.astype(np.int64) << _card_id_range, axis=-1)
+
+
+def popcounts(masks: np.ndarray) -> np.ndarray:
+    """ Batched version of popcount(). """
+    return np.sum(masks_to_bools(masks), axis=-1)
+
+
+class CardSet:
+    """
+    A mutable set of cards, stored as a bitmask. Supports the usual set operations for Card objects (iteration, "in", len,
+    add/remove, ...), so agents can treat it like any other Iterable[Card]. Iteration is always in new_deck() order.
+    """
+
+    __slots__ = ("mask",)
+
+    def __init__(self, cards: Optional[Iterable[Card]] = None):
+        self.mask = 0 if cards is None else cards_to_mask(cards)
+
+    @staticmethod
+    def from_mask(mask: int) -> 'CardSet':
+        card_set = CardSet()
+        card_set.mask = mask
+        return card_set
+
+    def __contains__(self, card: Card) -> bool:
+        return (self.mask >> card.card_id) & 1 == 1
+
+    def __iter__(self) -> Iterator[Card]:
+        mask = self.mask
+        while mask:
+            low_bit = mask & -mask
+            yield _deck[low_bit.bit_length() - 1]
+            mask ^= low_bit
+
+    def __len__(self) -> int:
+        return popcount(self.mask)
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, CardSet):
+            return NotImplemented
+        return self.mask == other.mask
+
+    __hash__ = None         # Mutable
+
+    def __or__(self, other: 'CardSet') -> 'CardSet':
+        return CardSet.from_mask(self.mask | other.mask)
+
+    def __and__(self, other: 'CardSet') -> 'CardSet':
+        return CardSet.from_mask(self.mask & other.mask)
+
+    def __sub__(self, other: 'CardSet') -> 'CardSet':
+        return CardSet.from_mask(self.mask & ~other.mask)
+
+    def __str__(self):
+        return "{" + ", ".join(str(c) for c in self) + "}"
+
+    def __repr__(self):
+        return "CardSet({})".format(self)
+
+    def add(self, card: Card):
+        self.mask |= 1 << card.card_id
+
+    def remove(self, card: Card):
+        bit = 1 << card.card_id
+        if not self.mask & bit:
+            raise KeyError(card)
+        self.mask ^= bit
+
+    def discard(self, card: Card):
+        self.mask &= ~(1 << card.card_id)
+
+    def update(self, cards: Iterable[Card]):
+        self.mask |= cards_to_mask(cards)
+
+    def clear(self):
+        self.mask = 0
+
+    def copy(self) -> 'CardSet':
+        return CardSet.from_mask(self.mask)
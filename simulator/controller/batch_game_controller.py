@@ -0,0 +1,139 @@
+from typing import Tuple, Union
+
+import numpy as np
+
+from simulator.card_defs import new_deck, pip_scores
+from simulator.card_set import card_from_id, masks_to_bools
+from simulator.game_mode import GameMode
+
+
+class BatchGameController:
+    """
+    Vectorized counterpart of GameController: simulates N games in lockstep, with all state held in NumPy arrays.
+
+    Unlike GameController, it does not talk to any agents. Instead, the caller provides the next card for every game at once
+    (always for the player whose turn it is) and receives the legal actions for the next player, rewards and done flags.
+    All games are played in the same (forced) GameMode and scored like a solo, exactly as GameController does.
+
+    Cards are represented by their ids (see Card.card_id) and hands by bitmasks (see simulator.card_set).
+    """
+
+    def __init__(self, n_games: int, game_mode: GameMode):
+        """
+        Creates a BatchGameController. Should be reused - call reset() to start a new batch of games.
+        :param n_games: the number of games that are simulated in parallel.
+        :param game_mode: the game mode that is played in every game. Must have a declaring player.
+        """
+        assert game_mode.declaring_player_id is not None, "Must provide a specific player."
+        self.n_games = n_games
+        self.game_mode = game_mode
+
+        # Card id -> score of that card.
+        self._card_scores = np.array([pip_scores[c.pip] for c in new_deck()], dtype=np.int32)
+
+        # Current state of all games. Player indices are absolute (not rotated).
+        self.hands = np.zeros((n_games, 4), dtype=np.int64)                 # Cards in hand, as bitmask
+        self.trick_card_ids = np.full((n_games, 4), -1, dtype=np.int64)     # Cards in the current trick (in order of playing), -1 = empty
+        self.n_trick_cards = np.zeros(n_games, dtype=np.int64)              # Number of cards in the current trick
+        self.i_player_leader = np.zeros(n_games, dtype=np.int64)            # Player who played the first card of the current trick
+        self.i_trick = np.zeros(n_games, dtype=np.int64)                    # Number of the current trick (0-7)
+        self.played_masks = np.zeros(n_games, dtype=np.int64)              # All cards in tricks that have been completed
+        self.scores = np.zeros((n_games, 4), dtype=np.int32)                # Points scored by each player
+        self.player_win = np.zeros((n_games, 4), dtype=bool)                # Only valid when the game is done
+        self.done = np.ones(n_games, dtype=bool)
+
+    def reset(self, hands: np.ndarray, i_player_dealer: Union[int, np.ndarray] = 0) -> np.ndarray:
+        """
+        Starts a new game at every table.
+        :param hands: array of shape (N, 4) - the dealt hand masks, indexed by absolute player id.
+        :param i_player_dealer: the dealer at every table (scalar or shape (N,)). The player after the dealer leads the first trick.
+        :return: array of shape (N, 32) - the legal actions of the first player at every table.
+        """
+        assert hands.shape == (self.n_games, 4)
+
+        self.hands[:] = hands
+        self.trick_card_ids[:] = -1
+        self.n_trick_cards[:] = 0
+        self.i_player_leader[:] = (np.asarray(i_player_dealer) + 1) % 4
+        self.i_trick[:] = 0
+        self.played_masks[:] = 0
+        self.scores[:] = 0
+        self.player_win[:] = False
+        self.done[:] = False
+
+        return self.legal_actions()
+
+    @property
+    def i_player_current(self) -> np.ndarray:
+        """ Array of shape (N,) - the player whose turn it is at every table. """
+        return (self.i_player_leader + self.n_trick_cards) % 4
+
+    def current_hands(self) -> np.ndarray:
+        """ Array of shape (N,) - the hand masks of the current players. """
+        return self.hands[np.arange(self.n_games), self.i_player_current]
+
+    def legal_masks(self) -> np.ndarray:
+        """ Array of shape (N,) - masks of the cards the current players are allowed to play. 0 for games that are done. """
+        legal_masks = self.game_mode.legal_moves_masks(self.current_hands(), self.trick_card_ids[:, 0])
+        legal_masks[self.done] = 0
+        return legal_masks
+
+    def legal_actions(self) -> np.ndarray:
+        """ Array of shape (N, 32) - the cards the current players are allowed to play. All False for games that are done. """
+        return masks_to_bools(self.legal_masks())
+
+    def step(self, card_ids: np.ndarray, games: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Plays one card at every table (by the current player) and, if a trick is complete, scores it.
+        :param card_ids: array of shape (N,) - the card to play at every table. Ignored for games that are done.
+        :param games: Optional - bool array of shape (N,). If provided, only the selected tables play a card, the others wait.
+        :return: a tuple of:
+            - legal_actions: array of shape (N, 32) - the legal actions of the next player.
+            - rewards: array of shape (N, 4) - 1.0 for every player who won a game that has just ended, else 0.
+            - done: array of shape (N,) - True for all games that are over.
+        """
+
+        rewards = np.zeros((self.n_games, 4), dtype=np.float32)
+        active = np.flatnonzero(~self.done if games is None else ~self.done & games)
+        if len(active) == 0:
+            return self.legal_actions(), rewards, self.done.copy()
+
+        card_ids = np.asarray(card_ids, dtype=np.int64)[active]
+        i_players = self.i_player_current[active]
+        card_bits = np.left_shift(1, card_ids)
+
+        # Do the rules allow the players to play those cards? This also checks if the players have them.
+        legal_masks = self.game_mode.legal_moves_masks(self.hands[active, i_players], self.trick_card_ids[active, 0])
+        if np.any(legal_masks & card_bits == 0):
+            i = np.flatnonzero(legal_masks & card_bits == 0)[0]
+            raise ValueError("Player {} tried to play {} in game {}, but it's not allowed!".format(
+                i_players[i], card_from_id(card_ids[i]), active[i]))
+
+        self.hands[active, i_players] &= ~card_bits
+        self.trick_card_ids[active, self.n_trick_cards[active]] = card_ids
+        self.n_trick_cards[active] += 1
+
+        # Determine winners of completed tricks and move the tricks to the scores of the winners.
+        complete = active[self.n_trick_cards[active] == 4]
+        if len(complete) > 0:
+            tricks = self.trick_card_ids[complete]
+            i_win_players = (self.i_player_leader[complete] + self.game_mode.get_trick_winners(tricks)) % 4
+            self.scores[complete, i_win_players] += np.sum(self._card_scores[tricks], axis=1)
+            self.played_masks[complete] |= np.bitwise_or.reduce(np.left_shift(1, tricks), axis=1)
+            self.i_player_leader[complete] = i_win_players
+            self.trick_card_ids[complete] = -1
+            self.n_trick_cards[complete] = 0
+            self.i_trick[complete] += 1
+
+            # Count score and determine the winner after the last trick.
+            # TODO: For now, always scoring a solo.
+            finished = complete[self.i_trick[complete] == 8]
+            if len(finished) > 0:
+                i_decl = self.game_mode.declaring_player_id
+                decl_won = self.scores[finished, i_decl] > 60
+                is_decl = np.arange(4) == i_decl
+                self.player_win[finished] = np.where(decl_won[:, np.newaxis], is_decl, ~is_decl)
+                self.done[finished] = True
+                rewards[finished] = self.player_win[finished]
+
+        return self.legal_actions(), rewards, self.done.copy()
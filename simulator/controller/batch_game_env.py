@@ -0,0 +1,116 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from simulator.controller.batch_game_controller import BatchGameController
+from simulator.controller.dealing_behavior import DealingBehavior, DealFairly
+from simulator.game_mode import GameMode
+from simulator.player_agent import PlayerAgent
+
+
+class BatchGameEnv:
+    """
+    Gym-style environment that runs a batch of parallel tables (see BatchGameController) for a single learning player.
+
+    Instead of being called back like a PlayerAgent, the learner drives the simulation: reset() starts a new game at every
+    table, and step() plays the learner's cards. In between, the env lets the opponents play until it's the learner's turn again.
+    This way, the learner can decide for all tables at once (e.g. with one forward pass of a network).
+
+    Opponents are regular PlayerAgents, but the same agent instance plays at all tables. They are only asked for cards
+    (no notify_* calls), so they must not keep any per-game state. RuleBasedAgent, StaticPolicyAgent and RandomCardAgent are fine.
+    Every opponent decides for all of its tables in a single call of play_card_batch(), which RuleBasedAgent implements
+    with NumPy (the others fall back to play_card() per table).
+    """
+
+    def __init__(self, n_tables: int, game_mode: GameMode, opponents: List[Optional[PlayerAgent]], learner_id: int = 0,
+                 dealing_behavior: DealingBehavior = DealFairly()):
+        """
+        Creates a BatchGameEnv.
+        :param n_tables: the number of tables (games) that are simulated in parallel.
+        :param game_mode: the game mode that is played at every table.
+        :param opponents: list(4) of agents, indexed by player id. The entry at learner_id is ignored (can be None).
+        :param learner_id: the player id of the learner.
+        :param dealing_behavior: Optional - the dealing behaviour. Default = fair
+        """
+        assert len(opponents) == 4
+        assert all(a is not None for i, a in enumerate(opponents) if i != learner_id)
+
+        self.n_tables = n_tables
+        self.game_mode = game_mode
+        self.opponents = opponents
+        self.learner_id = learner_id
+        self.dealing_behavior = dealing_behavior
+        self.controller = BatchGameController(n_tables, game_mode)
+
+        # Every table has its own dealer, which is shifted clockwise after every game (as in GameController).
+        self._i_player_dealer = np.arange(n_tables) % 4
+
+    def reset(self) -> Dict[str, np.ndarray]:
+        """
+        Deals new cards and starts a new game at every table. The opponents play until it's the learner's turn.
+        :return: the observation of the learner (see _observe()).
+        """
+
+        self.controller.reset(self.dealing_behavior.deal_batch(self.n_tables), self._i_player_dealer)
+        self._i_player_dealer = (self._i_player_dealer + 1) % 4
+
+        self._play_opponents()
+        return self._observe()
+
+    def step(self, card_ids: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray, Dict]:
+        """
+        Plays the learner's cards at all tables, then lets the opponents play until it's the learner's turn again (or the game is over).
+        :param card_ids: array of shape (N,) - the card the learner plays at every table. Ignored at tables where the game is over.
+        :return: a tuple of:
+            - observation: the next observation of the learner (see _observe()).
+            - rewards: array of shape (N,) - 1.0 if the learner has just won the game, else 0.
+            - done: array of shape (N,) - True for all tables where the game is over.
+            - info: dict containing the scores and winners of all players (only valid when done).
+        """
+
+        assert np.all(self.controller.done | (self.controller.i_player_current == self.learner_id))
+        _, rewards, _ = self.controller.step(card_ids)
+        rewards = rewards[:, self.learner_id] + self._play_opponents()
+
+        info = {"scores": self.controller.scores.copy(), "player_win": self.controller.player_win.copy()}
+        return self._observe(), rewards, self.controller.done.copy(), info
+
+    def _play_opponents(self) -> np.ndarray:
+        # Asks the opponents for their cards, until it's the learner's turn at every table (or the game is over).
+        # Returns the rewards of the learner that were received during that time.
+
+        controller = self.controller
+        rewards = np.zeros(self.n_tables, dtype=np.float32)
+        while True:
+            i_players = controller.i_player_current
+            waiting = ~controller.done & (i_players != self.learner_id)
+            if not np.any(waiting):
+                return rewards
+
+            # Every opponent decides for all tables where it's their turn at once (see PlayerAgent.play_card_batch()).
+            card_ids = np.zeros(self.n_tables, dtype=np.int64)
+            hands = controller.current_hands()
+            for i_player, agent in enumerate(self.opponents):
+                games = waiting & (i_players == i_player)
+                if i_player == self.learner_id or not np.any(games):
+                    continue
+                card_ids[games] = agent.play_card_batch(hands[games], controller.trick_card_ids[games], game_mode=self.game_mode)
+
+            _, step_rewards, _ = controller.step(card_ids, games=waiting)
+            rewards += step_rewards[:, self.learner_id]
+
+    def _observe(self) -> Dict[str, np.ndarray]:
+        # The observation of the learner contains:
+        # - "cards_in_hand":        array of shape (N,) - hand masks
+        # - "cards_in_trick":       array of shape (N, 3) - ids of the cards that were played before the learner in the current trick
+        #                           (in order of playing, -1 = empty)
+        # - "cards_already_played": array of shape (N,) - masks of all cards in completed tricks
+        # - "legal_actions":        array of shape (N, 32) - the cards the learner is allowed to play
+        # At tables where the game is over, the hand is empty and no actions are legal.
+        controller = self.controller
+        return {
+            "cards_in_hand": controller.hands[:, self.learner_id].copy(),
+            "cards_in_trick": controller.trick_card_ids[:, :3].copy(),
+            "cards_already_played": controller.played_masks.copy(),
+            "legal_actions": controller.legal_actions(),
+        }
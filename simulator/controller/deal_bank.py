@@ -0,0 +1,65 @@
+"""
+Persistent "deal banks": a fixed set of pre-dealt games, stored on disk as a NumPy array of hand masks (see simulator.card_set).
+
+Evaluating different agents on the same bank means that all of them see exactly the same deals (less variance when comparing),
+and nobody needs to pay for dealing (DealWinnableHand can take many shuffles per deal) more than once.
+"""
+
+import os
+
+import numpy as np
+
+from simulator.controller.dealing_behavior import DealingBehavior, DealWinnableHand
+from simulator.game_mode import GameMode
+from utils.log_util import get_named_logger
+
+# Increase this whenever dealing changes in a way that should invalidate existing banks.
+DEAL_BANK_VERSION = 2
+
+
+def get_deal_bank(bank_dir: str, game_mode: GameMode, n_deals: int, seed: int = 0) -> np.ndarray:
+    """
+    Loads a bank of deals that are winnable for the declaring player (as dealt by DealWinnableHand), or creates it if it does not exist.
+    :param bank_dir: directory where banks are stored. Banks are identified by game mode, size, seed and version.
+    :param game_mode: the game mode for DealWinnableHand.
+    :param n_deals: the number of deals in the bank.
+    :param seed: the random seed for dealing.
+    :return: array of shape (n_deals, 4) - hand masks (uint32), indexed by absolute player id. Memory-mapped and read-only.
+    """
+
+    trump_suit = game_mode.trump_suit.name if game_mode.trump_suit is not None else "none"
+    filename = "{}-{}-p{}-n{}-seed{}.v{}.npy".format(game_mode.contract.name, trump_suit, game_mode.declaring_player_id,
+                                                     n_deals, seed, DEAL_BANK_VERSION)
+    filepath = os.path.join(bank_dir, filename)
+    if not os.path.exists(filepath):
+        create_deal_bank(filepath, DealWinnableHand(game_mode), n_deals, seed)
+    return load_deal_bank(filepath)
+
+
+def create_deal_bank(filepath: str, dealing_behavior: DealingBehavior, n_deals: int, seed: int = 0):
+    """
+    Deals n_deals games and saves them to a file. Uses (and reseeds) the global RNG.
+    """
+
+    logger = get_named_logger("deal_bank")
+    logger.info(f'Creating deal bank with {n_deals} deals at "{filepath}"...')
+
+    np.random.seed(seed)
+    deals = dealing_behavior.deal_batch(n_deals).astype(np.uint32)
+
+    # Write to a temporary file first, so concurrent processes never see a half-written bank.
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    filepath_tmp = f"{filepath}.pid{os.getpid()}.tmp"
+    with open(filepath_tmp, "wb") as f:
+        np.save(f, deals)
+    os.replace(filepath_tmp, filepath)
+
+
+def load_deal_bank(filepath: str) -> np.ndarray:
+    """
+    Loads (memory-maps) a deal bank that was saved with create_deal_bank().
+    :return: array of shape (n_deals, 4) - hand masks, indexed by absolute player id.
+    """
+    deals = np.load(filepath, mmap_mode="r")
+    assert deals.ndim == 2 and deals.shape[1] == 4
+    return deals
@@ -1,12 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import Iterable, List
+from math import factorial
+from typing import Iterable, Iterator, List, Tuple
 
 import numpy as np
 
 from simulator.card_defs import new_deck, Card, Suit, Pip
+from simulator.card_set import cards_to_mask, mask_to_cards
 from simulator.game_mode import GameMode, GameContract
 
 
+def _n_choose_k(n: int, k: int) -> int:
+    return factorial(n) // (factorial(k) * factorial(n - k))
+
+
+def _new_generator() -> np.random.Generator:
+    # Batched dealing uses the Generator API (for permuted()), but is seeded from the global RNG,
+    # so np.random.seed() still makes everything reproducible.
+    return np.random.default_rng(np.random.randint(2**31))
+
+
+def _deck_to_masks(decks: np.ndarray) -> np.ndarray:
+    # Converts shuffled decks of shape (n, 32) (card ids) to hand masks of shape (n, 4), dealing 8 cards to each player in order.
+    return np.bitwise_or.reduce(np.left_shift(1, decks.astype(np.int64)).reshape(-1, 4, 8), axis=2)
+
+
 class DealingBehavior(ABC):
     """
     Base class for various kinds of (possibly biased) dealers.
@@ -20,6 +37,13 @@ class DealingBehavior(ABC):
         """
         pass
 
+    def deal_batch(self, n: int) -> np.ndarray:
+        """
+        Deals n games at once. Subclasses should override this with a vectorized implementation.
+        :return: array of shape (n, 4) - hand masks (see simulator.card_set), indexed by absolute player id.
+        """
+        return np.array([[cards_to_mask(cards) for cards in self.deal_hands()] for _ in range(n)], dtype=np.int64)
+
 
 class DealFairly(DealingBehavior):
     """
@@ -33,6 +57,11 @@ class DealFairly(DealingBehavior):
         player_hands = [set(deck[i*8:(i+1)*8]) for i in range(4)]
         return player_hands
 
+    def deal_batch(self, n: int) -> np.ndarray:
+        # Shuffle n decks with a single call.
+        decks = _new_generator().permuted(np.tile(np.arange(32), (n, 1)), axis=1)
+        return _deck_to_masks(decks)
+
 
 class DealWinnableHand(DealingBehavior):
     """
@@ -43,16 +72,100 @@ class DealWinnableHand(DealingBehavior):
         assert game_mode.declaring_player_id is not None
         self._game_mode = game_mode
 
+        # The direct sampling below needs to know which groups of cards _are_cards_suitable() looks at, which is only
+        # defined for Suit-solo so far. Other game modes fall back to shuffling until the hand is suitable.
+        self._compositions = None
+        if game_mode.contract != GameContract.suit_solo:
+            return
+
+        # Instead of shuffling until the declaring player's hand is suitable (which can take many shuffles), we directly sample
+        # from the distribution of suitable hands:
+        # - The deck is split into groups of cards, such that suitability only depends on how many cards of each group are in the hand.
+        # - Enumerate all compositions (number of cards from each group) and keep the suitable ones.
+        # - Weight each composition by the number of hands that have it, i.e. the product of binomial coefficients.
+        # Sampling a composition by weight and then uniformly choosing the cards within each group gives a uniformly random
+        # suitable hand - exactly what the shuffling would produce. The other 24 cards are dealt uniformly to the other players.
+        self._card_groups = self._group_cards(game_mode)
+        compositions = []
+        weights = []
+        for composition in self._enumerate_compositions([len(g) for g in self._card_groups], 8):
+            representative_hand = [c for group, n in zip(self._card_groups, composition) for c in group[:n]]
+            if self._are_cards_suitable(representative_hand, game_mode):
+                compositions.append(composition)
+                weights.append(np.prod([_n_choose_k(len(g), n) for g, n in zip(self._card_groups, composition)], dtype=np.float64))
+        self._compositions = np.array(compositions, dtype=np.int64)
+        self._composition_probs = np.array(weights) / np.sum(weights)
+        self._group_card_ids = [np.array([c.card_id for c in g], dtype=np.int64) for g in self._card_groups]
+
     def deal_hands(self) -> List[Iterable[Card]]:
-        deck = new_deck()
+        if self._compositions is None:
+            return self._deal_hands_by_shuffling()
+        return [set(mask_to_cards(int(mask))) for mask in self.deal_batch(1)[0]]
 
+    def _deal_hands_by_shuffling(self) -> List[Iterable[Card]]:
         # Repeat random shuffles until the player's cards are good enough.
+        # This is the reference for the direct sampling (same distribution, but much slower).
+        deck = new_deck()
         while True:
             np.random.shuffle(deck)
             player_hands = [set(deck[i * 8:(i + 1) * 8]) for i in range(4)]
             if self._are_cards_suitable(player_hands[self._game_mode.declaring_player_id], self._game_mode):
                 return player_hands
 
+    def deal_batch(self, n: int) -> np.ndarray:
+        """
+        Deals n games at once (vectorized).
+        :return: array of shape (n, 4) - hand masks (see simulator.card_set), indexed by absolute player id.
+        """
+
+        if self._compositions is None:
+            return super().deal_batch(n)
+
+        rng = _new_generator()
+
+        # Choose a composition for every declaring hand, then pick the cards within every group:
+        # Shuffle the cards of each group, and take the first ones (as many as the composition says).
+        i_compositions = rng.choice(len(self._compositions), size=n, p=self._composition_probs)
+        counts = self._compositions[i_compositions]
+        declaring = np.zeros((n, 32), dtype=bool)
+        rows = np.arange(n)[:, np.newaxis]
+        for i_group, card_ids in enumerate(self._group_card_ids):
+            shuffled = rng.permuted(np.tile(card_ids, (n, 1)), axis=1)
+            declaring[rows, shuffled] = np.arange(len(card_ids)) < counts[:, i_group:i_group + 1]
+
+        # Shuffle the remaining 24 cards and deal 8 to every other player.
+        # The declaring player's cards are put at their position in the deck, so the usual dealing order works.
+        other_cards = rng.permuted(np.nonzero(~declaring)[1].reshape(n, 24), axis=1)
+        i_decl = self._game_mode.declaring_player_id
+        decks = np.empty((n, 32), dtype=np.int64)
+        decks[:, i_decl * 8:(i_decl + 1) * 8] = np.nonzero(declaring)[1].reshape(n, 8)
+        decks[:, [i for i in range(32) if i // 8 != i_decl]] = other_cards
+        return _deck_to_masks(decks)
+
+    @staticmethod
+    def _group_cards(game_mode: GameMode) -> List[List[Card]]:
+        # Groups for _are_cards_suitable() in a Suit-solo: it only looks at trumps, obers, unters and the Eichel Ober.
+        deck = new_deck()
+        eichel_ober = Card(Suit.eichel, Pip.ober)
+        return [
+            [eichel_ober],
+            [c for c in deck if c.pip == Pip.ober and c != eichel_ober],
+            [c for c in deck if c.pip == Pip.unter],
+            [c for c in deck if game_mode.is_trump(c) and c.pip != Pip.ober and c.pip != Pip.unter],
+            [c for c in deck if not game_mode.is_trump(c)],
+        ]
+
+    @staticmethod
+    def _enumerate_compositions(group_sizes: List[int], n_cards: int) -> Iterator[Tuple[int, ...]]:
+        # All ways to take n_cards from the groups (how many from each group).
+        if len(group_sizes) == 1:
+            if n_cards <= group_sizes[0]:
+                yield (n_cards,)
+            return
+        for n in range(min(group_sizes[0], n_cards) + 1):
+            for rest in DealWinnableHand._enumerate_compositions(group_sizes[1:], n_cards - n):
+                yield (n,) + rest
+
     def _are_cards_suitable(self, cards_in_hand, game_mode: GameMode):
         # Quick and dirty heuristic for deciding whether to play a solo.
 
@@ -81,3 +194,6 @@ class DealExactly(DealingBehavior):
     def deal_hands(self) -> List[Iterable[Card]]:
         # Create new list/sets to prevent modification
         return [set(cards) for cards in self.player_hands]
+
+    def deal_batch(self, n: int) -> np.ndarray:
+        return np.tile(np.array([cards_to_mask(cards) for cards in self.player_hands], dtype=np.int64), (n, 1))
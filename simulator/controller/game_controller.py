@@ -1,9 +1,13 @@
-from typing import List
+import logging
+from timeit import default_timer as timer
+from typing import Iterable, List, Sequence, Union
 
 import numpy as np
 
 from simulator.controller.dealing_behavior import DealFairly, DealingBehavior
-from simulator.card_defs import Suit, pip_scores
+from simulator.controller.game_profiler import GameProfiler
+from simulator.card_defs import Card, Suit, pip_scores
+from simulator.card_set import CardSet
 from simulator.game_mode import GameMode, GameContract
 from simulator.game_state import Player, GameState, GamePhase
 from utils.log_util import get_class_logger
@@ -15,49 +19,94 @@ class GameController:
     """
 
     def __init__(self, players: List[Player], i_player_dealer=0,
-                 dealing_behavior: DealingBehavior = DealFairly(), forced_game_mode: GameMode = None):
+                 dealing_behavior: DealingBehavior = DealFairly(), forced_game_mode: GameMode = None, profiler: GameProfiler = None,
+                 silent: bool = False):
         """
         Creates a GameController and, together with it, a GameState. Should be reused - run run_game() in order to simulate a single game.
         :param players: the players, along with their agents.
         :param i_player_dealer: The player who is the dealer at start (i+1 is the player who will lead in the first game).
         :param dealing_behavior: Optional - the dealing behaviour. Default = fair
         :param forced_game_mode: Optional - if not None, players cannot bid, but every game is always the provided mode.
+        :param profiler: Optional - if not None, the time of all phases and agent calls is recorded there (see GameProfiler).
+        :param silent: If True, the controller does not log and does not fire any events (for headless simulation, e.g. training).
+                       Even if False, debug messages are only created if debug logging is enabled, and events are only fired
+                       if somebody has subscribed.
         """
         assert len(players) == 4
 
         self.logger = get_class_logger(self)
-        self.logger.debug("Initializing game.")
-        self.logger.debug("Players:")
-        for p in players:
-            self.logger.debug("Player {} with behavior {}.".format(p, p.agent))
+        self.silent = silent
+        self._debug = False                 # Whether debug messages are logged in the current game (see run_game())
+        if not silent and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Initializing game.")
+            self.logger.debug("Players:")
+            for p in players:
+                self.logger.debug("Player {} with behavior {}.".format(p, p.agent))
 
         self.game_state = GameState(players, i_player_dealer=i_player_dealer)
         self.dealing_behavior = dealing_behavior
         self.forced_game_mode = forced_game_mode
         assert forced_game_mode is None or forced_game_mode.declaring_player_id is not None, "Must provide a specific player."
 
-    def run_game(self) -> List[bool]:
+        # Profiling is opt-in. When disabled, it costs a single check per measurement.
+        # Item names for the profiler are created up front, so they don't distort the measurements.
+        self.profiler = profiler
+        self._profiler_items = [{method: "Player {} ({}).{}".format(i, p.agent.__class__.__name__, method)
+                                 for method in ["notify_new_game", "play_card", "notify_trick_result", "notify_game_result"]}
+                                for i, p in enumerate(players)]
+
+    def run_game(self, deal: Sequence[Union[Iterable[Card], int]] = None, i_player_dealer: int = None) -> List[bool]:
         """
         Runs a single game (and shifts the dealing player clockwise). Can be called multiple times.
+        :param deal: Optional - the hands of the players for this game, instead of asking the dealing behavior. Either list(4) of
+                     iterable(8) of cards (like DealingBehavior.deal_hands()), or 4 hand masks (like a row of a deal bank).
+        :param i_player_dealer: Optional - the dealer for this game. Default: continue clockwise from the previous game.
         :returns a list of 4 bools, indicating which player(s) won the game.
         """
 
+        # Debug messages are expensive (formatting players and cards), so they are only created if they are logged.
+        # The log level is checked once per game.
+        debug = self._debug = not self.silent and self.logger.isEnabledFor(logging.DEBUG)
+
         def log_phase():
-            self.logger.debug("===== Entering Phase: {} =====".format(self.game_state.game_phase))
+            if debug:
+                self.logger.debug("===== Entering Phase: {} =====".format(self.game_state.game_phase))
 
         assert self.game_state.game_phase == GamePhase.pre_deal
+        if i_player_dealer is not None:
+            self.game_state.i_player_dealer = i_player_dealer
+
+        profiler = self.profiler
+        if profiler is not None:
+            t_game = t_phase = timer()
 
-        for p in self.game_state.players:
+        for i, p in enumerate(self.game_state.players):
+            if profiler is not None:
+                t_call = timer()
             p.agent.notify_new_game()
+            if profiler is not None:
+                profiler.add("pre_deal", self._profiler_items[i]["notify_new_game"], t_call)
+        if profiler is not None:
+            t_phase = profiler.add_phase("pre_deal", t_phase)
 
         # DEALING PHASE
         self.game_state.game_phase = GamePhase.dealing
         log_phase()
-        self.logger.debug("Player {} is dealing.".format(self.game_state.players[self.game_state.i_player_dealer]))
-        hands = self.dealing_behavior.deal_hands()
+        if debug:
+            self.logger.debug("Player {} is dealing.".format(self.game_state.players[self.game_state.i_player_dealer]))
+        if profiler is not None:
+            t_call = timer()
+        hands = self.dealing_behavior.deal_hands() if deal is None else deal
+        if profiler is not None:
+            profiler.add("dealing", "deal_hands", t_call)
         for i, p in enumerate(self.game_state.players):
-            p.cards_in_hand = hands[i]
-        self.game_state.ev_changed.notify()
+            if isinstance(hands[i], (int, np.integer)):
+                p.cards_in_hand = CardSet.from_mask(int(hands[i]))
+            else:
+                p.cards_in_hand = CardSet(hands[i])
+        self._notify_changed("dealing")
+        if profiler is not None:
+            t_phase = profiler.add_phase("dealing", t_phase)
 
         # BIDDING PHASE
         # Choose the game mode and declaring player.
@@ -71,14 +120,19 @@ class GameController:
             # TODO: allow agents to bid & declare on their own
             game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=np.random.randint(4))
         i_decl = game_mode.declaring_player_id
-        self.logger.debug("Game Variant: Player {} is declaring a {}!".format(self.game_state.players[i_decl], game_mode))
+        if debug:
+            self.logger.debug("Game Variant: Player {} is declaring a {}!".format(self.game_state.players[i_decl], game_mode))
         self.game_state.game_mode = game_mode
-        self.game_state.ev_changed.notify()
+        self._notify_changed("bidding")
+        if profiler is not None:
+            t_phase = profiler.add_phase("bidding", t_phase)
 
         # PLAYING PHASE
         self.game_state.game_phase = GamePhase.playing
         log_phase()
         self._playing_phase()
+        if profiler is not None:
+            t_phase = profiler.add_phase("playing", t_phase)
 
         # POST-GAME PHASE
         # Count score and determine winner.
@@ -87,36 +141,59 @@ class GameController:
         log_phase()
 
         player_scores = [sum(pip_scores[c.pip] for c in p.cards_in_scored_tricks) for p in self.game_state.players]
-        for i, p in enumerate(self.game_state.players):
-            self.logger.debug("Player {} has score {}.".format(p, player_scores[i]))
         if player_scores[i_decl] > 60:
             player_win = [i == i_decl for i in range(4)]
         else:
             player_win = [i != i_decl for i in range(4)]
-        self.logger.debug("=> Player {} {} the {}!".format(self.game_state.players[i_decl], "wins" if player_win[i_decl] else "loses",
-                                                           game_mode))
+        if debug:
+            for i, p in enumerate(self.game_state.players):
+                self.logger.debug("Player {} has score {}.".format(p, player_scores[i]))
+            self.logger.debug("=> Player {} {} the {}!".format(self.game_state.players[i_decl],
+                                                               "wins" if player_win[i_decl] else "loses", game_mode))
+            self.logger.debug("Summary:")
+            for i, p in enumerate(self.game_state.players):
+                self.logger.debug("Player {} {}.".format(p, "wins" if player_win[i] else "loses"))
 
-        self.logger.debug("Summary:")
         for i, p in enumerate(self.game_state.players):
-            self.logger.debug("Player {} {}.".format(p, "wins" if player_win[i] else "loses"))
+            if profiler is not None:
+                t_call = timer()
             p.agent.notify_game_result(player_win[i], own_score=player_scores[i])
-        self.game_state.ev_changed.notify()
+            if profiler is not None:
+                profiler.add("post_play", self._profiler_items[i]["notify_game_result"], t_call)
+        self._notify_changed("post_play")
 
         # Reset to PRE-DEAL PHASE.
         self.game_state.game_phase = GamePhase.pre_deal
         log_phase()
         self.game_state.clear_after_game()
         self.game_state.i_player_dealer = (self.game_state.i_player_dealer + 1) % 4
-        self.game_state.ev_changed.notify()
+        self._notify_changed("post_play")
+        if profiler is not None:
+            profiler.add_phase("post_play", t_phase)
+            profiler.add_game(t_game)
 
         return player_win
 
+    def _notify_changed(self, profiler_phase: str):
+        # Fires the changed event of the GameState (and measures it as part of the phase, if profiling).
+        # Nothing to do if silent, or if nobody is listening.
+        if self.silent or not self.game_state.ev_changed.subscribers:
+            return
+        if self.profiler is not None:
+            t_call = timer()
+            self.game_state.ev_changed.notify()
+            self.profiler.add(profiler_phase, "ev_changed.notify", t_call)
+        else:
+            self.game_state.ev_changed.notify()
+
     def _playing_phase(self):
         # Main phase of the game (trick taking).
 
         # Some shortcuts
         game_state = self.game_state
         game_mode = self.game_state.game_mode
+        profiler = self.profiler
+        debug = self._debug
 
         # Left of dealer leads the first trick.
         i_p_leader = (game_state.i_player_dealer + 1) % 4
@@ -124,16 +201,22 @@ class GameController:
 
         # Playing 8 tricks
         for i_trick in range(8):
-            self.logger.debug("-- Trick {} --".format(i_trick + 1))
+            if debug:
+                self.logger.debug("-- Trick {} --".format(i_trick + 1))
 
             # Players are playing in ascending order, starting with the leader.
-            for i_p in (np.arange(4) + i_p_leader) % 4:
+            for i_p in [(i_p_leader + i) % 4 for i in range(4)]:
 
                 # Get next card from player agent.
                 player = game_state.players[i_p]
+                if profiler is not None:
+                    t_call = timer()
                 selected_card = player.agent.play_card(player.cards_in_hand,
                                                        cards_in_trick=game_state.current_trick_cards,
                                                        game_mode=game_mode)
+                if profiler is not None:
+                    profiler.add("playing", self._profiler_items[i_p]["play_card"], t_call)
+                    t_call = timer()
 
                 # CHECK 1: Does the player have that card?
                 # This check is only for data integrity. More sophisticated logic (trying to play cards that are not available...)
@@ -145,26 +228,37 @@ class GameController:
                                                  cards_in_hand=player.cards_in_hand,
                                                  cards_in_trick=game_state.current_trick_cards):
                     raise ValueError("Player {} tried to play {}, but it's not allowed!".format(player, selected_card))
+                if profiler is not None:
+                    profiler.add("playing", "rule checks", t_call)
 
-                self.logger.debug("Player {} is playing {}.".format(player, selected_card))
+                if debug:
+                    self.logger.debug("Player {} is playing {}.".format(player, selected_card))
                 player.cards_in_hand.remove(selected_card)
                 game_state.current_trick_cards.append(selected_card)
-                game_state.ev_changed.notify()
+                self._notify_changed("playing")
 
             # Determine winner of trick.
+            if profiler is not None:
+                t_call = timer()
             i_win_card = game_mode.get_trick_winner(game_state.current_trick_cards)
+            if profiler is not None:
+                profiler.add("playing", "get_trick_winner", t_call)
             i_win_player = (i_p_leader + i_win_card) % 4
-            win_card = game_state.current_trick_cards[i_win_card]
             win_player = game_state.players[i_win_player]
-            self.logger.debug("Player {} wins the trick with card {}.".format(win_player, win_card))
+            if debug:
+                self.logger.debug("Player {} wins the trick with card {}.".format(win_player, game_state.current_trick_cards[i_win_card]))
             for i, p in enumerate(self.game_state.players):
+                if profiler is not None:
+                    t_call = timer()
                 p.agent.notify_trick_result(game_state.current_trick_cards, rel_taker_id=i-i_win_player)
+                if profiler is not None:
+                    profiler.add("playing", self._profiler_items[i]["notify_trick_result"], t_call)
 
             # Move the trick to the scored cards of the winner.
             i_p_leader = i_win_player
             game_state.leading_player = game_state.players[i_p_leader]
             win_player.cards_in_scored_tricks.extend(game_state.current_trick_cards)
             game_state.current_trick_cards.clear()
-            game_state.ev_changed.notify()
+            self._notify_changed("playing")
 
         assert sum(len(p.cards_in_scored_tricks) for p in game_state.players) == 32
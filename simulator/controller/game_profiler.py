@@ -0,0 +1,75 @@
+from collections import defaultdict
+from timeit import default_timer as timer
+from typing import Optional
+
+
+class GameProfiler:
+    """
+    Opt-in instrumentation for the GameController (see its profiler parameter): measures how much of the time of a game goes
+    to each phase (dealing, bidding, playing, post_play), and within the phases, to the calls of the agents, rule checks
+    and event notifications. Everything else within a phase (logging, bookkeeping) is reported as "(other)".
+
+    Times and call counts are accumulated over all games, until reset(). Profilers of multiple processes can be merged.
+    """
+
+    phases = ["pre_deal", "dealing", "bidding", "playing", "post_play"]
+
+    def __init__(self):
+        self.n_games = 0
+        self.total_s = 0.
+        self._phase_s = defaultdict(float)
+        self._phase_counts = defaultdict(int)
+        self._item_s = defaultdict(float)               # (phase, item) -> seconds
+        self._item_counts = defaultdict(int)
+
+    def reset(self):
+        self.__init__()
+
+    def add_game(self, t_start: float):
+        """ Records a complete game that was started at t_start (a timer() value). """
+        self.n_games += 1
+        self.total_s += timer() - t_start
+
+    def add_phase(self, phase: str, t_start: float) -> float:
+        """ Records a phase that was started at t_start. Returns the current time, so the next phase can start there. """
+        t_now = timer()
+        self._phase_s[phase] += t_now - t_start
+        self._phase_counts[phase] += 1
+        return t_now
+
+    def add(self, phase: str, item: str, t_start: float):
+        """ Records a call within a phase (e.g. "Player 1.play_card"), that was started at t_start. """
+        self._item_s[(phase, item)] += timer() - t_start
+        self._item_counts[(phase, item)] += 1
+
+    def merge(self, other: 'GameProfiler'):
+        """ Adds the measurements of another profiler (e.g. from a worker process). """
+        self.n_games += other.n_games
+        self.total_s += other.total_s
+        for own, others in [(self._phase_s, other._phase_s), (self._phase_counts, other._phase_counts),
+                            (self._item_s, other._item_s), (self._item_counts, other._item_counts)]:
+            for key, value in others.items():
+                own[key] += value
+
+    def report(self, title: Optional[str] = None) -> str:
+        """
+        Returns a table with all measurements (multiple lines), ordered by phase.
+        """
+        lines = ["{} ({} games, {:.0f} us/game):".format(title or "Profile", self.n_games, 1e6 * self.total_s / max(1, self.n_games)),
+                 "{:<52} {:>10} {:>10} {:>10} {:>7}".format("phase / item", "calls", "total s", "us/call", "share")]
+
+        def add_line(name, n_calls, s):
+            lines.append("{:<52} {:>10} {:>10.3f} {:>10.1f} {:>7.1%}".format(name, n_calls, s, 1e6 * s / max(1, n_calls),
+                                                                            s / self.total_s if self.total_s > 0 else 0.))
+
+        for phase in GameProfiler.phases:
+            if phase not in self._phase_s:
+                continue
+            phase_s = self._phase_s[phase]
+            add_line(phase, self._phase_counts[phase], phase_s)
+            items = sorted((item for p, item in self._item_s if p == phase), key=lambda item: -self._item_s[(phase, item)])
+            for item in items:
+                add_line("  " + item, self._item_counts[(phase, item)], self._item_s[(phase, item)])
+            if items:
+                add_line("  (other)", self._phase_counts[phase], phase_s - sum(self._item_s[(phase, item)] for item in items))
+        return "\n".join(lines)
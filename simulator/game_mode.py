@@ -1,7 +1,10 @@
 from enum import Enum
 from typing import Iterable, List
 
-from simulator.card_defs import Card, Pip, Suit
+import numpy as np
+
+from simulator.card_defs import Card, Pip, Suit, new_deck
+from simulator.card_set import CardSet, card_mask, cards_to_mask, popcount, popcounts
 
 
 class GameContract(Enum):
@@ -40,6 +43,65 @@ class GameMode:
         self.trump_suit = trump_suit
         self.ruf_suit = ruf_suit
 
+        # Precomputed masks (see simulator.card_set) for quick rule checks.
+        deck = new_deck()
+        self.trump_mask = cards_to_mask(c for c in deck
+                                        if c.suit == trump_suit
+                                        or (c.pip == Pip.ober and contract != GameContract.wenz)
+                                        or c.pip == Pip.unter)
+
+        # To make matching easier, we redefine suits as "suit classes":
+        # - All trumps are assigned to a special "trump class", and this includes unter and ober (depending on the variant).
+        # - Trump cards do not belong to their original suits (e.g. the class of "Gras Unter" is not Gras, but Trump).
+        # - Since all trumps need to be matched with other trumps, we can simply match everything by class (no matter if trump or not).
+        # For every card id, this is the mask of all cards that have the same class.
+        suit_masks = {suit: cards_to_mask(c for c in deck if c.suit == suit) for suit in Suit}
+        self._card_class_masks = [self.trump_mask if self.is_trump(c) else suit_masks[c.suit] & ~self.trump_mask for c in deck]
+
+        # Rufspiel only: the Rufsau and all (non-trump) cards of the ruf-suit.
+        self._rufsau_mask = 0
+        self._ruf_class_mask = 0
+        if contract == GameContract.rufspiel:
+            rufsau = Card(suit=ruf_suit, pip=Pip.sau)
+            self._rufsau_mask = card_mask(rufsau)
+            self._ruf_class_mask = self._card_class_masks[rufsau.card_id]
+        self._card_class_masks_arr = np.array(self._card_class_masks, dtype=np.int64)
+
+        # Card "power" table for determining the winner of a trick: power_table[lead_card_id, card_id].
+        # The card with the highest power wins.
+        # Ober:             1210 - 1240
+        # Unter:            1110 - 1140
+        # Trump suit:       1001 - 1008
+        # Non-trump suit:      1 -    8 (only if same suit as first card, else 0)
+        # Repeating these here because scoring should not depend on enum definitions.
+        suit_vals = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
+        pip_vals = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
+
+        trump_power = np.zeros(len(deck), dtype=np.int16)
+        pip_power = np.zeros(len(deck), dtype=np.int16)
+        for c in deck:
+            if self.is_trump(c):
+                # Bonus points for being trump
+                if c.pip == Pip.unter:
+                    trump_power[c.card_id] = 1000 + 100 + suit_vals[c.suit]     # More bonus for being trump
+                elif c.pip == Pip.ober:
+                    trump_power[c.card_id] = 1000 + 200 + suit_vals[c.suit]     # Even more bonus, making Schafkopf great again (sorry)
+                else:
+                    trump_power[c.card_id] = 1000 + pip_vals[c.pip]             # Trump-suit cards are ranked according to pip.
+            else:
+                pip_power[c.card_id] = pip_vals[c.pip]
+
+        # Not trump = not so great :( If the first card is a non-trump suit, cards that match it are ranked by pip.
+        self.power_table = np.tile(trump_power, (len(deck), 1))
+        for lead in deck:
+            if not self.is_trump(lead):
+                same_suit = [c.card_id for c in deck if not self.is_trump(c) and c.suit == lead.suit]
+                self.power_table[lead.card_id, same_suit] += pip_power[same_suit]
+
+        # Plain lists are much faster than numpy for single lookups.
+        self._power_rows = self.power_table.tolist()
+        self._trump_power_row = trump_power.tolist()
+
     def __str__(self):
         if self.contract == GameContract.suit_solo:
             return "({} solo)".format(self.trump_suit.name)
@@ -52,13 +114,12 @@ class GameMode:
         """
         Returns true if a card is trump in this game variant.
         """
-        return card.suit == self.trump_suit \
-            or (card.pip == Pip.ober and self.contract != GameContract.wenz) \
-            or card.pip == Pip.unter
+        return (self.trump_mask >> card.card_id) & 1 == 1
 
     def is_play_allowed(self, card: Card, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> bool:
         """
         Returns true if a player is allowed to play a specific card.
+        If you need to check more than one card, legal_moves() is much faster.
         :param card: the card to be played.
         :param cards_in_hand: all cards (including the card) in the Player's hand.
         :param cards_in_trick: all cards in the current trick (excluding the card). Can be empty.
@@ -66,62 +127,88 @@ class GameMode:
         """
 
         assert card in cards_in_hand
-        cards_in_hand = list(cards_in_hand)
+        return (self.legal_moves_mask(cards_to_mask(cards_in_hand), cards_in_trick) >> card.card_id) & 1 == 1
 
-        rufsau = None
-        if self.contract == GameContract.rufspiel:
-            rufsau = Card(suit=self.ruf_suit, pip=Pip.sau)
+    def legal_moves(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> CardSet:
+        """
+        Returns all cards that a player is allowed to play.
+        :param cards_in_hand: all cards in the Player's hand.
+        :param cards_in_trick: all cards in the current trick. Can be empty.
+        :return: the subset of cards_in_hand that can be played under the game rules.
+        """
+        return CardSet.from_mask(self.legal_moves_mask(cards_to_mask(cards_in_hand), cards_in_trick))
+
+    def legal_moves_mask(self, hand_mask: int, cards_in_trick: List[Card]) -> int:
+        """
+        Same as legal_moves(), but works directly on bitmasks (see simulator.card_set).
+        :param hand_mask: mask of all cards in the Player's hand.
+        :param cards_in_trick: all cards in the current trick. Can be empty.
+        :return: mask of all cards that can be played under the game rules.
+        """
 
-        # To make matching easier, we redefine suits as follows:
-        # - All trumps are assigned to a special "trump suit", and this includes unter and ober (depending on the variant).
-        # - Trump cards do not belong to their original suits (e.g. the suit of "Gras Unter" is not Gras, but Trump).
-        # - Since all trumps need to be matched with other trumps, we can simply match everything by suit (no matter if trump or not).
-        def true_suit(c: Card) -> int:
-            return 9001 if self.is_trump(c) else c.suit.value
+        # All rules are expressed by matching the "suit class" masks (see __init__), where all trumps are in a single class.
+        # The Rufspiel masks are 0 in all other game modes, so those rules never apply.
 
         if len(cards_in_trick) == 0:
-            # Player is leading.
-            if self.contract == GameContract.rufspiel and card.suit == self.ruf_suit:
-                # Player is playing ruf-suit.
-                if rufsau in cards_in_hand:
-                    # Player has the Rufsau. In that case, they are not allowed to play any card of ruf-suit unless:
-                    if len(cards_in_hand) == 1:
-                        # If it's the only card left. TODO: or was it 2 instead of 1?
-                        return True
-                    elif sum(c for c in cards_in_hand if true_suit(c) == true_suit(card)) >= 4:
-                        # They have 4 cards of the ruf-suit, which enables the "davonlaufen" maneuver.
-                        # TODO: Check exact rules of Davonlaufen again. This leads to much argument in real life as well :)
-                        return True
-                    else:
-                        # Otherwise, not allowed to play the ruf-suit.
-                        return False
-            # Leading with any card of any other suit is OK.
-            return True
-
-        # Player is not leading, so they have to match the first card.
-        first_card = cards_in_trick[0]
-
-        if true_suit(card) == true_suit(first_card):
-            # Player is matching suit.
-            if self.contract == GameContract.rufspiel and card.suit == self.ruf_suit:
+            # Player is leading. Leading with any card of any suit is OK, except for the ruf-suit:
+            # If the player has the Rufsau, they are not allowed to play any card of the ruf-suit unless:
+            # - it's the only card left. TODO: or was it 2 instead of 1?
+            # - they have 4 cards of the ruf-suit, which enables the "davonlaufen" maneuver.
+            #   TODO: Check exact rules of Davonlaufen again. This leads to much argument in real life as well :)
+            if hand_mask & self._rufsau_mask and hand_mask != self._rufsau_mask \
+                    and popcount(hand_mask & self._ruf_class_mask) < 4:
+                return hand_mask & ~self._ruf_class_mask
+            return hand_mask
+
+        # Player is not leading, so they have to match the first card (if they can).
+        matching_mask = hand_mask & self._card_class_masks[cards_in_trick[0].card_id]
+        if matching_mask:
+            if matching_mask & self._rufsau_mask:
                 # Player is matching the ruf-suit. If they have the ruf-sau, then they need to play it.
-                if card != rufsau and rufsau in cards_in_hand:
-                    # Player has the ruf-sau but did not play it!
-                    # TODO: Check exact rules of Davonlaufen again! Can we do Davonlaufen while matching?
-                    return False
-            # All other cases of matching are OK.
-            return True
+                # TODO: Check exact rules of Davonlaufen again! Can we do Davonlaufen while matching?
+                return self._rufsau_mask
+            return matching_mask
 
-        if any(c for c in cards_in_hand if true_suit(c) == true_suit(first_card)):
-            # Player is not matching suit when they could.
-            return False
+        # Player can't match. One last rule - not allowed to "schmier" the Rufsau if there is any other choice.
+        if hand_mask & self._rufsau_mask and hand_mask != self._rufsau_mask:
+            return hand_mask & ~self._rufsau_mask
+        return hand_mask
 
-        # Finally - player is not leading and not matching because they can't.
-        if card == rufsau and len(cards_in_hand) > 1:
-            # One last rule - not allowed to "schmier" the Rufsau if there is any other choice.
-            return False
+    def legal_moves_masks(self, hand_masks: np.ndarray, lead_card_ids: np.ndarray) -> np.ndarray:
+        """
+        Batched version of legal_moves_mask().
+        :param hand_masks: array of shape (N,) - hand masks of N players (int64).
+        :param lead_card_ids: array of shape (N,) - the id of the first card in each trick, or -1 if the player is leading.
+        :return: array of shape (N,) - masks of all cards that can be played under the game rules.
+        """
+
+        leading = lead_card_ids < 0
+        matching_masks = hand_masks & self._card_class_masks_arr[np.maximum(lead_card_ids, 0)]
+        must_match = ~leading & (matching_masks != 0)
+        legal_masks = np.where(must_match, matching_masks, hand_masks)
+
+        if self._rufsau_mask:
+            # The same Rufspiel rules as in legal_moves_mask().
+            has_rufsau = (hand_masks & self._rufsau_mask != 0) & (hand_masks != self._rufsau_mask)
+            no_ruf_lead = leading & has_rufsau & (popcounts(hand_masks & self._ruf_class_mask) < 4)
+            legal_masks = np.where(no_ruf_lead, hand_masks & ~self._ruf_class_mask, legal_masks)
+            must_play_rufsau = must_match & (matching_masks & self._rufsau_mask != 0)
+            legal_masks = np.where(must_play_rufsau, self._rufsau_mask, legal_masks)
+            no_schmier = ~leading & ~must_match & has_rufsau
+            legal_masks = np.where(no_schmier, hand_masks & ~self._rufsau_mask, legal_masks)
 
-        return True
+        return legal_masks
+
+    def get_card_power(self, card: Card, lead_card: Card = None) -> int:
+        """
+        Returns the "power" of a card in a trick: the card with the highest power takes the trick.
+        :param card: the card.
+        :param lead_card: the first card of the trick. If None, only trumps have power > 0.
+        :return: the power value. Only meaningful for comparing cards in the same trick.
+        """
+        if lead_card is None:
+            return self._trump_power_row[card.card_id]
+        return self._power_rows[lead_card.card_id][card.card_id]
 
     def get_trick_winner(self, cards_in_trick: List[Card]) -> int:
         """
@@ -132,40 +219,15 @@ class GameMode:
 
         assert len(cards_in_trick) == 4
 
-        # Assign values to all cards, and then pick the highest.
-        # Ober:             1210 - 1240
-        # Unter:            1110 - 1140
-        # Trump suit:       1001 - 1008
-        # Non-trump suit:      1 -    8 (only if same suit as first card)
-
-        # Repeating these here because scoring should not depend on enum definitions.
-        suit_vals = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
-        pip_vals = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
-
-        is_trump_first = self.is_trump(cards_in_trick[0])
-
-        i_highest = -1
-        val_highest = -1
-        for i_c, c in enumerate(cards_in_trick):
-            value = 0
-            if self.is_trump(c):
-                # Bonus points for being trump
-                value += 1000
-                if c.pip == Pip.unter:
-                    value += 100 + suit_vals[c.suit]                    # More bonus for being trump
-                elif c.pip == Pip.ober:
-                    value += 200 + suit_vals[c.suit]                    # Even more bonus for being trump, making Schafkopf great again (sorry)
-                else:
-                    value += pip_vals[c.pip]                            # Trump-suit cards are ranked according to pip.
-            else:
-                # Not trump = not so great :(
-                if not is_trump_first and c.suit == cards_in_trick[0].suit:
-                    # If the first card is also a non-trump suit (and this one matches it), then the higher pip wins.
-                    value += pip_vals[c.pip]
-
-            if value > val_highest:
-                val_highest = value
-                i_highest = i_c
+        powers = self._power_rows[cards_in_trick[0].card_id]
+        card_powers = [powers[c.card_id] for c in cards_in_trick]
+        return card_powers.index(max(card_powers))
 
-        assert i_highest >= 0
-        return i_highest
+    def get_trick_winners(self, trick_card_ids: np.ndarray) -> np.ndarray:
+        """
+        Batched version of get_trick_winner().
+        :param trick_card_ids: array of shape (N, 4) - the card ids of N complete tricks, in order of playing.
+        :return: array of shape (N,) - for each trick, the index (into the trick) of the winning card.
+        """
+        card_powers = self.power_table[trick_card_ids[:, :1], trick_card_ids]
+        return np.argmax(card_powers, axis=1)
@@ -1,6 +1,7 @@
 from typing import List, Optional
 from enum import Enum
 
+from simulator.card_set import CardSet
 from simulator.player_agent import PlayerAgent
 from simulator.game_mode import GameMode
 from utils.event_util import Event
@@ -11,7 +12,7 @@ class Player:
         self.name = name
         self.agent = agent
 
-        self.cards_in_hand = set()              # Unordered
+        self.cards_in_hand = CardSet()          # Unordered (bitmask)
         self.cards_in_scored_tricks = []        # Order of playing may be important
 
     def __str__(self):
@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
 from typing import Iterable, List, Dict, Optional
 
+import numpy as np
+
 from simulator.card_defs import Card
+from simulator.card_set import CardSet, card_from_id
 from simulator.game_mode import GameMode
 
 
@@ -13,6 +16,10 @@ class PlayerAgent(ABC):
           unwanted behavior. I strongly recommend the @override decorator for the optional methods.
     """
 
+    # True if play_card() is a deterministic function of the position: cards in hand, cards in the trick, game mode and
+    # the seat of the declaring player (relative to this player). Then, its decisions can be cached (see CachedAgent).
+    cacheable = False
+
     def __init__(self, player_id: int):
         assert 0 <= player_id < 4
         self.player_id = player_id
@@ -28,6 +35,22 @@ class PlayerAgent(ABC):
         """
         pass                # Must be implemented by all agents
 
+    def play_card_batch(self, hand_masks: np.ndarray, trick_card_ids: np.ndarray, game_mode: GameMode) -> np.ndarray:
+        """
+        Batched version of play_card(), for many tables at once (see BatchGameEnv). The agent plays the same seat at every table,
+        so it must not keep any per-game state.
+        Agents can override this with a vectorized implementation. The default simply calls play_card() for every table.
+        :param hand_masks: array of shape (N,) - the hand masks of the player (see simulator.card_set).
+        :param trick_card_ids: array of shape (N, 4) - the ids of the cards in the current tricks, in order of playing (-1 = empty).
+        :param game_mode: the game mode that is played at every table.
+        :return: array of shape (N,) - the ids of the cards that the agent wants to play.
+        """
+        card_ids = np.empty(len(hand_masks), dtype=np.int64)
+        for i, (hand_mask, trick) in enumerate(zip(hand_masks, trick_card_ids)):
+            cards_in_trick = [card_from_id(card_id) for card_id in trick if card_id >= 0]
+            card_ids[i] = self.play_card(CardSet.from_mask(int(hand_mask)), cards_in_trick=cards_in_trick, game_mode=game_mode).card_id
+        return card_ids
+
     def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
         """
         Notifies the agent of the result of the current trick.
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the packages of the repo (simulator, agents, ...) from the repo root, like the top-level scripts do.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
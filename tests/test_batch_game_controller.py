@@ -0,0 +1,68 @@
+from typing import Iterable, List
+
+import numpy as np
+import pytest
+
+from agents.dummy.random_card_agent import RandomCardAgent
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.card_defs import Card, Suit
+from simulator.controller.batch_game_controller import BatchGameController
+from simulator.controller.dealing_behavior import DealFairly, DealWinnableHand
+from simulator.controller.game_controller import GameController
+from simulator.game_mode import GameMode, GameContract
+from simulator.game_state import Player
+from simulator.player_agent import PlayerAgent
+
+
+class _RecordingAgent(PlayerAgent):
+    # Plays like another agent and records (player id, card id) of every card that it plays.
+
+    def __init__(self, agent: PlayerAgent, record: List):
+        super().__init__(agent.player_id)
+        self.agent = agent
+        self.record = record
+
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        card = self.agent.play_card(cards_in_hand, cards_in_trick, game_mode)
+        self.record.append((self.player_id, card.card_id))
+        return card
+
+
+@pytest.mark.parametrize("trump_suit", list(Suit), ids=str)
+def test_same_results_as_game_controller(trump_suit: Suit):
+    # Plays games with the GameController, then replays the same cards with the BatchGameController (same deals and dealers).
+    # Every card must be played by the same player, and the same players must win.
+    np.random.seed(int(trump_suit))
+    n_games = 100
+    for declaring_player_id in range(4):
+        game_mode = GameMode(GameContract.suit_solo, trump_suit=trump_suit, declaring_player_id=declaring_player_id)
+
+        # One random player, so the games also go where the rules would never take them.
+        record = []
+        i_random = np.random.randint(4)
+        agents = [_RecordingAgent(RandomCardAgent(i) if i == i_random else RuleBasedAgent(i), record) for i in range(4)]
+        controller = GameController([Player(f"{i}", agent=a) for i, a in enumerate(agents)], forced_game_mode=game_mode, silent=True)
+
+        # Half of the games with a winnable hand for the declaring player, so both sides win sometimes.
+        deals = np.concatenate([DealFairly().deal_batch(n_games // 2), DealWinnableHand(game_mode).deal_batch(n_games - n_games // 2)])
+        dealers = np.random.randint(4, size=n_games)
+        player_win = []
+        played = []
+        for deal, i_player_dealer in zip(deals, dealers):
+            record.clear()
+            player_win.append(controller.run_game(deal=[int(mask) for mask in deal], i_player_dealer=int(i_player_dealer)))
+            played.append(list(record))
+        played = np.array(played)                   # Shape (n_games, 32, 2): player id and card id
+
+        batch_controller = BatchGameController(n_games, game_mode)
+        batch_controller.reset(deals, dealers)
+        rewards = np.zeros((n_games, 4))
+        for i_card in range(32):
+            np.testing.assert_array_equal(batch_controller.i_player_current, played[:, i_card, 0])
+            _, step_rewards, done = batch_controller.step(played[:, i_card, 1])
+            rewards += step_rewards
+            assert done.all() == (i_card == 31)
+
+        np.testing.assert_array_equal(batch_controller.player_win, np.array(player_win))
+        np.testing.assert_array_equal(rewards, np.array(player_win, dtype=float))
+        assert 0 < np.sum(batch_controller.player_win[:, declaring_player_id]) < n_games
@@ -0,0 +1,107 @@
+from typing import Iterable, List
+
+import pytest
+
+from agents.dummy.random_card_agent import RandomCardAgent
+from simulator.cached_agent import CachedAgent
+from simulator.card_defs import Card, Pip, Suit
+from simulator.card_set import CardSet
+from simulator.game_mode import GameMode, GameContract
+from simulator.player_agent import PlayerAgent
+
+
+class _CountingAgent(PlayerAgent):
+    # Deterministic agent that counts how often it was asked. Plays the first card of its hand, in card id order.
+    cacheable = True
+
+    def __init__(self, player_id: int):
+        super().__init__(player_id)
+        self.n_calls = 0
+
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        self.n_calls += 1
+        return min(cards_in_hand, key=lambda c: c.card_id)
+
+
+_hand = CardSet([Card(Suit.herz, Pip.sau), Card(Suit.gras, Pip.neun), Card(Suit.eichel, Pip.ober)])
+_schellen_sau = Card(Suit.schellen, Pip.sau)
+_schellen_zehn = Card(Suit.schellen, Pip.zehn)
+
+
+def _solo(trump_suit: Suit = Suit.herz, declaring_player_id: int = 0) -> GameMode:
+    return GameMode(GameContract.suit_solo, trump_suit=trump_suit, declaring_player_id=declaring_player_id)
+
+
+def _distinct_positions():
+    # New objects on every call.
+    return [
+        (_hand, [], _solo()),
+        # Different cards in the trick, or in a different order
+        (_hand, [_schellen_sau], _solo()),
+        (_hand, [_schellen_zehn], _solo()),
+        (_hand, [_schellen_sau, _schellen_zehn], _solo()),
+        (_hand, [_schellen_zehn, _schellen_sau], _solo()),
+        # Different declaring player (relative to the agent)
+        (_hand, [], _solo(declaring_player_id=1)),
+        (_hand, [], _solo(declaring_player_id=3)),
+        # Different game mode
+        (_hand, [], _solo(trump_suit=Suit.gras)),
+        (_hand, [], GameMode(GameContract.wenz, declaring_player_id=0)),
+        (_hand, [], GameMode(GameContract.rufspiel, ruf_suit=Suit.eichel, declaring_player_id=0)),
+        # Different hand
+        (CardSet(list(_hand)[:2]), [], _solo()),
+    ]
+
+
+def test_only_identical_positions_are_hits():
+    agent = CachedAgent(_CountingAgent(1))
+    n_positions = len(_distinct_positions())
+    cards = [agent.play_card(*position) for position in _distinct_positions()]
+    assert agent.agent.n_calls == n_positions
+    assert (agent.n_hits, agent.n_misses) == (0, n_positions)
+
+    # Equal positions (with new objects) are all hits, and return the same cards.
+    assert [agent.play_card(*position) for position in _distinct_positions()] == cards
+    assert agent.agent.n_calls == n_positions
+    assert agent.n_hits == n_positions
+
+
+def test_least_recently_used_position_is_evicted():
+    agent = CachedAgent(_CountingAgent(0), capacity=2)
+    a, b, c = [(_hand, trick, _solo()) for trick in [[], [_schellen_sau], [_schellen_zehn]]]
+    agent.play_card(*a)
+    agent.play_card(*b)
+    agent.play_card(*a)             # Now, b is the least recently used
+    agent.play_card(*c)             # Evicts b
+    assert agent.agent.n_calls == 3
+
+    agent.play_card(*a)
+    agent.play_card(*c)
+    assert agent.agent.n_calls == 3
+    agent.play_card(*b)
+    assert agent.agent.n_calls == 4
+
+
+def test_stats_and_clear():
+    agent = CachedAgent(_CountingAgent(0))
+    assert agent.hit_rate == 0.
+    for _ in range(4):
+        agent.play_card(_hand, [], _solo())
+    assert (agent.n_hits, agent.n_misses) == (3, 1)
+    assert agent.hit_rate == 0.75
+
+    agent.reset_stats()
+    assert (agent.n_hits, agent.n_misses, agent.hit_rate) == (0, 0, 0.)
+    agent.play_card(_hand, [], _solo())
+    assert agent.hit_rate == 1.
+
+    # clear() drops the positions, but keeps the stats.
+    agent.clear()
+    agent.play_card(_hand, [], _solo())
+    assert (agent.n_hits, agent.n_misses) == (1, 1)
+    assert agent.agent.n_calls == 2
+
+
+def test_agent_must_be_cacheable():
+    with pytest.raises(ValueError):
+        CachedAgent(RandomCardAgent(0))
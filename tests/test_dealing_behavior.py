@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from simulator.card_defs import Suit
+from simulator.card_set import FULL_DECK_MASK, cards_to_mask, mask_to_cards
+from simulator.controller.dealing_behavior import DealWinnableHand
+from simulator.game_mode import GameMode, GameContract
+
+
+def _solo(declaring_player_id: int = 1) -> GameMode:
+    return GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=declaring_player_id)
+
+
+def test_deal_batch_only_deals_suitable_hands():
+    game_mode = _solo()
+    dealer = DealWinnableHand(game_mode)
+    np.random.seed(0)
+    hands = dealer.deal_batch(1000)
+
+    assert hands.shape == (1000, 4)
+    assert np.all(np.bitwise_or.reduce(hands, axis=1) == FULL_DECK_MASK)
+    assert all(len(mask_to_cards(int(mask))) == 8 for mask in hands.flatten())
+    assert all(dealer._are_cards_suitable(mask_to_cards(int(mask)), game_mode) for mask in hands[:, 1])
+
+
+def test_deal_batch_matches_shuffling():
+    # The direct sampling must produce the same distribution as shuffling until the hand is suitable (the old dealer).
+    # Compared with chi-square tests over the compositions of the declaring hand (how many cards of each group,
+    # see DealWinnableHand._group_cards()), and over how often each card is in the hands of the players.
+    stats = pytest.importorskip("scipy.stats")
+
+    dealer = DealWinnableHand(_solo())
+    n = 5000
+    np.random.seed(0)
+    sampled = dealer.deal_batch(n)
+    shuffled = np.array([[cards_to_mask(cards) for cards in dealer._deal_hands_by_shuffling()] for _ in range(n)], dtype=np.int64)
+
+    def compositions(hands: np.ndarray) -> np.ndarray:
+        group_masks = [cards_to_mask(group) for group in dealer._card_groups]
+        return np.array([tuple(len(mask_to_cards(int(mask) & group_mask)) for group_mask in group_masks) for mask in hands[:, 1]])
+
+    keys, counts = np.unique(np.concatenate([compositions(sampled), compositions(shuffled)]), axis=0, return_inverse=True)
+    table = np.array([np.bincount(counts[:n], minlength=len(keys)), np.bincount(counts[n:], minlength=len(keys))])
+    # Rare compositions are merged into a single bin, so the chi-square approximation holds.
+    rare = table.sum(axis=0) < 20
+    table = np.concatenate([table[:, ~rare], table[:, rare].sum(axis=1, keepdims=True)], axis=1)
+    assert stats.chi2_contingency(table).pvalue > 0.001
+
+    for i_player in range(4):
+        card_counts = np.array([[np.sum((hands[:, i_player] >> card_id) & 1) for card_id in range(32)]
+                                for hands in [sampled, shuffled]])
+        assert stats.chi2_contingency(card_counts).pvalue > 0.001, f"Player {i_player}"
+
+
+def test_other_contracts_fall_back_to_shuffling():
+    # Creating the dealer works for any game mode (as before). Dealing needs _are_cards_suitable(), which only knows Suit-solo.
+    dealer = DealWinnableHand(GameMode(GameContract.wenz, declaring_player_id=0))
+    with pytest.raises(NotImplementedError):
+        dealer.deal_batch(1)
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+from eval_queue import EvalQueue, LeaseLostException
+from utils.wakeup_util import WakeupListener
+
+
+def test_uses_rollback_journal(tmp_path):
+    # WAL needs shared memory between the processes, which breaks on network filesystems.
+    db_path = str(tmp_path / "eval_queue.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+    queue = EvalQueue(db_path)
+    assert queue._conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    queue.close()
+
+
+def test_submit_lease_complete(tmp_path):
+    db_path = str(tmp_path / "eval_queue.sqlite")
+    trainer = EvalQueue(db_path, worker_id="trainer")
+    evaluator = EvalQueue(db_path, worker_id="evaluator")
+    other_evaluator = EvalQueue(db_path, worker_id="other", lease_s=0.)
+
+    assert trainer.submit(0, "cp1.h5") == []
+    assert trainer.submit(0, "cp2.h5") == ["cp1.h5"]
+
+    job = evaluator.lease()
+    assert job.checkpoint == "cp2.h5"
+    assert other_evaluator.lease() is None
+    assert evaluator.complete(job, 0.4, best_checkpoint="best-0.4.h5")
+    assert trainer.best_result(0) == ("best-0.4.h5", 0.4)
+
+    # A lease of 0s expires immediately, so the job can be taken over.
+    trainer.submit(0, "cp3.h5")
+    job = other_evaluator.lease()
+    assert evaluator.lease() == job
+    with pytest.raises(LeaseLostException):
+        other_evaluator.complete(job, 0.5, best_checkpoint="best-0.5.h5")
+    assert not evaluator.complete(job, 0.3, best_checkpoint="best-0.3.h5")
+    assert trainer.best_result(0) == ("best-0.4.h5", 0.4)
+
+    for queue in [trainer, evaluator, other_evaluator]:
+        queue.close()
+
+
+def test_waiting_evaluators_are_woken_up(tmp_path):
+    queue = EvalQueue(str(tmp_path / "eval_queue.sqlite"), worker_id="evaluator")
+    listener = WakeupListener(queue.wakeup_channel)
+    try:
+        assert queue.lease() is None
+        assert not listener.wait(timeout=0)
+
+        # Another process (the trainer) opens the same file: same channel.
+        trainer = EvalQueue(str(tmp_path / "eval_queue.sqlite"), worker_id="trainer")
+        assert trainer.wakeup_channel == queue.wakeup_channel
+        trainer.submit(0, "cp1.h5")
+        assert listener.wait(timeout=1)
+
+        # A job that is given back to the queue is available again.
+        job = queue.lease()
+        queue.release(job)
+        assert listener.wait(timeout=1)
+        assert queue.lease() == job
+        trainer.close()
+    finally:
+        listener.close()
+        queue.close()
+        shutil.rmtree(os.path.join(tempfile.gettempdir(), queue.wakeup_channel), ignore_errors=True)
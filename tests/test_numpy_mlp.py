@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+
+
+def _build_keras_model(input_size: int, neurons, output_size: int):
+    # Same layout as DQNAgent._build_model().
+    from tensorflow.keras import Sequential, Input
+    from tensorflow.keras.layers import Dense
+
+    model = Sequential()
+    model.add(Input(shape=(input_size,)))
+    for n in neurons:
+        model.add(Dense(n, activation='relu'))
+    model.add(Dense(output_size, activation='linear'))
+    return model
+
+
+def test_from_keras_matches_keras_predict(tmp_path):
+    tf = pytest.importorskip("tensorflow")
+    tf.random.set_seed(0)
+    np.random.seed(0)
+
+    model = _build_keras_model(input_size=40, neurons=[64, 32], output_size=32)
+    # Inputs like the ones from the StateEncoder (0/1 features).
+    x = np.random.randint(0, 2, size=(256, 40)).astype(np.float32)
+    expected = np.array(model.predict_on_batch(x))
+
+    network = NumpyMLP.from_keras(model)
+    actual = network.predict(x)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+    assert np.array_equal(np.argmax(actual, axis=1), np.argmax(expected, axis=1))
+
+    # Saving and loading must not change the outputs.
+    filepath = str(tmp_path / "weights.npz")
+    network.save(filepath, metadata={"test": 1})
+    loaded, metadata = NumpyMLP.load(filepath)
+    assert metadata == {"test": 1}
+    np.testing.assert_array_equal(loaded.predict(x), actual)
+
+
+def test_from_keras_rejects_other_activations():
+    pytest.importorskip("tensorflow")
+    from tensorflow.keras import Sequential, Input
+    from tensorflow.keras.layers import Dense
+
+    model = Sequential([Input(shape=(4,)), Dense(8, activation='tanh'), Dense(2, activation='linear')])
+    with pytest.raises(ValueError):
+        NumpyMLP.from_keras(model)
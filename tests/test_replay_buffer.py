@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+from agents.reinforcment_learning.replay_buffer import ReplayBuffer
+
+
+def _fill_value(i: int) -> int:
+    return i % 2
+
+
+def _append(buffer: ReplayBuffer, value: int):
+    # All fields of an experience agree on the value, so a reader can detect experiences that are half overwritten.
+    state = np.full(buffer.state_size, value)
+    available_actions = np.full(buffer.action_size, bool(value))
+    buffer.append(state, action_id=value, reward=float(value), next_state=state, terminated=bool(value),
+                  available_actions=available_actions)
+
+
+def _is_consistent(batch) -> np.ndarray:
+    states, action_ids, rewards, next_states, terminated, available_actions = batch
+    return ((states == action_ids[:, np.newaxis]).all(axis=1) & (next_states == action_ids[:, np.newaxis]).all(axis=1)
+            & (rewards == action_ids) & (terminated == action_ids.astype(bool))
+            & (available_actions == terminated[:, np.newaxis]).all(axis=1))
+
+
+def test_append_and_sample():
+    np.random.seed(0)
+    buffer = ReplayBuffer(capacity=10, state_size=20, action_size=9)
+    for i in range(25):
+        _append(buffer, _fill_value(i))
+    assert len(buffer) == 10
+    assert buffer.n_appended == 25
+
+    batch = buffer.sample(100)
+    assert all(len(x) == 100 for x in batch)
+    assert _is_consistent(batch).all()
+
+
+def test_sample_never_sees_partial_experiences():
+    # A writer keeps overwriting a small buffer while it is sampled. Both use the same lock (as in actor_learner.py),
+    # so every sampled experience must be complete.
+    np.random.seed(0)
+    # The capacity is odd, so every append changes the values in its slot.
+    capacity, state_size, action_size = 5, 64, 32
+    memory = bytearray(ReplayBuffer.n_bytes(capacity, state_size, action_size))
+    lock = threading.Lock()
+    writer = ReplayBuffer(capacity, state_size, action_size, buffer=memory, lock=lock)
+    reader = ReplayBuffer(capacity, state_size, action_size, buffer=memory, lock=lock)
+    for i in range(capacity):
+        _append(writer, _fill_value(i))
+
+    stop = threading.Event()
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            _append(writer, _fill_value(i))
+            i += 1
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        n_inconsistent = sum(int((~_is_consistent(reader.sample(8))).sum()) for _ in range(3000))
+    finally:
+        stop.set()
+        thread.join()
+    assert n_inconsistent == 0
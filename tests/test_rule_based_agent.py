@@ -0,0 +1,109 @@
+import random
+
+import numpy as np
+import pytest
+
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.card_defs import Pip, Suit, new_deck
+from simulator.card_set import CardSet, card_from_id
+from simulator.game_mode import GameMode, GameContract
+from tests import reference_rule_based_agent
+
+
+@pytest.mark.parametrize("trump_suit", list(Suit), ids=str)
+@pytest.mark.parametrize("declaring_player_id", range(4))
+def test_same_decisions_as_reference(trump_suit: Suit, declaring_player_id: int):
+    # Plays random games and compares the decisions of both agents in every position, for all seats.
+    # Both agents draw the same random numbers (the choice between multiple saus), so their decisions must be identical.
+    game_mode = GameMode(GameContract.suit_solo, trump_suit=trump_suit, declaring_player_id=declaring_player_id)
+    agents = [RuleBasedAgent(i) for i in range(4)]
+    reference_agents = [reference_rule_based_agent.RuleBasedAgent(i) for i in range(4)]
+    rng = random.Random(int(trump_suit) * 4 + declaring_player_id)
+
+    for _ in range(100):
+        cards = new_deck()
+        rng.shuffle(cards)
+        hands = [CardSet(cards[i * 8:(i + 1) * 8]) for i in range(4)]
+        i_leader = rng.randrange(4)
+        for _ in range(8):
+            cards_in_trick = []
+            for k in range(4):
+                i_player = (i_leader + k) % 4
+                seed = rng.randrange(2 ** 31)
+                np.random.seed(seed)
+                card = agents[i_player].play_card(hands[i_player], cards_in_trick, game_mode)
+                np.random.seed(seed)
+                reference_card = reference_agents[i_player].play_card(hands[i_player], cards_in_trick, game_mode)
+                assert card == reference_card, f"Hand: {hands[i_player]}, trick: {[str(c) for c in cards_in_trick]}"
+
+                # Continue with a random legal card half of the time, so we also get positions that the agents would avoid.
+                if rng.random() < 0.5:
+                    card = rng.choice(list(game_mode.legal_moves(hands[i_player], cards_in_trick)))
+                hands[i_player].remove(card)
+                cards_in_trick.append(card)
+            i_leader = (i_leader + game_mode.get_trick_winner(cards_in_trick)) % 4
+
+
+def _random_positions(game_mode: GameMode, player_id: int, n_positions: int, rng: random.Random):
+    # Positions of the player from random games: arrays of hand masks and trick card ids (see PlayerAgent.play_card_batch()).
+    hand_masks, trick_card_ids = [], []
+    while len(hand_masks) < n_positions:
+        cards = new_deck()
+        rng.shuffle(cards)
+        hands = [CardSet(cards[i * 8:(i + 1) * 8]) for i in range(4)]
+        i_leader = rng.randrange(4)
+        for _ in range(8):
+            cards_in_trick = []
+            for k in range(4):
+                i_player = (i_leader + k) % 4
+                if i_player == player_id:
+                    hand_masks.append(hands[i_player].mask)
+                    trick_card_ids.append([c.card_id for c in cards_in_trick] + [-1] * (4 - len(cards_in_trick)))
+                card = rng.choice(list(game_mode.legal_moves(hands[i_player], cards_in_trick)))
+                hands[i_player].remove(card)
+                cards_in_trick.append(card)
+            i_leader = (i_leader + game_mode.get_trick_winner(cards_in_trick)) % 4
+    return np.array(hand_masks[:n_positions], dtype=np.int64), np.array(trick_card_ids[:n_positions], dtype=np.int64)
+
+
+@pytest.mark.parametrize("trump_suit", list(Suit), ids=str)
+@pytest.mark.parametrize("declaring_player_id", range(4))
+def test_batch_same_decisions_as_play_card(trump_suit: Suit, declaring_player_id: int):
+    # play_card_batch() evaluates the rules with NumPy, or falls back to play_card() for small batches. Both must make
+    # the same decisions as play_card(), for all seats. Only the random choice between multiple saus when leading may differ
+    # in the NumPy version, since it draws different random numbers.
+    game_mode = GameMode(GameContract.suit_solo, trump_suit=trump_suit, declaring_player_id=declaring_player_id)
+    rng = random.Random(int(trump_suit) * 4 + declaring_player_id)
+    for player_id in range(4):
+        agent = RuleBasedAgent(player_id)
+        hand_masks, trick_card_ids = _random_positions(game_mode, player_id, 200, rng)
+        seed = rng.randrange(2 ** 31)
+        np.random.seed(seed)
+        expected = np.array([agent.play_card(CardSet.from_mask(int(hand_mask)), [card_from_id(c) for c in trick if c >= 0],
+                                             game_mode).card_id
+                             for hand_mask, trick in zip(hand_masks, trick_card_ids)])
+
+        # NumPy version.
+        assert len(hand_masks) >= RuleBasedAgent.min_batch_size
+        card_ids = agent.play_card_batch(hand_masks, trick_card_ids, game_mode)
+        for i in np.flatnonzero(card_ids != expected):
+            cards = [card_from_id(int(card_ids[i])), card_from_id(int(expected[i]))]
+            assert trick_card_ids[i, 0] < 0 and all(c.pip == Pip.sau and not game_mode.is_trump(c) for c in cards), \
+                f"Player {player_id}, hand: {CardSet.from_mask(int(hand_masks[i]))}, trick: {trick_card_ids[i]}"
+            assert (hand_masks[i] >> card_ids[i]) & 1
+
+        # Fallback to play_card(), which draws the same random numbers.
+        n_small = RuleBasedAgent.min_batch_size - 1
+        np.random.seed(seed)
+        np.testing.assert_array_equal(agent.play_card_batch(hand_masks[:n_small], trick_card_ids[:n_small], game_mode),
+                                      expected[:n_small])
+
+
+@pytest.mark.parametrize("contract", [GameContract.rufspiel, GameContract.wenz], ids=str)
+def test_other_contracts_not_implemented(contract: GameContract):
+    # Like the reference, the agent can only play a Suit-solo.
+    game_mode = GameMode(contract, ruf_suit=Suit.eichel if contract == GameContract.rufspiel else None, declaring_player_id=0)
+    hand = CardSet(new_deck()[:8])
+    for agent in [RuleBasedAgent(1), reference_rule_based_agent.RuleBasedAgent(1)]:
+        with pytest.raises(NotImplementedError):
+            agent.play_card(hand, [], game_mode)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from agents.reinforcment_learning.shared_weights import SharedWeights
+from utils.wakeup_util import WakeupListener
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+_layer_shapes = [(6, 4), (4, 2)]
+
+
+def _random_network() -> NumpyMLP:
+    return NumpyMLP([(np.random.rand(n_in, n_out), np.random.rand(n_out)) for n_in, n_out in _layer_shapes])
+
+
+def _run_python(code: str, **kwargs):
+    subprocess.run([sys.executable, "-c", code], cwd=_repo_dir, check=True, **kwargs)
+
+
+def _exists(name: str) -> bool:
+    # Without attaching, which would interfere with the resource tracker of this process.
+    return os.path.exists(os.path.join("/dev/shm", name))
+
+
+@pytest.fixture
+def segment_name():
+    if not os.path.isdir("/dev/shm"):
+        pytest.skip("Shared memory segments are not visible in /dev/shm.")
+    name = f"alphasheep-test-{os.getpid()}"
+    yield name
+    if _exists(name):
+        shared_weights = SharedWeights.attach(name)
+        shared_weights.close()
+        shared_weights.unlink()
+    shutil.rmtree(os.path.join(tempfile.gettempdir(), SharedWeights.wakeup_channel(name)), ignore_errors=True)
+
+
+def test_publish_read_and_wake_up(segment_name):
+    np.random.seed(0)
+    writer = SharedWeights.create(_layer_shapes, name=segment_name)
+    listener = WakeupListener(SharedWeights.wakeup_channel(segment_name))
+    try:
+        reader = SharedWeights.attach(segment_name)
+        assert reader.segment_id == writer.segment_id
+        assert reader.read() == (None, 0)
+        assert not listener.wait(timeout=0)
+
+        network = _random_network()
+        writer.publish(network)
+        writer.publish(network)
+        assert listener.wait(timeout=1)
+        assert not listener.wait(timeout=0)         # Both wakeups were consumed at once
+
+        received, version = reader.read()
+        assert version == 2
+        assert reader.read(newer_than=2) == (None, 2)
+        x = np.random.rand(3, 6)
+        np.testing.assert_array_equal(received.predict(x), network.predict(x))
+        reader.close()
+    finally:
+        listener.close()
+        writer.close()
+        writer.unlink()
+
+
+def test_segment_is_destroyed_with_its_owner(segment_name):
+    # A reader that attaches and exits must not destroy the segment.
+    writer = SharedWeights.create(_layer_shapes, name=segment_name)
+    _run_python(f"from agents.reinforcment_learning.shared_weights import SharedWeights\n"
+                f"SharedWeights.attach('{segment_name}', track=False).close()")
+    assert _exists(segment_name)
+    writer.close()
+    writer.unlink()
+    assert not _exists(segment_name)
+
+    # An owner that exits without unlink() (e.g. a trainer that crashed) does not leave the segment behind.
+    _run_python(f"from agents.reinforcment_learning.shared_weights import SharedWeights\n"
+                f"SharedWeights.create_or_take_over({_layer_shapes}, name='{segment_name}').close()",
+                stderr=subprocess.DEVNULL)          # The resource tracker warns about the "leaked" segment
+    for _ in range(100):
+        if not _exists(segment_name):
+            break
+        time.sleep(0.05)                            # The resource tracker cleans up after the process has exited
+    assert not _exists(segment_name)
+
+
+def test_take_over(segment_name):
+    np.random.seed(0)
+    writer = SharedWeights.create(_layer_shapes, name=segment_name)
+    writer.publish(_random_network())
+    new_writer = SharedWeights.create_or_take_over(_layer_shapes, name=segment_name)
+    assert new_writer.segment_id == writer.segment_id
+    assert new_writer.version == 1
+    writer.close()
+    with pytest.raises(ValueError):
+        SharedWeights.create_or_take_over([(6, 2)], name=segment_name)
+    new_writer.close()
+    new_writer.unlink()
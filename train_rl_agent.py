@@ -5,13 +5,20 @@ import argparse
 import logging
 import os
 import shutil
+import time
 from collections import deque
 
+from actor_learner import ActorLearner, run_batch_episodes
 from agents.dummy.random_card_agent import RandomCardAgent
 from agents.reinforcment_learning.dqn_agent import DQNAgent
+from agents.reinforcment_learning.numpy_mlp import NumpyMLP
+from agents.reinforcment_learning.shared_weights import SharedWeights
 from agents.rule_based.rule_based_agent import RuleBasedAgent
+from eval_queue import EvalQueue
+from simulator.controller.batch_game_env import BatchGameEnv
 from simulator.controller.dealing_behavior import DealWinnableHand
 from simulator.controller.game_controller import GameController
+from simulator.controller.game_profiler import GameProfiler
 from simulator.card_defs import Suit
 from simulator.game_mode import GameContract, GameMode
 from simulator.game_state import Player
@@ -65,11 +72,46 @@ def main():
         else:
             agents[i].load_weights(weights_path)
 
-    players = [Player(f"Player {i} ({a.__class__.__name__})", agent=a) for i, a in enumerate(agents)]
-
     # Rig the game so Player 0 has the cards to play a Herz-Solo. Force them to play it.
     game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
-    controller = GameController(players, dealing_behavior=DealWinnableHand(game_mode), forced_game_mode=game_mode)
+
+    # Optional: simulate multiple tables in parallel, so the learner can decide for all of them with a single forward pass.
+    # Optional: play in multiple actor processes, while this process only trains (see actor_learner.py).
+    # Default is a single table, driven by the GameController.
+    n_tables = config["training"].get("n_parallel_tables", 1)
+    n_actors = config["training"].get("n_actors", 0)
+    actor_learner = None
+
+    # Optional: measure how much time is spent in each phase of the games (only with a single table).
+    profiler = GameProfiler() if config["training"].get("profile", False) else None
+    if profiler is not None and (n_tables > 1 or n_actors > 0):
+        raise ValueError("Profiling is only supported with a single table and no actors.")
+
+    if n_tables > 1 or n_actors > 0:
+        learner_ids = [i for i, a in enumerate(agents) if isinstance(a, DQNAgent)]
+        if len(learner_ids) != 1:
+            raise ValueError("Parallel tables and actors are only supported with exactly one DQNAgent.")
+        learner_id = learner_ids[0]
+        opponents = [a if i != learner_id else None for i, a in enumerate(agents)]
+
+        if n_actors > 0:
+            actor_learner = ActorLearner(config, agents[learner_id], opponents=opponents, game_mode=game_mode,
+                                         n_actors=n_actors, n_tables=n_tables)
+            run_episodes = actor_learner.run_episodes
+        else:
+            logger.info(f"Simulating {n_tables} tables in parallel.")
+            env = BatchGameEnv(n_tables, game_mode, opponents=opponents, learner_id=learner_id,
+                               dealing_behavior=DealWinnableHand(game_mode))
+
+            def run_episodes():
+                return run_batch_episodes(env, agents[learner_id])
+    else:
+        players = [Player(f"Player {i} ({a.__class__.__name__})", agent=a) for i, a in enumerate(agents)]
+        controller = GameController(players, dealing_behavior=DealWinnableHand(game_mode), forced_game_mode=game_mode,
+                                    profiler=profiler, silent=True)
+
+        def run_episodes():
+            return [controller.run_game()[0]]
 
     n_episodes = config["training"]["n_episodes"]
     logger.info(f"Will train for {n_episodes} episodes.")
@@ -83,38 +125,72 @@ def main():
 
     save_every_s = config["training"]["save_checkpoints_every_s"]
 
+    # Optional: publish weights for eval_rl_agent.py (--channel=shared_memory) via shared memory instead of files.
+    # Only works if the evaluator runs on the same machine. Default is "file": the checkpoints are passed via the evaluation queue
+    # (see eval_queue.py), which also needs all processes on the same machine, but they can be started independently.
+    eval_shared_weights = {}
+    eval_queue = None
+    eval_channel = config["training"].get("eval_channel", "file")
+    if eval_channel == "shared_memory":
+        for i, weights_path in agent_checkpoint_paths.items():
+            layer_shapes = [kernel.shape for kernel, _ in NumpyMLP.from_keras(agents[i].q_network).layers]
+            eval_shared_weights[i] = SharedWeights.create_or_take_over(layer_shapes, name=SharedWeights.name_for_checkpoint(weights_path))
+    elif eval_channel == "file":
+        eval_queue = EvalQueue(os.path.join(experiment_dir, "eval_queue.sqlite"))
+    else:
+        raise ValueError(f'Unknown eval_channel: "{eval_channel}"')
+
     time_start = timer()
     time_last_save = timer()
-    for i_episode in range(n_episodes):
+    i_episode = 0
+    i_episode_next_log = 100
+    while i_episode < n_episodes:
         if i_episode > 0:
             # Calculate avg win%
-            if i_episode < sma_window_len:
-                win_rate = n_won / i_episode
-            else:
+            while len(won_deque) > sma_window_len:
                 if won_deque.popleft() is True:
                     n_won -= 1
-                win_rate = n_won / sma_window_len
+            win_rate = n_won / len(won_deque)
 
             # Log
-            if i_episode % 100 == 0:
+            if i_episode >= i_episode_next_log:
                 s_elapsed = timer() - time_start
                 logger.info("Ran {} Episodes. Win rate (last {} episodes) is {:.1%}. Speed is {:.0f} episodes/second.".format(
                     i_episode, sma_window_len, win_rate, i_episode/s_elapsed))
+                if profiler is not None:
+                    logger.info(profiler.report("Profile of the last {} episodes".format(profiler.n_games)))
+                    profiler.reset()
+                i_episode_next_log = (i_episode // 100 + 1) * 100
 
             # Save model checkpoint.
-            # Also make a copy for evaluation - the eval jobs will sync on this file and later remove it.
+            # Also make the weights available for evaluation: either publish them to shared memory, or submit a copy of the file
+            # to the evaluation queue (the eval jobs will later remove it). Older copies that nobody has started to evaluate are removed.
             if timer() - time_last_save > save_every_s:
                 for i, weights_path in agent_checkpoint_paths.items():
                     agents[i].save_weights(weights_path, overwrite=True)
-                    shutil.copyfile(weights_path, f"{os.path.splitext(weights_path)[0]}.for_eval.h5")
+                    if i in eval_shared_weights:
+                        eval_shared_weights[i].publish(NumpyMLP.from_keras(agents[i].q_network))
+                    else:
+                        eval_path = "{}.for_eval.{}-ep{}.h5".format(os.path.splitext(weights_path)[0], time.strftime("%Y%m%d-%H%M%S"), i_episode)
+                        shutil.copyfile(weights_path, eval_path)
+                        for superseded_path in eval_queue.submit(i, eval_path):
+                            os.remove(superseded_path)
                 time_last_save = timer()
 
-        winners = controller.run_game()
-        won = winners[0]
-        won_deque.append(won)
-        if won:
-            n_won += 1
-
+        for won in run_episodes():
+            won_deque.append(won)
+            if won:
+                n_won += 1
+            i_episode += 1
+
+    if actor_learner is not None:
+        actor_learner.close()
+    if eval_queue is not None:
+        eval_queue.close()
+    for shared_weights in eval_shared_weights.values():
+        # We own the segments. The evaluators have their own copy of the weights, they can finish their evaluation.
+        shared_weights.close()
+        shared_weights.unlink()
     logger.info("Finished playing.")
     logger.info("Final win rate: {:.1%}".format(win_rate))
 
@@ -14,6 +14,9 @@ class Event:
         self.subscribers.remove(subscriber_fn)
 
     def notify(self):
+        # Shortcut for headless simulation, where nobody is listening.
+        if not self.subscribers:
+            return
         for subscriber_fn in self.subscribers:
             subscriber_fn()
 
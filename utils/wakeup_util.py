@@ -0,0 +1,97 @@
+"""
+Wakeup signals between unrelated processes on the same machine, so that a process can sleep until something has happened
+(e.g. new weights were published, or a checkpoint was submitted for evaluation), instead of checking for it in a loop.
+
+Processes that want to be woken up create a WakeupListener for one or more channels (any names), and wait() on it.
+wake_up() wakes all current listeners of a channel.
+
+Every listener binds a Unix datagram socket in a directory of the channel (in the temp dir). A wakeup is a single byte sent
+to each of these sockets - if nobody is listening, it costs one failed directory listing. Wakeups are buffered by the socket,
+so there is no race between checking for something and starting to wait: create the listener first, then check, then wait().
+"""
+
+import os
+import secrets
+import select
+import socket
+import tempfile
+from typing import Optional
+
+
+def _channel_dir(channel: str) -> str:
+    return os.path.join(tempfile.gettempdir(), channel)
+
+
+class WakeupListener:
+    """
+    Receives the wakeups of one or more channels (see module docstring). Call close() when done.
+    """
+
+    def __init__(self, *channels: str):
+        self._sockets = []
+        self._paths = []
+        try:
+            for channel in channels:
+                os.makedirs(_channel_dir(channel), exist_ok=True)
+                self._paths.append(os.path.join(_channel_dir(channel), f"{os.getpid()}-{secrets.token_hex(4)}.sock"))
+                self._sockets.append(socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM))
+                self._sockets[-1].bind(self._paths[-1])
+                self._sockets[-1].setblocking(False)
+        except BaseException:
+            self.close()
+            raise
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until any of the channels receives a wakeup (or one was received since the last call).
+        :param timeout: Optional - max number of seconds to wait. Default: wait forever.
+        :return: True if there was a wakeup, False if the timeout has expired.
+        """
+        readable, _, _ = select.select(self._sockets, [], [], timeout)
+        if not readable:
+            return False
+
+        # Multiple wakeups count as one.
+        for s in self._sockets:
+            try:
+                while True:
+                    s.recv(16)
+            except BlockingIOError:
+                pass
+        return True
+
+    def close(self):
+        for s in self._sockets:
+            s.close()
+        for path in self._paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._sockets = []
+        self._paths = []
+
+
+def wake_up(channel: str):
+    """
+    Wakes all processes that are waiting on the channel (see WakeupListener). Does not block.
+    """
+    try:
+        socket_names = os.listdir(_channel_dir(channel))
+    except FileNotFoundError:
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+        sender.setblocking(False)
+        for socket_name in socket_names:
+            path = os.path.join(_channel_dir(channel), socket_name)
+            try:
+                sender.sendto(b"\0", path)
+            except BlockingIOError:
+                pass                            # The listener has not even picked up the previous wakeups.
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The listener has died without closing its socket.
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass